@@ -89,6 +89,13 @@ class Beremiz4uCIdeLauncher(BeremizIDELauncher):
         #     )
         # )
 
+    def ShowUI(self):
+        # projects are opened with the b4uc ProjectController: trace capture, cycle monitor and profile
+        import BeremizIDE
+        from ProjectController_b4uc import B4ucProjectController
+        BeremizIDE.ProjectController = B4ucProjectController
+        BeremizIDELauncher.ShowUI(self)
+
 # start Beremiz IDE
 if __name__ == "__main__":
     beremiz = Beremiz4uCIdeLauncher()
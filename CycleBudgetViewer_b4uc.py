@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# This file is part of Beremiz, a Integrated Development Environment for
+# programming IEC 61131-3 automates supporting plcopen standard and CanFestival.
+#
+# Copyright (C) 2007: Edouard TISSERANT and Laurent BESSARD
+#
+# See COPYING file for copyrights details.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import wx
+
+from controls.CustomStyledTextCtrl import faces
+
+# -------------------------------------------------------------------------------
+#                               Cycle Budget Viewer
+# -------------------------------------------------------------------------------
+
+
+class CycleBudgetViewer(wx.MiniFrame):
+    """
+    Class that implements the tool window showing the cycle monitor and the cycle
+    budget of the running PLC, refreshed by the b4uc ProjectController
+    """
+
+    def __init__(self, parent):
+        """
+        Constructor
+        @param parent: Parent window
+        """
+        wx.MiniFrame.__init__(self, parent, title=_("Cycle budget"), size=wx.Size(640, 320),
+                              style=wx.DEFAULT_FRAME_STYLE | wx.FRAME_FLOAT_ON_PARENT)
+
+        self.Closed = False
+
+        self.Text = wx.TextCtrl(self, style=wx.TE_MULTILINE | wx.TE_READONLY | wx.TE_DONTWRAP)
+        self.Text.SetFont(wx.Font(faces["size"], wx.FONTFAMILY_MODERN, wx.FONTSTYLE_NORMAL,
+                                  wx.FONTWEIGHT_NORMAL, faceName=faces["mono"]))
+
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def OnClose(self, event):
+        # closed by the user: no refresh until the PLC is started again
+        self.Closed = True
+        self.Hide()
+
+    def Reopen(self):
+        self.Closed = False
+
+    def SetLines(self, lines):
+        """
+        Show lines of the cycle statistics
+        @param lines: Lines of FormatCycleMonitor and FormatCycleBudget
+        """
+        text = "\n".join(lines)
+        if self.Text.GetValue() != text:
+            self.Text.ChangeValue(text)
+        if not self.IsShown():
+            self.Show()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ProjectController of the Beremiz 4 uC IDE, used by Beremiz_4uC_IDE.py for the projects it
+# opens. It adds the debugger features of the b4uc_connector wrappers, other connectors are
+# left alone:
+#   Run     arms a trace capture of the variables in the debugger with the trigger of the
+#           TraceCapture options (see TraceCapture.py) and clears the cycle monitor and
+#           profile (see CycleMonitor.py and CycleProfile.py)
+#   running the PLC status refresh polls the capture, which is downloaded to
+#           trace_capture.csv in the build folder once it is done after the trigger, and
+#           refreshes the cycle monitor and the cycle budget of a module built with the
+#           CycleProfile option in the Cycle budget window (see CycleBudgetViewer_b4uc.py)
+#   Stop    downloads an unfinished capture and logs the cycle monitor and the cycle budget
+#           as a final summary
+
+import csv
+import os
+import time
+
+from ProjectController import ProjectController
+from runtime import PlcStatus
+
+from CycleBudgetViewer_b4uc import CycleBudgetViewer
+
+from b4uc_connector.BatchedTrace import BatchedTraceConnector
+from b4uc_connector.ChunkedTransfer import CONNECTOR_ERRORS
+from b4uc_connector.CycleProfile import LoadCycleProfileNames, GetCycleBudget, FormatCycleBudget
+from b4uc_connector.CycleMonitor import FormatCycleMonitor
+from b4uc_connector.TraceCapture import PackTraceCaptureLevel, TRIGGER_MODES, TRIGGER_IMMEDIATE, \
+    CAPTURE_TRIGGERED, CAPTURE_DONE
+
+CAPTURE_FILE = "trace_capture.csv"
+POLL_PERIOD = 1.0  # seconds between two polls of the runtime while the PLC runs
+
+
+class B4ucProjectController(ProjectController):
+    """ProjectController with the trace capture and cycle statistics of the b4uc debugger."""
+
+    def __init__(self, *args, **kwargs):
+        ProjectController.__init__(self, *args, **kwargs)
+        self._b4uc_poll = 0.0  # time of the last poll
+        self._capture_paths = None  # IEC paths of the armed trace capture, None if none is armed
+        self._capture_triggered = False
+        self._cycle_names = None  # section names of the cycle profile of the running module
+        self._cycle_viewer = None
+
+    def _B4ucConnector(self):
+        connector = self._connector
+        return connector if isinstance(connector, BatchedTraceConnector) else None
+
+    def _GetToolchainOption(self, name, default):
+        """Get an option of the b4arm toolchain configuration (see toolchain_b4arm)."""
+        try:
+            value = getattr(self.GetTarget().getcontent(), f"get{name}")()
+        except AttributeError:
+            return default
+        return default if value is None else value
+
+    def _PLCStarted(self):
+        status = self._connector.GetPLCstatus() if self._connector is not None else None
+        return status is not None and status[0] == PlcStatus.Started
+
+    def _GetTraceTrigger(self):
+        """Get the trigger of the TraceCapture options for SetupTraceCapture: (position in the
+        trace list, mode, packed level), None if the trigger variable is not debugged.
+        Raises ValueError if the level is not a value of its type."""
+        path = self._GetToolchainOption("TraceTrigger", "").strip().upper()
+        if not path:
+            return None, TRIGGER_IMMEDIATE, b""
+        paths = [p.upper() for p in self.TracedIECPath]
+        if path not in paths:
+            return None
+        trigger = paths.index(path)
+        mode = TRIGGER_MODES.get(self._GetToolchainOption("TraceTriggerMode", "Rising"))
+        return trigger, mode, PackTraceCaptureLevel(self.TracedIECTypes[trigger],
+                                                    self._GetToolchainOption("TraceTriggerLevel", "0"))
+
+    def ArmTraceCapture(self):
+        """Arm the trace capture of the debugged variables if the TraceCapture option is set."""
+        self._capture_paths = None
+        connector = self._B4ucConnector()
+        if connector is None or not self._GetToolchainOption("TraceCapture", False):
+            return
+        try:
+            trigger = self._GetTraceTrigger()
+        except ValueError as e:
+            self.logger.write_warning(_("Trace capture not armed, trigger level: {}\n").format(e))
+            return
+        if trigger is None:
+            self.logger.write_warning(_("Trace capture not armed, the trigger {} is not debugged\n").format(
+                self._GetToolchainOption("TraceTrigger", "")))
+            return
+        trigger, mode, level = trigger
+        try:
+            capacity = connector.SetupTraceCapture(trigger, mode, level, self._GetToolchainOption("TracePreTrigger", 0))
+            if capacity is None or not connector.ArmTraceCapture():
+                self.logger.write_warning(_("Trace capture not armed, the runtime can not capture the debugged variables\n"))
+                return
+        except CONNECTOR_ERRORS as e:
+            self.logger.write_warning(_("Trace capture not armed: {}\n").format(e))
+            return
+        self._capture_paths = list(self.TracedIECPath)
+        self._capture_triggered = False
+        self.logger.write(_("Trace capture of {} debugged variables armed, {} cycles\n").format(
+            len(self._capture_paths), capacity))
+
+    def PollTraceCapture(self):
+        """Download the armed trace capture once it is done after the trigger."""
+        if self._capture_paths is None:
+            return
+        try:
+            status = self._B4ucConnector().GetTraceCaptureStatus()
+        except CONNECTOR_ERRORS as e:
+            self.logger.write_warning(_("Trace capture status not read: {}\n").format(e))
+            self._capture_paths = None
+            return
+        if status is None:
+            return
+        if status["state"] == CAPTURE_TRIGGERED and not self._capture_triggered:
+            self._capture_triggered = True
+            self.logger.write(_("Trace capture triggered\n"))
+        elif status["state"] == CAPTURE_DONE:
+            self.SaveTraceCapture()
+
+    def SaveTraceCapture(self, stop=False):
+        """Download the trace capture to CAPTURE_FILE in the build folder, stop decides
+        whether a capture still recording is stopped first."""
+        if self._capture_paths is None:
+            return
+        connector = self._B4ucConnector()
+        names, self._capture_paths = self._capture_paths, None
+        try:
+            if stop:
+                status = connector.GetTraceCaptureStatus()
+                if status is None or not status["samples"]:
+                    return
+                connector.StopTraceCapture()
+            capture = connector.DownloadTraceCapture()
+        except (ValueError, *CONNECTOR_ERRORS) as e:
+            self.logger.write_warning(_("Trace capture not downloaded: {}\n").format(e))
+            return
+        if capture is None:
+            return
+        names += [f"v{n}" for n in range(len(names), len(capture.dtype.names) - 1)]
+        filepath = os.path.join(self._getBuildPath(), CAPTURE_FILE)
+        with open(filepath, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["tick"] + names)
+            columns = [capture.ticks] + [capture.GetValues(n) for n in range(len(capture.dtype.names) - 1)]
+            for row in zip(*columns):
+                # TIME, DATE, TOD and DT are (tv_sec, tv_nsec)
+                writer.writerow([v[0] + v[1] / 1e9 if isinstance(v, tuple) else v for v in (r.item() for r in row)])
+        self.logger.write(_("Trace capture of {} cycles written to {}\n").format(len(capture), filepath))
+
+    def ResetCycleStatistics(self):
+        connector = self._B4ucConnector()
+        if connector is not None:
+            connector.ResetCycleMonitor()
+            connector.ResetCycleProfile()
+        self._cycle_names = LoadCycleProfileNames(self.GetBuilder().GetBinaryPath())
+        if self._cycle_viewer is not None:
+            self._cycle_viewer.Reopen()
+
+    def _GetCycleStatistics(self):
+        """Get the lines of the cycle monitor and of the cycle budget, empty if the runtime
+        has none."""
+        connector = self._B4ucConnector()
+        monitor = connector.GetCycleMonitor()
+        profile = connector.GetCycleProfile()
+        return (FormatCycleMonitor(monitor) if monitor is not None else [],
+                FormatCycleBudget(GetCycleBudget(profile, self._cycle_names)) if profile is not None else [])
+
+    def RefreshCycleStatistics(self, monitor_lines, budget_lines):
+        """Show the cycle statistics in the Cycle budget window, opened with the first
+        cycle budget."""
+        if self._cycle_viewer is None:
+            if not budget_lines or self.AppFrame is None:
+                return
+            self._cycle_viewer = CycleBudgetViewer(self.AppFrame)
+        if not self._cycle_viewer.Closed:
+            self._cycle_viewer.SetLines(monitor_lines + [""] + budget_lines)
+
+    def PollCycleStatistics(self):
+        if self._cycle_viewer is not None and self._cycle_viewer.Closed:
+            return
+        try:
+            self.RefreshCycleStatistics(*self._GetCycleStatistics())
+        except CONNECTOR_ERRORS as e:
+            self.logger.write_warning(_("Cycle statistics not read: {}\n").format(e))
+
+    def LogCycleStatistics(self):
+        """Log the cycle statistics, the final summary of a run."""
+        monitor_lines, budget_lines = self._GetCycleStatistics()
+        if monitor_lines:
+            self.logger.write(_("Cycle monitor:\n"))
+            for line in monitor_lines:
+                self.logger.write(line + "\n")
+        if budget_lines:
+            self.logger.write(_("Cycle budget:\n"))
+            for line in budget_lines:
+                self.logger.write(line + "\n")
+        self.RefreshCycleStatistics(monitor_lines, budget_lines)
+
+    def _Run(self):
+        ProjectController._Run(self)
+        # a PLC which failed to start is only logged by _Run
+        if self._B4ucConnector() is None or not self._PLCStarted():
+            return
+        self.ResetCycleStatistics()
+        self.ArmTraceCapture()
+
+    def _Stop(self):
+        if self._B4ucConnector() is not None:
+            self.LogCycleStatistics()
+            self.SaveTraceCapture(stop=True)
+        ProjectController._Stop(self)
+
+    def UpdateMethodsFromPLCStatus(self):
+        updated = ProjectController.UpdateMethodsFromPLCStatus(self)
+        if self.previous_plcstate == PlcStatus.Started and self._B4ucConnector() is not None \
+                and time.time() - self._b4uc_poll >= POLL_PERIOD:
+            self._b4uc_poll = time.time()
+            self.PollTraceCapture()
+            self.PollCycleStatistics()
+        return updated
+
+    _Run.__doc__ = ProjectController._Run.__doc__
+    _Stop.__doc__ = ProjectController._Stop.__doc__
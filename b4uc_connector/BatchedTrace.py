@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Batched trace buffers of the b4uc debugger (GetDebugVariables / GetDebugData in
+# b4uc_targets/<target>/<target>_debug.c). A batched buffer carries the whole watch list
+# of one cycle, the force flags of all variables included:
+#   header   magic (u16), version (u8), reserved (u8), count (u16), size (u16), little endian
+#   flags    one force bit per variable in buffer order, LSB first
+#   values   packed like the Beremiz trace buffer
+# Delta records (GetDebugDelta) have the same header and only carry the changed variables,
+# each entry is: position in the trace list (u16), flags (u8), value.
+# The IDE only understands plain Beremiz trace buffers, so the connector strips header and
+# flags and rebuilds full buffers from the deltas. Buffers of runtimes without the batched
+# API are passed through unchanged.
+# With the first trace list of a connection the connector probes the batched calls of the
+# runtime (all integers little endian):
+#   ExtendedCall("RegisterDebugVariables", idx u32 * count) -> i32, negative on error
+#   ExtendedCall("GetDebugData", b"") -> tick u32, batched trace buffer of the registered
+#       variables, empty while the PLC is not running
+# If the runtime answers, the trace list is registered with it and the whole watch list is
+# read with one GetDebugData per poll. The per-variable GetTraceVariables of the runtime is
+# used when the probe failed, while the PLC is not running (it tells the PLC status) and for
+# trace lists not in index order (GetDebugData packs the variables in index order).
+# The connector also captures the variables of the trace list with the trace capture of
+# the runtime (see TraceCapture.py) and reads the cycle profile and the cycle monitor (see
+# CycleProfile.py and CycleMonitor.py).
+
+import ctypes
+import struct
+from runtime import PlcStatus
+from runtime.typemapping import TypeTranslator
+from .ChunkedTransfer import CONNECTOR_ERRORS
+from .TraceCapture import GetCaptureDtype, PackTraceCaptureSetup, PackTraceCaptureRead, \
+    UnpackTraceCaptureResult, UnpackTraceCaptureStatus, DownloadTraceCapture, TRIGGER_IMMEDIATE
+from . import CycleProfile, CycleMonitor
+
+BATCH_MAGIC = 0xDB7A
+DELTA_MAGIC = 0xDB7D
+BATCH_VERSION = 1
+_header = struct.Struct("<HBBHH")
+_delta_entry = struct.Struct("<HB")
+_tick = struct.Struct("<I")
+_result = struct.Struct("<i")
+_force_flag = 0x02  # __IEC_FORCE_FLAG
+
+
+def UnpackBatchedTraceBuffer(buff, count):
+    """Split a batched trace buffer into the Beremiz trace buffer and the force flags.
+    Returns None if buff is not a batched buffer of count variables."""
+    if len(buff) < _header.size:
+        return None
+    magic, version, _reserved, buff_count, size = _header.unpack_from(buff)
+    flags_size = (count + 7) // 8
+    if magic != BATCH_MAGIC or version != BATCH_VERSION or buff_count != count \
+            or size != len(buff) or size < _header.size + flags_size:
+        return None
+    flags = buff[_header.size:_header.size + flags_size]
+    forced = [bool(flags[n // 8] & (1 << (n % 8))) for n in range(count)]
+    return bytes(buff[_header.size + flags_size:]), forced
+
+
+def _ValueSize(iectype, buff, offset):
+    if iectype == "STRING":
+        return buff[offset] + 1 if offset < len(buff) else None
+    c_type = TypeTranslator.get(iectype, (None,))[0]
+    return ctypes.sizeof(c_type) if c_type is not None else None
+
+
+def UnpackDeltaRecord(buff, iectypes, values, forced):
+    """Apply a delta record to the last values and force flags of the trace list (updated in place).
+    Returns False if buff is not a valid delta record for these types."""
+    if len(buff) < _header.size:
+        return False
+    magic, version, _reserved, count, size = _header.unpack_from(buff)
+    if magic != DELTA_MAGIC or version != BATCH_VERSION or size != len(buff):
+        return False
+    offset = _header.size
+    updates = []
+    for _ in range(count):
+        if offset + _delta_entry.size > size:
+            return False
+        n, flags = _delta_entry.unpack_from(buff, offset)
+        offset += _delta_entry.size
+        if n >= len(iectypes) or iectypes[n] is None:
+            return False
+        value_size = _ValueSize(iectypes[n], buff, offset)
+        if value_size is None or offset + value_size > size:
+            return False
+        updates.append((n, bytes(buff[offset:offset + value_size]), bool(flags & _force_flag)))
+        offset += value_size
+    if offset != size:
+        return False
+    for n, value, force in updates:
+        values[n] = value
+        forced[n] = force
+    return True
+
+
+class BatchedTraceConnector(object):
+    """Connector wrapper decoding batched trace buffers and delta records, capturing the
+    trace list and reading the cycle statistics, all other calls go to the wrapped connector."""
+
+    def __init__(self, connector):
+        self._connector = connector
+        self._trace_count = None
+        self._trace_idxs = []
+        self._trace_types = []
+        self._capture_types = None
+        self._delta_values = []
+        self._batched_call = None  # None until probed, then whether the runtime has GetDebugData
+        self._batched_list = False  # trace list registered with RegisterDebugVariables
+        self.BatchedTrace = False  # True once the runtime answered with a batched buffer or delta record
+        self.ForcedFlags = []  # force flags of the last trace, in trace list order
+
+    def __getattr__(self, name):
+        return getattr(self._connector, name)
+
+    def SetTraceVariablesList(self, idxs):
+        # trace list entries are (idx, iectype, force value)
+        self._trace_count = len(idxs)
+        self._trace_idxs = [i[0] if isinstance(i, (tuple, list)) else i for i in idxs]
+        self._trace_types = [i[1] if isinstance(i, (tuple, list)) and len(i) > 1 else None for i in idxs]
+        self._delta_values = [None] * self._trace_count
+        self.ForcedFlags = [False] * self._trace_count
+        # the runtime still gets the list for the forced values
+        token = self._connector.SetTraceVariablesList(idxs)
+        self._batched_list = self._RegisterDebugVariables()
+        return token
+
+    def _RegisterDebugVariables(self):
+        """Register the trace list for GetDebugData, the first call probes the runtime.
+        Returns False if the trace list has to be read with GetTraceVariables."""
+        idxs = self._trace_idxs
+        if self._batched_call is False or not idxs or any(a >= b for a, b in zip(idxs, idxs[1:])):
+            return False
+        try:
+            answer = self._connector.ExtendedCall("RegisterDebugVariables", struct.pack(f"<{len(idxs)}I", *idxs))
+        except CONNECTOR_ERRORS:
+            answer = None
+        if not isinstance(answer, (bytes, bytearray)) or len(answer) < _result.size:
+            self._batched_call = False
+            return False
+        self._batched_call = True
+        return _result.unpack_from(answer)[0] >= 0
+
+    def _GetDebugData(self):
+        """Read the registered trace list with GetDebugData, None if the PLC is not running
+        or the runtime did not answer with a batched buffer of the list."""
+        try:
+            answer = self._connector.ExtendedCall("GetDebugData", b"")
+        except CONNECTOR_ERRORS:
+            return None
+        if not answer:
+            return None
+        batch = UnpackBatchedTraceBuffer(answer[_tick.size:], self._trace_count) if len(answer) > _tick.size else None
+        if batch is None:
+            self._batched_call = self._batched_list = False
+            return None
+        buff, self.ForcedFlags = batch
+        self.BatchedTrace = True
+        return PlcStatus.Started, [(_tick.unpack_from(answer)[0], buff)]
+
+    def _UnpackTrace(self, buff):
+        batch = UnpackBatchedTraceBuffer(buff, self._trace_count)
+        if batch is not None:
+            buff, self.ForcedFlags = batch
+            return buff
+        if UnpackDeltaRecord(buff, self._trace_types, self._delta_values, self.ForcedFlags):
+            # values not received yet make the trace incomplete
+            if None in self._delta_values:
+                return b""
+            return b"".join(self._delta_values)
+        return None
+
+    def GetTraceVariables(self, *args):
+        if self._batched_list:
+            res = self._GetDebugData()
+            if res is not None:
+                return res
+        res = self._connector.GetTraceVariables(*args)
+        if self._trace_count is None or res is None:
+            return res
+        plc_status, traces = res
+        if not traces:
+            return res
+        unpacked = []
+        for tick, buff in traces:
+            buff = self._UnpackTrace(buff)
+            if buff is None:
+                return res
+            if buff:
+                unpacked.append((tick, buff))
+        self.BatchedTrace = True
+        return plc_status, unpacked
+
+    def SetupTraceCapture(self, trigger=None, trigger_mode=TRIGGER_IMMEDIATE, trigger_level=b"", pre_trigger=0):
+        """Capture the variables of the trace list, trigger is the position of the trigger
+        variable in the trace list and trigger_level its packed value. Returns the capacity in
+        samples, None if the runtime can not capture these variables."""
+        if not self._trace_idxs:
+            return None
+        try:
+            GetCaptureDtype(self._trace_types)
+        except ValueError:
+            return None
+        trigger_idx = self._trace_idxs[trigger] if trigger is not None else 0
+        capacity = UnpackTraceCaptureResult(self._connector.ExtendedCall("SetupTraceCapture", PackTraceCaptureSetup(
+            self._trace_idxs, trigger_idx, trigger_mode, trigger_level, pre_trigger)))
+        if capacity is None or capacity < 0:
+            self._capture_types = None
+            return None
+        self._capture_types = list(self._trace_types)
+        return capacity
+
+    def ArmTraceCapture(self):
+        """Start the capture set up by SetupTraceCapture, False if the runtime refused."""
+        if self._capture_types is None:
+            return False
+        result = UnpackTraceCaptureResult(self._connector.ExtendedCall("ArmTraceCapture", b""))
+        return result is not None and result >= 0
+
+    def StopTraceCapture(self):
+        self._connector.ExtendedCall("StopTraceCapture", b"")
+
+    def GetTraceCaptureStatus(self):
+        """Status of the capture (see UnpackTraceCaptureStatus), None if the runtime has none."""
+        return UnpackTraceCaptureStatus(self._connector.ExtendedCall("GetTraceCaptureStatus", b""))
+
+    def DownloadTraceCapture(self):
+        """Samples of the finished capture as a TraceCapture, None if there is none."""
+        status = self.GetTraceCaptureStatus()
+        if self._capture_types is None or status is None:
+            return None
+        return DownloadTraceCapture(
+            lambda offset, size: self._connector.ExtendedCall("ReadTraceCapture", PackTraceCaptureRead(offset, size)),
+            self._capture_types, status)
+
+    def GetCycleProfile(self):
+        """Cycle profile of the running module (see UnpackCycleProfile), None if it has none."""
+        return CycleProfile.ReadCycleProfile(self._connector)
+
+    def ResetCycleProfile(self):
+        return CycleProfile.ResetCycleProfile(self._connector)
+
+    def GetCycleMonitor(self):
+        """Cycle monitor of the running module (see UnpackCycleMonitor), None if it has none."""
+        return CycleMonitor.ReadCycleMonitor(self._connector)
+
+    def ResetCycleMonitor(self):
+        return CycleMonitor.ResetCycleMonitor(self._connector)
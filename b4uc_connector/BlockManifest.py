@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Block manifest of a PLC module: the MD5 of every fixed-size block of the .bin. The
+# toolchain writes it next to the binary (<module>.bin.manifest); the connector compares
+# it with the manifest of the module on the target and uploads the changed blocks only,
+# together with a recipe to rebuild the new module from the old blocks.
+# Manifest of the runtime (all integers little endian):
+#   ExtendedCall("GetBlockManifest", b"") -> block_size u32, size u32, md5 of each block (16 bytes)
+
+import json
+import struct
+import hashlib
+
+BLOCK_SIZE = 0x400
+MANIFEST_SUFFIX = ".manifest"
+RECIPE_NEW_BLOCK = 0xFFFFFFFF  # recipe entry of a block which is uploaded
+
+_target_manifest = struct.Struct("<II")
+
+
+def GetBlockHashes(data, block_size=BLOCK_SIZE):
+    return [hashlib.md5(data[i:i + block_size]).digest() for i in range(0, len(data), block_size)]
+
+
+def WriteBlockManifest(filepath, block_size=BLOCK_SIZE):
+    """Write the manifest of a module next to it, returns the manifest file name."""
+    with open(filepath, "rb") as f:
+        data = f.read()
+    manifest = {
+        "block_size": block_size,
+        "size": len(data),
+        "md5": hashlib.md5(data).hexdigest(),
+        "blocks": [h.hex() for h in GetBlockHashes(data, block_size)],
+    }
+    manifest_path = filepath + MANIFEST_SUFFIX
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest_path
+
+
+def LoadBlockManifest(filepath, data, block_size):
+    """Block hashes of a module, from its manifest if it matches data and block_size."""
+    try:
+        with open(filepath + MANIFEST_SUFFIX, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["block_size"] == block_size and manifest["size"] == len(data) \
+                and manifest["md5"] == hashlib.md5(data).hexdigest():
+            return [bytes.fromhex(h) for h in manifest["blocks"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return GetBlockHashes(data, block_size)
+
+
+def UnpackTargetManifest(answer):
+    """Decode the answer of GetBlockManifest, returns (block_size, size, hashes) or None."""
+    if not isinstance(answer, (bytes, bytearray)) or len(answer) < _target_manifest.size:
+        return None
+    block_size, size = _target_manifest.unpack_from(answer)
+    count = (size + block_size - 1) // block_size if block_size else -1
+    if count < 0 or len(answer) != _target_manifest.size + 16 * count:
+        return None
+    hashes = [bytes(answer[_target_manifest.size + 16 * i:_target_manifest.size + 16 * (i + 1)]) for i in range(count)]
+    return block_size, size, hashes
+
+
+def GetDeltaRecipe(new_hashes, old_hashes):
+    """Recipe of the new module: for each block the index of an equal old block or
+    RECIPE_NEW_BLOCK, and the indexes of the blocks to upload."""
+    old_blocks = {}
+    for i, h in enumerate(old_hashes):
+        old_blocks.setdefault(h, i)
+    recipe = [old_blocks.get(h, RECIPE_NEW_BLOCK) for h in new_hashes]
+    return recipe, [i for i, src in enumerate(recipe) if src == RECIPE_NEW_BLOCK]
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Adaptive chunk size for file transfers (ConnectorBase.BlobFromFile) to the PLC.
+# Before the first transfer the connector asks the runtime for the largest chunk it can receive:
+#   ExtendedCall("GetMaxChunkSize", b"") -> u32, little endian
+# Runtimes without this call get FALLBACK_CHUNK_SIZE, the former fixed chunk size.
+# During a transfer the chunk size starts small, doubles while the round-trip time stays
+# below TARGET_RTT and halves when it gets slow. A failed chunk also lowers the maximum
+# below its size and the transfer is restarted.
+#
+# Runtimes implementing the windowed upload get the file in windows of chunks instead, so
+# one round-trip carries up to `window` chunks and the upload time depends on the link
+# bandwidth rather than on its latency. ERPC calls are synchronous, so the chunks in flight
+# travel in one request. Receive contract of the runtime (all integers little endian):
+#   ExtendedCall("BeginUpload", total_size u32, chunk_size u16, window u16, seed)
+#       -> chunk_size u16, window u16 accepted by the runtime (at most the requested ones),
+#          window 0 or no answer: windowed upload not supported.
+#       Discards a previous unfinished upload.
+#   ExtendedCall("UploadChunks", frames)
+#       frame: seq u32, length u16, crc32 u32 (zlib/IEEE of the data), data
+#       The runtime stores every frame whose CRC matches at offset seq * chunk_size,
+#       drops corrupted frames and frames outside [next, next + window), and answers
+#       -> next u32 (all chunks below are received), ack bitmap of ceil(window / 8) bytes,
+#          bit i (LSB first) set if chunk next + 1 + i is received.
+#       Only the missing chunks are sent again.
+#   ExtendedCall("EndUpload", b"")
+#       -> blob ID of the received data (md5 of seed + data, as SeedBlob/AppendChunkToBlob),
+#          empty if chunks are missing.
+#
+# Delta upload (see BlockManifest.py): when the runtime sends the manifest of its current
+# module, only the changed blocks are uploaded, a full upload is the fallback. A runtime
+# which does not answer GetBlockManifest is not asked again.
+#   ExtendedCall("BeginDeltaUpload", total_size u32, block_size u32, window u16,
+#                recipe u32 per block of the new module, seed)
+#       recipe entry: index of the old block to copy, or 0xFFFFFFFF for an uploaded block
+#       -> window u16 accepted by the runtime, 0 or no answer: delta upload not possible.
+#       The uploaded blocks follow with UploadChunks, seq is the number of the uploaded
+#       block (not of the block in the module), then EndUpload as above. The runtime must
+#       keep the old module until the new one is complete.
+
+import os
+import struct
+import hashlib
+import time
+import zlib
+from .BlockManifest import UnpackTargetManifest, LoadBlockManifest, GetDeltaRecipe
+
+# Errors of the connector and its transport, other errors are not caught
+try:
+    from erpc.client import RequestError
+    from erpc.codec import CodecError
+    CONNECTOR_ERRORS = (OSError, EOFError, RequestError, CodecError)
+except ImportError:
+    CONNECTOR_ERRORS = (OSError, EOFError)
+
+FALLBACK_CHUNK_SIZE = 0x200
+MIN_CHUNK_SIZE = 0x80
+TARGET_RTT = 0.25  # seconds, keeps the IDE responsive and far from the transport timeouts
+MAX_RETRIES = 3
+DEFAULT_WINDOW = 8  # chunks per round-trip of the windowed upload
+
+_upload_begin = struct.Struct("<IHH")
+_upload_accept = struct.Struct("<HH")
+_upload_frame = struct.Struct("<IHI")
+_upload_ack = struct.Struct("<I")
+_delta_begin = struct.Struct("<IIH")
+_delta_accept = struct.Struct("<H")
+
+
+def NegotiateChunkSize(connector):
+    """Ask the runtime for its maximum chunk size, FALLBACK_CHUNK_SIZE if it does not tell."""
+    try:
+        answer = connector.ExtendedCall("GetMaxChunkSize", b"")
+    except CONNECTOR_ERRORS:
+        return FALLBACK_CHUNK_SIZE
+    if not isinstance(answer, (bytes, bytearray)) or len(answer) < 4:
+        return FALLBACK_CHUNK_SIZE
+    size = struct.unpack_from("<I", answer)[0]
+    return size if size >= MIN_CHUNK_SIZE else FALLBACK_CHUNK_SIZE
+
+
+class ChunkedTransferConnector(object):
+    """Connector wrapper with negotiated, adaptive chunk size, all other calls go to the wrapped connector."""
+
+    def __init__(self, connector, logger=None, window=DEFAULT_WINDOW):
+        self._connector = connector
+        self._logger = logger
+        self.max_chunk_size = None  # negotiated before the first transfer
+        self.chunk_size = None
+        self.window = window  # 0 disables the windowed upload
+        self.windowed_upload = None  # unknown until the first upload
+        self.delta_upload = None  # unknown until the target sent a manifest
+
+    def __getattr__(self, name):
+        return getattr(self._connector, name)
+
+    def _Negotiate(self):
+        if self.max_chunk_size is None:
+            self.max_chunk_size = NegotiateChunkSize(self._connector)
+            self.chunk_size = min(FALLBACK_CHUNK_SIZE, self.max_chunk_size)
+
+    def _Adapt(self, rtt):
+        if rtt > 2 * TARGET_RTT:
+            self.chunk_size = max(MIN_CHUNK_SIZE, self.chunk_size // 2)
+        elif rtt < TARGET_RTT:
+            self.chunk_size = min(self.max_chunk_size, self.chunk_size * 2)
+
+    def _Transfer(self, filepath, seed):
+        s = hashlib.new('md5')
+        s.update(seed.encode())
+        blobID = self._connector.SeedBlob(seed.encode())
+        with open(filepath, "rb") as f:
+            while blobID == s.digest():
+                chunk = f.read(self.chunk_size)
+                if len(chunk) == 0:
+                    return blobID
+                self._last_chunk_size = len(chunk)
+                start = time.monotonic()
+                blobID = self._connector.AppendChunkToBlob(chunk, blobID)
+                s.update(chunk)
+                self._Adapt(time.monotonic() - start)
+        return None
+
+    def _BeginUpload(self, data, seed):
+        try:
+            answer = self._connector.ExtendedCall("BeginUpload", _upload_begin.pack(
+                len(data), min(self.max_chunk_size, 0xFFFF), self.window) + seed.encode())
+        except CONNECTOR_ERRORS:
+            return None
+        if not isinstance(answer, (bytes, bytearray)) or len(answer) < _upload_accept.size:
+            return None
+        chunk_size, window = _upload_accept.unpack_from(answer)
+        if not chunk_size or not window or window > self.window:
+            return None
+        return chunk_size, window
+
+    def _SendChunks(self, chunks, window):
+        """Send chunks with UploadChunks, window chunks per request, until all are acknowledged."""
+        received = set()
+        next_seq = 0
+        progress = None
+        stalled = 0
+        while next_seq < len(chunks):
+            frames = []
+            for seq in range(next_seq, min(len(chunks), next_seq + window)):
+                if seq in received:
+                    continue
+                chunk = chunks[seq]
+                frames.append(_upload_frame.pack(seq, len(chunk), zlib.crc32(chunk)) + chunk)
+            answer = self._connector.ExtendedCall("UploadChunks", b"".join(frames))
+            if not isinstance(answer, (bytes, bytearray)) or len(answer) < _upload_ack.size:
+                return False
+            ack = _upload_ack.unpack_from(answer)[0]
+            bitmap = answer[_upload_ack.size:]
+            received.update(ack + 1 + i for i in range(len(bitmap) * 8) if bitmap[i // 8] & (1 << (i % 8)))
+            next_seq = max(next_seq, ack)
+            # no progress: the window is lost repeatedly, give up
+            stalled = stalled + 1 if progress == (next_seq, len(received)) else 0
+            if stalled > MAX_RETRIES:
+                return False
+            progress = (next_seq, len(received))
+        return True
+
+    def _EndUpload(self, data, seed):
+        s = hashlib.new('md5')
+        s.update(seed.encode())
+        s.update(data)
+        blobID = self._connector.ExtendedCall("EndUpload", b"")
+        return blobID if blobID == s.digest() else None
+
+    def _WindowedTransfer(self, filepath, seed):
+        """Upload with a window of chunks per request and selective retransmission,
+        returns the blob ID, None on failure and False if the runtime does not support it."""
+        with open(filepath, "rb") as f:
+            data = f.read()
+        accepted = self._BeginUpload(data, seed)
+        if accepted is None:
+            return False
+        chunk_size, window = accepted
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        if not self._SendChunks(chunks, window):
+            return None
+        return self._EndUpload(data, seed)
+
+    def _DeltaTransfer(self, filepath, seed):
+        """Upload the blocks which differ from the module on the target only, returns the
+        blob ID, None on failure and False if it is not possible for this module. Records
+        in delta_upload whether the runtime sends a manifest."""
+        try:
+            target = UnpackTargetManifest(self._connector.ExtendedCall("GetBlockManifest", b""))
+        except CONNECTOR_ERRORS:
+            target = None
+        self.delta_upload = target is not None
+        if target is None:
+            return False
+        block_size, _size, old_hashes = target
+        with open(filepath, "rb") as f:
+            data = f.read()
+        recipe, changed = GetDeltaRecipe(LoadBlockManifest(filepath, data, block_size), old_hashes)
+        if len(changed) == len(recipe):
+            return False
+        answer = self._connector.ExtendedCall("BeginDeltaUpload", _delta_begin.pack(
+            len(data), block_size, self.window) + struct.pack(f"<{len(recipe)}I", *recipe) + seed.encode())
+        if not isinstance(answer, (bytes, bytearray)) or len(answer) < _delta_accept.size:
+            return False
+        window = _delta_accept.unpack_from(answer)[0]
+        if not window or window > self.window:
+            return False
+        self._delta_blocks = (len(changed), len(recipe))
+        if not self._SendChunks([data[i * block_size:(i + 1) * block_size] for i in changed], window):
+            return None
+        return self._EndUpload(data, seed)
+
+    def BlobFromFile(self, filepath, seed):
+        self._Negotiate()
+        if self.window and self.delta_upload is not False:
+            start = time.monotonic()
+            try:
+                blobID = self._DeltaTransfer(filepath, seed)
+            except CONNECTOR_ERRORS:
+                blobID = None
+            if blobID:
+                changed, total = self._delta_blocks
+                self._LogThroughput(filepath, time.monotonic() - start,
+                                    f"delta upload, {changed} of {total} blocks changed")
+                return blobID
+        if self.window and self.windowed_upload is not False:
+            start = time.monotonic()
+            try:
+                blobID = self._WindowedTransfer(filepath, seed)
+            except CONNECTOR_ERRORS:
+                blobID = None
+            self.windowed_upload = blobID is not False
+            if blobID:
+                self._LogThroughput(filepath, time.monotonic() - start, f"window {self.window}")
+                return blobID
+        for _attempt in range(MAX_RETRIES):
+            start = time.monotonic()
+            self._last_chunk_size = 0
+            try:
+                blobID = self._Transfer(filepath, seed)
+            except CONNECTOR_ERRORS:
+                blobID = None
+            if blobID is not None:
+                self._LogThroughput(filepath, time.monotonic() - start,
+                                    f"chunk size {self.chunk_size} of max {self.max_chunk_size}")
+                return blobID
+            if self._last_chunk_size <= MIN_CHUNK_SIZE:
+                break
+            self.max_chunk_size = max(MIN_CHUNK_SIZE, self._last_chunk_size // 2)
+            self.chunk_size = min(self.chunk_size, self.max_chunk_size)
+        raise IOError("Data corrupted during transfer or connection lost")
+
+    def _LogThroughput(self, filepath, elapsed, mode):
+        if self._logger is None:
+            return
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            size = 0
+        rate = size / elapsed / 1024 if elapsed > 0 else 0
+        self._logger.write(f"Transferred {size} bytes in {elapsed:.2f}s ({rate:.1f} KB/s, {mode})\n")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Cycle monitor of the b4uc debugger (GetCycleMonitor / ResetCycleMonitor in
+# b4uc_targets/<target>/<target>_debug.c). __run measures every scan cycle with the cycle
+# counter of the target: overruns of common_ticktime__, last and worst execution time and
+# the start-time jitter. The monitor is a fixed-size structure, cheap to poll.
+# Monitor of the runtime (all integers little endian, times in CPU cycles):
+#   ExtendedCall("GetCycleMonitor", b"") -> magic u16, version u8, flags u8, cpu_hz u32,
+#       tick_ns u64, budget u32, cycles u32, overruns u32, cycle_warnings u32,
+#       jitter_warnings u32, last_exec u32, max_exec u32, last_jitter u32, max_jitter u32
+#   ExtendedCall("ResetCycleMonitor", b"")
+# Warnings count the cycles over the CycleWarnPercent and JitterWarnPercent limits of
+# the toolchain, the target logs the first of a row with rte_log_inf.
+
+import struct
+from .ChunkedTransfer import CONNECTOR_ERRORS
+
+MONITOR_MAGIC = 0xC7C2
+MONITOR_VERSION = 1
+
+_monitor = struct.Struct("<HBBIQ9I")
+_fields = ("budget", "cycles", "overruns", "cycle_warnings", "jitter_warnings",
+           "last_exec", "max_exec", "last_jitter", "max_jitter")
+_times = ("budget", "last_exec", "max_exec", "last_jitter", "max_jitter")
+
+
+def UnpackCycleMonitor(data):
+    """Decode the dbgmon_t returned by GetCycleMonitor, times in us. None if invalid."""
+    if not isinstance(data, (bytes, bytearray)) or len(data) != _monitor.size:
+        return None
+    magic, version, flags, cpu_hz, tick_ns, *values = _monitor.unpack(data)
+    if magic != MONITOR_MAGIC or version != MONITOR_VERSION or not cpu_hz:
+        return None
+    monitor = {"flags": flags, "cpu_hz": cpu_hz, "tick_us": tick_ns / 1000.0}
+    for name, value in zip(_fields, values):
+        monitor[name] = value * 1e6 / cpu_hz if name in _times else value
+    return monitor
+
+
+def ReadCycleMonitor(connector):
+    """Read the cycle monitor of the running module, None if the runtime has none."""
+    try:
+        answer = connector.ExtendedCall("GetCycleMonitor", b"")
+    except CONNECTOR_ERRORS:
+        return None
+    return UnpackCycleMonitor(answer)
+
+
+def ResetCycleMonitor(connector):
+    """Clear the statistics of the cycle monitor, False if the runtime has none."""
+    try:
+        connector.ExtendedCall("ResetCycleMonitor", b"")
+    except CONNECTOR_ERRORS:
+        return False
+    return True
+
+
+def FormatCycleMonitor(monitor):
+    """Lines of the cycle monitor for the log."""
+    load = 100.0 * monitor["max_exec"] / monitor["tick_us"] if monitor["tick_us"] else 0.0
+    return [
+        f"cycle time {monitor['tick_us']:.0f} us, {monitor['cycles']} cycles, {monitor['overruns']} overruns",
+        f"execution last {monitor['last_exec']:.1f} us, worst {monitor['max_exec']:.1f} us ({load:.1f}%)",
+        f"start jitter last {monitor['last_jitter']:.1f} us, worst {monitor['max_jitter']:.1f} us",
+        f"warnings: {monitor['cycle_warnings']} cycles, {monitor['jitter_warnings']} starts",
+    ]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Cycle profile of a PLC module built with the CycleProfile option (plc_profile.c from
+# b4uc_targets/<target>/<target>_profile.c). The target measures sections of the scan
+# cycle with its cycle counter: the whole cycle, the retrieve and publish phase of the
+# extensions and every program call. The toolchain writes the section names next to the
+# binary (<module>.bin.profile), the target only knows their index.
+# Profile of the runtime (all integers little endian):
+#   ExtendedCall("GetCycleProfile", b"") -> magic u16, version u8, bins u8, count u16,
+#       bin0 u8, reserved u8, cpu_hz u32, tick_ns u64, then for each section
+#       count u32, last u32, min u32, max u32, sum u64, histogram u16 * bins
+#   ExtendedCall("ResetCycleProfile", b"")
+# Bin n of the histogram counts the calls of less than 2^(bin0 + 1 + n) cycles, the last
+# bin all longer calls.
+
+import json
+import struct
+from .ChunkedTransfer import CONNECTOR_ERRORS
+
+PROFILE_MAGIC = 0xC7C1
+PROFILE_VERSION = 1
+PROFILE_SUFFIX = ".profile"
+SECTION_NAMES = ["cycle", "retrieve", "publish"]  # sections of plc_main, then the program calls
+
+_header = struct.Struct("<HBBHBBIQ")
+_section = struct.Struct("<IIIIQ")
+
+
+def UnpackCycleProfile(data):
+    """Decode the answer of GetCycleProfile, returns a dict or None."""
+    if not isinstance(data, (bytes, bytearray)) or len(data) < _header.size:
+        return None
+    magic, version, bins, count, bin0, _reserved, cpu_hz, tick_ns = _header.unpack_from(data)
+    section_size = _section.size + 2 * bins
+    if magic != PROFILE_MAGIC or version != PROFILE_VERSION or len(data) != _header.size + count * section_size:
+        return None
+    sections = []
+    for i in range(count):
+        offset = _header.size + i * section_size
+        calls, last, min_cycles, max_cycles, total = _section.unpack_from(data, offset)
+        histogram = list(struct.unpack_from(f"<{bins}H", data, offset + _section.size))
+        sections.append({"count": calls, "last": last, "min": min_cycles, "max": max_cycles,
+                         "avg": total / calls if calls else 0.0, "histogram": histogram})
+    return {"cpu_hz": cpu_hz, "tick_ns": tick_ns, "bin0": bin0, "sections": sections}
+
+
+def WriteCycleProfileNames(filepath, names):
+    """Write the section names of a module next to it, returns the file name."""
+    names_path = filepath + PROFILE_SUFFIX
+    with open(names_path, "w", encoding="utf-8") as f:
+        json.dump({"sections": names}, f, indent=1)
+    return names_path
+
+
+def LoadCycleProfileNames(filepath):
+    """Section names of a module, None if it was built without the cycle profile."""
+    try:
+        with open(filepath + PROFILE_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)["sections"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def ReadCycleProfile(connector):
+    """Read the cycle profile of the running module, None if it has none."""
+    try:
+        answer = connector.ExtendedCall("GetCycleProfile", b"")
+    except CONNECTOR_ERRORS:
+        return None
+    return UnpackCycleProfile(answer)
+
+
+def ResetCycleProfile(connector):
+    """Clear the cycle profile of the running module, False if the runtime has none."""
+    try:
+        connector.ExtendedCall("ResetCycleProfile", b"")
+    except CONNECTOR_ERRORS:
+        return False
+    return True
+
+
+def GetCycleBudget(profile, names):
+    """Rows of the cycle budget: (name, calls, avg us, max us, share of the cycle time in %
+    by the average), in the order of the sections."""
+    us = 1e6 / profile["cpu_hz"] if profile["cpu_hz"] else 0.0
+    tick_us = profile["tick_ns"] / 1000.0
+    rows = []
+    for i, section in enumerate(profile["sections"]):
+        name = names[i] if names and i < len(names) else f"section {i}"
+        avg_us, max_us = section["avg"] * us, section["max"] * us
+        rows.append((name, section["count"], avg_us, max_us, 100.0 * avg_us / tick_us if tick_us else 0.0))
+    return rows
+
+
+def FormatCycleBudget(rows):
+    """Lines of the cycle budget table."""
+    width = max([len(row[0]) for row in rows] + [len("section")])
+    lines = [f"{'section':{width}}  {'calls':>10}  {'avg us':>10}  {'max us':>10}  {'cycle %':>7}"]
+    for name, calls, avg_us, max_us, share in rows:
+        lines.append(f"{name:{width}}  {calls:10d}  {avg_us:10.2f}  {max_us:10.2f}  {share:7.1f}")
+    return lines
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Trace capture of the b4uc debugger (SetupTraceCapture / ReadTraceCapture in
+# b4uc_targets/<target>/<target>_debug.c). The target records one sample per cycle into a
+# RAM ring buffer; once the trigger fired, the IDE downloads the buffer in large chunks.
+# A sample is the tick (u32) followed by the values of the captured variables, little endian.
+# The samples are kept in a NumPy structured array over the downloaded buffer, so plotting
+# 100k samples does not create a Python object per value.
+# Calls of the runtime (all integers little endian, BatchedTraceConnector captures the
+# variables of the trace list with them):
+#   ExtendedCall("SetupTraceCapture", trigger_mode u8, count u8, pre_trigger u32,
+#       trigger_idx u32, idx u32 * count, trigger level (value of the trigger variable,
+#       empty for TRIGGER_IMMEDIATE)) -> capacity i32 in samples, negative on error
+#   ExtendedCall("ArmTraceCapture", b"") -> i32, negative on error
+#   ExtendedCall("StopTraceCapture", b"")
+#   ExtendedCall("GetTraceCaptureStatus", b"") -> dbgcap_status_t
+#   ExtendedCall("ReadTraceCapture", offset u32, size u32) -> samples, empty past the end
+
+import struct
+import numpy as np
+
+CAPTURE_IDLE, CAPTURE_ARMED, CAPTURE_TRIGGERED, CAPTURE_DONE = range(4)
+TRIGGER_IMMEDIATE, TRIGGER_RISING, TRIGGER_FALLING, TRIGGER_CHANGE = range(4)
+TRIGGER_MODES = {"Immediate": TRIGGER_IMMEDIATE, "Rising": TRIGGER_RISING,
+                 "Falling": TRIGGER_FALLING, "Change": TRIGGER_CHANGE}
+
+DEFAULT_CHUNK_SIZE = 0x1000
+_status = struct.Struct("<BBHII")
+_setup = struct.Struct("<BBII")
+_read = struct.Struct("<II")
+_result = struct.Struct("<i")
+
+_timespec = [("tv_sec", "<i4"), ("tv_nsec", "<i4")]
+_dtypes = {
+    "BOOL": "u1", "SINT": "i1", "INT": "<i2", "DINT": "<i4", "LINT": "<i8",
+    "USINT": "u1", "UINT": "<u2", "UDINT": "<u4", "ULINT": "<u8",
+    "BYTE": "u1", "WORD": "<u2", "DWORD": "<u4", "LWORD": "<u8",
+    "REAL": "<f4", "LREAL": "<f8",
+    "TIME": _timespec, "DATE": _timespec, "TOD": _timespec, "DT": _timespec,
+}
+
+
+def PackTraceCaptureSetup(idxs, trigger_idx=0, trigger_mode=TRIGGER_IMMEDIATE, trigger_level=b"", pre_trigger=0):
+    """Arguments of SetupTraceCapture."""
+    return _setup.pack(trigger_mode, len(idxs), pre_trigger, trigger_idx) + \
+        struct.pack(f"<{len(idxs)}I", *idxs) + bytes(trigger_level)
+
+
+def PackTraceCaptureLevel(iectype, level):
+    """Trigger level for a variable of type iectype from its text: a number, an IEC literal
+    like 16#FF or INT#-5, TRUE or FALSE. Raises ValueError if it is not a value of the type."""
+    if iectype not in _dtypes or isinstance(_dtypes[iectype], list):
+        raise ValueError(f"Type {iectype} can not be a trigger")
+    dtype = np.dtype(_dtypes[iectype])
+    text = level.strip().upper().replace("_", "")
+    if "#" in text and not text.split("#")[0].isdigit():
+        text = text.split("#", 1)[1]  # type prefix
+    if iectype == "BOOL":
+        values = {"TRUE": 1, "FALSE": 0, "1": 1, "0": 0, "": 0}
+        if text not in values:
+            raise ValueError(f"{level} is not a BOOL")
+        return bytes([values[text]])
+    try:
+        if dtype.kind == "f":
+            value = float(text or "0")
+        else:
+            base, _, digits = text.rpartition("#")
+            value = int(digits or "0", int(base) if base else 10)
+    except ValueError:
+        raise ValueError(f"{level} is not a value of {iectype}")
+    if dtype.kind != "f":
+        info = np.iinfo(dtype)
+        if not info.min <= value <= info.max:
+            raise ValueError(f"{level} is out of the range of {iectype}")
+    return np.array(value, dtype).tobytes()
+
+
+def PackTraceCaptureRead(offset, size):
+    """Arguments of ReadTraceCapture."""
+    return _read.pack(offset, size)
+
+
+def UnpackTraceCaptureResult(data):
+    """Decode the i32 returned by SetupTraceCapture and ArmTraceCapture, None if invalid."""
+    if not isinstance(data, (bytes, bytearray)) or len(data) < _result.size:
+        return None
+    return _result.unpack_from(data)[0]
+
+
+def UnpackTraceCaptureStatus(data):
+    """Decode the dbgcap_status_t returned by GetTraceCaptureStatus, None if invalid."""
+    if not isinstance(data, (bytes, bytearray)) or len(data) < _status.size:
+        return None
+    state, count, sample_size, samples, trigger_index = _status.unpack_from(data)
+    return {"state": state, "count": count, "sample_size": sample_size,
+            "samples": samples, "trigger_index": trigger_index}
+
+
+def GetCaptureDtype(iectypes):
+    """NumPy dtype of a sample of the captured variables, packed like on the target."""
+    fields = [("tick", "<u4")]
+    for n, iectype in enumerate(iectypes):
+        if iectype not in _dtypes:
+            raise ValueError(f"Type {iectype} can not be captured")
+        fields.append((f"v{n}", _dtypes[iectype]))
+    return np.dtype(fields)
+
+
+class TraceCapture(object):
+    """Samples of a trace capture, in a NumPy structured array (oldest sample first)."""
+
+    def __init__(self, iectypes, data, trigger_index=0):
+        self.dtype = GetCaptureDtype(iectypes)
+        self.samples = np.frombuffer(data, dtype=self.dtype)
+        self.trigger_index = trigger_index
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def ticks(self):
+        return self.samples["tick"]
+
+    def GetValues(self, n):
+        """Values of the n-th captured variable."""
+        return self.samples[f"v{n}"]
+
+
+def DownloadTraceCapture(read, iectypes, status, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Download a finished trace capture. read(offset, size) is the transport call of
+    ReadTraceCapture and returns bytes; status is the result of UnpackTraceCaptureStatus."""
+    dtype = GetCaptureDtype(iectypes)
+    if status["state"] != CAPTURE_DONE:
+        raise ValueError("Trace capture not finished")
+    if status["count"] != len(iectypes) or status["sample_size"] != dtype.itemsize:
+        raise ValueError("Trace capture does not match the captured variables")
+
+    total = status["samples"] * status["sample_size"]
+    data = bytearray(total)
+    offset = 0
+    while offset < total:
+        chunk = read(offset, min(chunk_size, total - offset))
+        if not chunk:
+            raise IOError(f"Trace capture download stopped at {offset} of {total} bytes")
+        data[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    return TraceCapture(iectypes, data, status["trigger_index"])
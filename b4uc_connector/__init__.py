@@ -2,17 +2,22 @@
 
 from os import listdir, path
 import importlib
-from connectors.ConnectorBase import ConnectorBase
+from .BatchedTrace import BatchedTraceConnector
+from .ChunkedTransfer import ChunkedTransferConnector
 _base_path = path.split(__file__)[0]
 
 # We are using the ERPC Connector from Beremiz. However, an adaptation was necessary
 # to accommodate the PLC's current data reception limitations.
 connectors_packages = ["ERPC"]
 
-# Reduced chunk size from 0xFFF (4K) to 0x200 (512B)
-ConnectorBase.chuncksize = 0x200
-
+# The connectors are wrapped to negotiate the chunk size with the PLC (0x200 (512B) if it
+# can not tell) and to decode batched trace buffers of the b4uc debugger
 def _GetLocalConnectorClassFactory(name):
-    return lambda: getattr(importlib.import_module(f"connectors.{name}"),f"{name}_connector_factory")
+    def factory(uri, confnodesroot):
+        connector = getattr(importlib.import_module(f"connectors.{name}"),f"{name}_connector_factory")(uri, confnodesroot)
+        if connector is None:
+            return None
+        return BatchedTraceConnector(ChunkedTransferConnector(connector, getattr(confnodesroot, "logger", None)))
+    return lambda: factory
 
 connectors = {name: _GetLocalConnectorClassFactory(name) for name in connectors_packages}
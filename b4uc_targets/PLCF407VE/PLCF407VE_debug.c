@@ -3,6 +3,8 @@
 #include <string.h>
 #include <stdio.h>
 #include <stdbool.h>
+#include <stddef.h>
+#include <stdint.h>
 
 // Global variables declaration from resources and configuration
 #pragma GCC diagnostic ignored "-Wdiscarded-qualifiers"
@@ -27,6 +29,28 @@ const dbgvardsc_t dbgvardsc[] = {
 	%(variable_decl_array)s
 };
 
+// Debug variables type descriptor structure
+// Type descriptors only hold sizes and offsets, no pointers, so they need no relocation
+typedef struct {
+    uint16_t size; // Size of the value
+    uint16_t flags_offset; // Offset of the flags in __IEC_<type>_t or __IEC_<type>_p
+    uint8_t kind; // DBG_VAR_T, DBG_VAR_P or DBG_VAR_O, 0 for types not used
+    uint8_t num; // DBG_NUM_INT, DBG_NUM_UINT or DBG_NUM_REAL for numeric types, 0 otherwise
+} dbgvartype_t;
+
+#define DBG_VAR_T 1 // __IEC_<type>_t, the value is in the variable
+#define DBG_VAR_P 2 // __IEC_<type>_p, pointer to the value (located input, external)
+#define DBG_VAR_O 3 // __IEC_<type>_p, pointer to the value (located output, memory)
+
+#define DBG_NUM_INT 1 // signed integer
+#define DBG_NUM_UINT 2 // unsigned integer or bit string
+#define DBG_NUM_REAL 3 // floating point
+
+// Type descriptors of the types used by the debug variables, indexed by __IEC_types_enum
+const dbgvartype_t dbgvartypes[] = {
+	%(type_desc_array)s
+};
+
 // Retain variables descriptor index array
 const dbgvardsc_index_t retain_list[] = {
 	%(retain_vardsc_index_array)s
@@ -34,16 +58,40 @@ const dbgvardsc_index_t retain_list[] = {
 
 #define __Unpack_desc_type dbgvardsc_t
 
+extern unsigned long long common_ticktime__;
+
 // Functions imported from RTE
 void rte_log_inf(const char* fmt, ...);
 void printk(const char *fmt, ...);
 
+// Functions exported to plc_main
+void debug_vars_init(void);
+void debug_subscriptions_update(void);
+void debug_capture_cycle(unsigned long tick);
+void debug_cycle_init(void);
+void debug_cycle_begin(void);
+void debug_cycle_end(void);
+
 // Functions exported to RTE
 void trace_reset(void);
 void set_trace(size_t idx, bool forced, void *val);
 void force_var(size_t idx, bool forced, void *val);
 int GetDebugVariable(dbgvardsc_index_t idx, void** value_p, size_t *size);
 int SetDebugVariable(dbgvardsc_index_t idx, void** value_p, size_t *size);
+int RegisterDebugVariables(const dbgvardsc_index_t *idxs, size_t count);
+int GetDebugVariables(const dbgvardsc_index_t *idxs, size_t count, void *buffer, size_t buffer_size);
+int GetDebugData(void *buffer, size_t buffer_size);
+int SubscribeDebugVariable(dbgvardsc_index_t idx, const void *deadband);
+void UnsubscribeDebugVariables(void);
+int GetDebugDelta(void *buffer, size_t buffer_size);
+int SetupTraceCapture(const dbgvardsc_index_t *idxs, size_t count, dbgvardsc_index_t trigger_idx,
+                      uint8_t trigger_mode, const void *trigger_level, size_t pre_trigger);
+int ArmTraceCapture(void);
+void StopTraceCapture(void);
+int GetTraceCaptureStatus(void *status, size_t status_size);
+int ReadTraceCapture(size_t offset, void *buffer, size_t size);
+int GetCycleMonitor(void *buffer, size_t buffer_size);
+void ResetCycleMonitor(void);
 
 // Placeholder for variable access code
 %(var_access_code)s
@@ -52,22 +100,29 @@ int SetDebugVariable(dbgvardsc_index_t idx, void** value_p, size_t *size);
 #define NUM(a) (sizeof(a) / sizeof(*a))
 size_t var_count = NUM(dbgvardsc);
 
-// Disable optimizations for debugging code
-#pragma GCC push_options
-#pragma GCC optimize("O0")
+// Size of a STRING value sent to the IDE: length byte and characters. The IDE reads the
+// length as unsigned byte, whatever STR_LEN_TYPE is.
+#define DBG_STRING_SIZE(s) ((size_t) (uint8_t) (s)->len + 1)
 
 /*
-Temporary workaround for a data relocation issue, affecting access to debug_vars[].ptr.
-This function provides provisional access to debug variables. Further investigation required.
+The variable pointers in dbgvardsc[] are not usable, because of a data relocation issue
+in the module. debug_vars_init() fills this table once at __init from code, where the
+variable addresses are resolved through the LOT, so every access is a table lookup.
 */
-void *get_debug_var_ptr(size_t idx)
+static void *dbgvar_ptr[NUM(dbgvardsc)];
+
+// Fills the debug variable pointer table, called from __init
+void debug_vars_init(void)
 {
-    void *ptr[var_count];
+%(dbg_ptr_init)s
+}
 
-    %(dbg_ptr_cnt)s
+// Gets the pointer of a debug variable
+void *get_debug_var_ptr(size_t idx)
+{
     if (idx < var_count) 
     {
-        return ptr[idx];
+        return dbgvar_ptr[idx];
     }
     else
     {
@@ -78,15 +133,10 @@ void *get_debug_var_ptr(size_t idx)
 // Forces a variable to a given value based on index
 void force_var(size_t idx, bool force, void *val)
 {
-    dbgvardsc_t *dsc = &dbgvardsc[idx];
-    dsc->ptr = get_debug_var_ptr(idx);
-    void *varp = dsc->ptr;
-    __IEC_types_enum vartype = dsc->type;
+    void *varp = dbgvar_ptr[idx];
+    __IEC_types_enum vartype = dbgvardsc[idx].type;
 
-    // Placeholder for force variable implementation
-    __ANY(__ForceVariable_case_t)
-    __ANY(__ForceVariable_case_p)
-    {;}
+    ForceVar(varp, vartype, force, val);
 }
 
 // Gets a debug variable value
@@ -95,21 +145,651 @@ int GetDebugVariable(dbgvardsc_index_t idx, void** value_p, size_t *size)
     int error_code = 0;
     if (idx >= 0 && idx < var_count) 
     {
-        dbgvardsc_t *dsc = &dbgvardsc[idx];
-        void *varp = get_debug_var_ptr(idx);
-        dsc->ptr = varp;
+        dbgvardsc_t var = {dbgvar_ptr[idx], dbgvardsc[idx].type};
+        dbgvardsc_t *dsc = &var;
+        void *varp = var.ptr;
         error_code = UnpackVar(dsc, value_p, NULL, size);
         if(__Is_a_string(dsc))
         {
-            *size = (size_t) (int8_t) ((__IEC_STRING_t *)varp)->value.len + 1;
+            *size = DBG_STRING_SIZE(&((__IEC_STRING_t *)varp)->value);
         }
         return error_code;
     }
     return -1;
 }
 
-// Re-enables optimizations
-#pragma GCC pop_options
+/*
+Batched trace buffer, so the IDE fetches a whole watch list in one request:
+  dbgbatch_hdr_t header (little endian)
+  force flags, one bit per variable in buffer order, LSB first
+  values, packed like the Beremiz trace buffer (STRING as length byte and characters)
+*/
+typedef struct __attribute__((packed)) {
+    uint16_t magic; // DBG_BATCH_MAGIC
+    uint8_t version; // DBG_BATCH_VERSION
+    uint8_t reserved;
+    uint16_t count; // Number of variables
+    uint16_t size; // Size of the whole buffer, header included
+} dbgbatch_hdr_t;
+
+#define DBG_BATCH_MAGIC 0xDB7A
+#define DBG_BATCH_VERSION 1
+
+// Subscription set of GetDebugData, one bit per debug variable
+static uint8_t dbgvar_subscribed[(NUM(dbgvardsc) + 7) / 8];
+
+// Reserves header and force flags, returns the offset of the first value or -1
+static int BeginDebugData(uint8_t *buffer, size_t buffer_size, size_t count)
+{
+    size_t offset = sizeof(dbgbatch_hdr_t) + (count + 7) / 8;
+    if (count > UINT16_MAX || offset > buffer_size)
+        return -1;
+    memset(buffer, 0, offset);
+    return offset;
+}
+
+// Packs one variable at position n of the buffer, returns -1 if it does not fit
+static int PackDebugVariable(dbgvardsc_index_t idx, size_t n, uint8_t *buffer, size_t buffer_size, size_t *offset)
+{
+    dbgvardsc_t var = {dbgvar_ptr[idx], dbgvardsc[idx].type};
+    dbgvardsc_t *dsc = &var;
+    void *value;
+    char flags;
+    size_t size;
+
+    if (UnpackVar(dsc, &value, &flags, &size))
+        return -1;
+    if (__Is_a_string(dsc))
+        size = DBG_STRING_SIZE((STRING *)value);
+    if (*offset + size > buffer_size)
+        return -1;
+    if (flags & __IEC_FORCE_FLAG)
+        buffer[sizeof(dbgbatch_hdr_t) + n / 8] |= 1 << (n %% 8);
+    memcpy(buffer + *offset, value, size);
+    *offset += size;
+    return 0;
+}
+
+// Writes the header, returns the size of the buffer or -1
+static int EndDebugData(uint8_t *buffer, size_t count, size_t offset)
+{
+    if (offset > UINT16_MAX)
+        return -1;
+    dbgbatch_hdr_t hdr = {DBG_BATCH_MAGIC, DBG_BATCH_VERSION, 0, count, offset};
+    memcpy(buffer, &hdr, sizeof(hdr));
+    return offset;
+}
+
+// Registers the subscription set of GetDebugData, replaces the previous one
+int RegisterDebugVariables(const dbgvardsc_index_t *idxs, size_t count)
+{
+    for (size_t i = 0; i < count; i++)
+    {
+        if (idxs[i] >= var_count)
+            return -1;
+    }
+    memset(dbgvar_subscribed, 0, sizeof(dbgvar_subscribed));
+    for (size_t i = 0; i < count; i++)
+    {
+        dbgvar_subscribed[idxs[i] / 8] |= 1 << (idxs[i] %% 8);
+    }
+    return 0;
+}
+
+// Packs the given debug variables into a batched trace buffer, returns its size or -1
+int GetDebugVariables(const dbgvardsc_index_t *idxs, size_t count, void *buffer, size_t buffer_size)
+{
+    int res = BeginDebugData(buffer, buffer_size, count);
+    if (res < 0)
+        return -1;
+    size_t offset = res;
+    for (size_t n = 0; n < count; n++)
+    {
+        if (idxs[n] >= var_count || PackDebugVariable(idxs[n], n, buffer, buffer_size, &offset))
+            return -1;
+    }
+    return EndDebugData(buffer, count, offset);
+}
+
+// Packs the subscribed debug variables in index order into a batched trace buffer, returns its size or -1
+int GetDebugData(void *buffer, size_t buffer_size)
+{
+    size_t count = 0;
+    for (size_t i = 0; i < var_count; i++)
+    {
+        if (dbgvar_subscribed[i / 8] & (1 << (i %% 8)))
+            count++;
+    }
+    int res = BeginDebugData(buffer, buffer_size, count);
+    if (res < 0)
+        return -1;
+    size_t offset = res;
+    for (size_t i = 0, n = 0; i < var_count; i++)
+    {
+        if (!(dbgvar_subscribed[i / 8] & (1 << (i %% 8))))
+            continue;
+        if (PackDebugVariable(i, n++, buffer, buffer_size, &offset))
+            return -1;
+    }
+    return EndDebugData(buffer, count, offset);
+}
+
+/*
+Change detection subscriptions. debug_subscriptions_update() compares the subscribed
+variables with their last recorded value after each cycle and records the changed ones,
+GetDebugDelta() sends the recorded changes only, so the link traffic depends on the
+change rate instead of the number of watched variables. The delta record has the header
+of the batched trace buffer (magic DBG_DELTA_MAGIC, count = number of entries) and one
+entry per changed variable: subscription number (u16), flags (u8), value.
+*/
+#define DBG_DELTA_MAGIC 0xDB7D
+
+#ifndef DBG_SUB_MAX
+#define DBG_SUB_MAX 256 // Maximum number of subscriptions
+#endif
+#ifndef DBG_SUB_POOL_SIZE
+#define DBG_SUB_POOL_SIZE 4096 // Size of the recorded values and deadbands of all subscriptions
+#endif
+_Static_assert(DBG_SUB_POOL_SIZE <= UINT16_MAX + 1, "DBG_SUB_POOL_SIZE too large for the 16 bit pool offsets");
+
+// Subscription table entry
+typedef struct {
+    dbgvardsc_index_t idx; // Debug variable index
+    uint16_t value_offset; // Offset of the last recorded value in dbgsub_pool
+    uint16_t deadband_offset; // Offset of the deadband in dbgsub_pool, 0 for any change
+    uint8_t flags; // Last recorded flags
+    bool pending; // Recorded change not sent yet
+} dbgsub_t;
+
+static dbgsub_t dbgsub[DBG_SUB_MAX];
+static size_t dbgsub_count;
+static uint8_t dbgsub_pool[DBG_SUB_POOL_SIZE];
+static size_t dbgsub_pool_used = 1; // offset 0 means no deadband
+
+// Subscribes a debug variable, deadband is a value of the variable type or NULL for any change.
+// Returns the subscription number or -1. All changes are pending after subscribing.
+int SubscribeDebugVariable(dbgvardsc_index_t idx, const void *deadband)
+{
+    if (idx >= var_count || dbgsub_count >= DBG_SUB_MAX)
+        return -1;
+    const dbgvartype_t *type = GetVarType(dbgvardsc[idx].type);
+    if (!type)
+        return -1;
+    if (!type->num)
+        deadband = NULL;
+    size_t needed = type->size + (deadband ? type->size : 0);
+    if (dbgsub_pool_used + needed > DBG_SUB_POOL_SIZE)
+        return -1;
+
+    dbgsub_t *sub = &dbgsub[dbgsub_count];
+    sub->idx = idx;
+    sub->value_offset = dbgsub_pool_used;
+    sub->deadband_offset = 0;
+    dbgsub_pool_used += type->size;
+    if (deadband)
+    {
+        sub->deadband_offset = dbgsub_pool_used;
+        memcpy(&dbgsub_pool[dbgsub_pool_used], deadband, type->size);
+        dbgsub_pool_used += type->size;
+    }
+
+    dbgvardsc_t var = {dbgvar_ptr[idx], dbgvardsc[idx].type};
+    void *value;
+    char flags;
+    UnpackVar(&var, &value, &flags, NULL);
+    memcpy(&dbgsub_pool[sub->value_offset], value, type->size);
+    sub->flags = flags;
+    sub->pending = true;
+    return dbgsub_count++;
+}
+
+// Removes all subscriptions
+void UnsubscribeDebugVariables(void)
+{
+    dbgsub_count = 0;
+    dbgsub_pool_used = 1;
+}
+
+// Records the changed subscriptions, called from __run after each cycle
+void debug_subscriptions_update(void)
+{
+    for (size_t i = 0; i < dbgsub_count; i++)
+    {
+        dbgsub_t *sub = &dbgsub[i];
+        dbgvardsc_t var = {dbgvar_ptr[sub->idx], dbgvardsc[sub->idx].type};
+        const dbgvartype_t *type = GetVarType(var.type);
+        void *value;
+        char flags;
+        uint8_t *last = &dbgsub_pool[sub->value_offset];
+
+        if (!type || UnpackVar(&var, &value, &flags, NULL))
+            continue;
+        if (flags == sub->flags && !memcmp(value, last, type->size))
+            continue;
+        if (flags == sub->flags && sub->deadband_offset &&
+            !ExceedsDeadband(type, value, last, &dbgsub_pool[sub->deadband_offset]))
+            continue;
+        memcpy(last, value, type->size);
+        sub->flags = flags;
+        sub->pending = true;
+    }
+}
+
+// Packs the pending changes into a delta record, returns its size or -1.
+// Changes which do not fit stay pending for the next call.
+int GetDebugDelta(void *buffer, size_t buffer_size)
+{
+    uint8_t *buf = buffer;
+    size_t offset = sizeof(dbgbatch_hdr_t);
+    size_t count = 0;
+
+    if (offset > buffer_size)
+        return -1;
+    for (size_t i = 0; i < dbgsub_count; i++)
+    {
+        dbgsub_t *sub = &dbgsub[i];
+        if (!sub->pending)
+            continue;
+        dbgvardsc_t var = {dbgvar_ptr[sub->idx], dbgvardsc[sub->idx].type};
+        dbgvardsc_t *dsc = &var;
+        uint8_t *last = &dbgsub_pool[sub->value_offset];
+        size_t size = GetVarType(var.type)->size;
+        if (__Is_a_string(dsc))
+            size = DBG_STRING_SIZE((STRING *)last);
+        if (offset + 3 + size > buffer_size || offset + 3 + size > UINT16_MAX)
+            break;
+        buf[offset++] = i & 0xFF;
+        buf[offset++] = i >> 8;
+        buf[offset++] = sub->flags;
+        memcpy(buf + offset, last, size);
+        offset += size;
+        sub->pending = false;
+        count++;
+    }
+    dbgbatch_hdr_t hdr = {DBG_DELTA_MAGIC, DBG_BATCH_VERSION, 0, count, offset};
+    memcpy(buf, &hdr, sizeof(hdr));
+    return offset;
+}
+
+/*
+Trace capture. While armed, debug_capture_cycle() records one sample per cycle into a
+preallocated ring buffer, so events shorter than the IDE poll interval are not lost.
+A sample is the tick (u32, little endian) followed by the values of the captured variables.
+When the trigger fires, the capture goes on until the buffer holds pre_trigger samples
+before the trigger and is then stopped until the IDE downloaded it with ReadTraceCapture().
+*/
+#ifndef DBG_CAP_MAX_VARS
+#define DBG_CAP_MAX_VARS 8 // Maximum number of captured variables
+#endif
+#ifndef DBG_CAP_BUF_SIZE
+#define DBG_CAP_BUF_SIZE 16384 // Size of the capture ring buffer
+#endif
+
+#define DBG_CAP_IDLE 0
+#define DBG_CAP_ARMED 1 // recording, waiting for the trigger
+#define DBG_CAP_TRIGGERED 2 // recording the samples after the trigger
+#define DBG_CAP_DONE 3 // buffer ready for download
+
+#define DBG_TRIG_IMMEDIATE 0 // first sample
+#define DBG_TRIG_RISING 1 // trigger variable reaches the level from below
+#define DBG_TRIG_FALLING 2 // trigger variable reaches the level from above
+#define DBG_TRIG_CHANGE 3 // trigger variable changes
+
+// Trace capture status, returned by GetTraceCaptureStatus()
+typedef struct __attribute__((packed)) {
+    uint8_t state; // DBG_CAP_IDLE, DBG_CAP_ARMED, DBG_CAP_TRIGGERED or DBG_CAP_DONE
+    uint8_t count; // Number of captured variables
+    uint16_t sample_size; // Size of a sample
+    uint32_t samples; // Number of samples in the buffer
+    uint32_t trigger_index; // Sample of the trigger, valid in state DBG_CAP_DONE
+} dbgcap_status_t;
+
+static struct {
+    dbgvardsc_index_t idx[DBG_CAP_MAX_VARS]; // Captured variables
+    uint16_t size[DBG_CAP_MAX_VARS]; // Sizes of the captured values
+    uint8_t count;
+    uint8_t state;
+    uint16_t sample_size;
+    size_t capacity; // Buffer size in samples
+    size_t end; // Used buffer size in bytes
+    size_t head; // Write position in bytes
+    size_t samples; // Number of samples in the buffer
+    size_t post_trigger; // Number of samples recorded from the trigger on
+    size_t post_remaining; // Samples still to record after the trigger
+    size_t trigger_index;
+    dbgvardsc_index_t trigger_idx;
+    uint8_t trigger_mode;
+    uint8_t trigger_level[8];
+    uint8_t trigger_last[8];
+} dbgcap;
+
+static uint8_t dbgcap_buf[DBG_CAP_BUF_SIZE];
+
+// Configures the trace capture, stops a running capture. STRING variables can not be captured.
+int SetupTraceCapture(const dbgvardsc_index_t *idxs, size_t count, dbgvardsc_index_t trigger_idx,
+                      uint8_t trigger_mode, const void *trigger_level, size_t pre_trigger)
+{
+    size_t sample_size = sizeof(uint32_t);
+
+    dbgcap.state = DBG_CAP_IDLE;
+    dbgcap.count = 0;
+    if (count == 0 || count > DBG_CAP_MAX_VARS || trigger_mode > DBG_TRIG_CHANGE)
+        return -1;
+    for (size_t i = 0; i < count; i++)
+    {
+        const dbgvartype_t *type = idxs[i] < var_count ? GetVarType(dbgvardsc[idxs[i]].type) : NULL;
+        if (!type || __Is_a_string((&dbgvardsc[idxs[i]])))
+            return -1;
+        dbgcap.idx[i] = idxs[i];
+        dbgcap.size[i] = type->size;
+        sample_size += type->size;
+    }
+    if (trigger_mode != DBG_TRIG_IMMEDIATE)
+    {
+        const dbgvartype_t *type = trigger_idx < var_count ? GetVarType(dbgvardsc[trigger_idx].type) : NULL;
+        if (!type || type->size > sizeof(dbgcap.trigger_level) || !trigger_level)
+            return -1;
+        memcpy(dbgcap.trigger_level, trigger_level, type->size);
+    }
+
+    // capacity without division, runs once per setup only
+    size_t capacity = 0;
+    while ((capacity + 1) * sample_size <= DBG_CAP_BUF_SIZE)
+        capacity++;
+    if (pre_trigger >= capacity)
+        return -1;
+
+    dbgcap.count = count;
+    dbgcap.sample_size = sample_size;
+    dbgcap.capacity = capacity;
+    dbgcap.end = capacity * sample_size;
+    dbgcap.post_trigger = capacity - pre_trigger;
+    dbgcap.trigger_idx = trigger_idx;
+    dbgcap.trigger_mode = trigger_mode;
+    return capacity;
+}
+
+// Starts recording, the buffer content is discarded
+int ArmTraceCapture(void)
+{
+    if (!dbgcap.count)
+        return -1;
+    dbgcap.head = 0;
+    dbgcap.samples = 0;
+    dbgcap.trigger_index = 0;
+    if (dbgcap.trigger_mode != DBG_TRIG_IMMEDIATE)
+    {
+        void *value;
+        dbgvardsc_t var = {dbgvar_ptr[dbgcap.trigger_idx], dbgvardsc[dbgcap.trigger_idx].type};
+        size_t size;
+        UnpackVar(&var, &value, NULL, &size);
+        memcpy(dbgcap.trigger_last, value, size);
+    }
+    dbgcap.state = DBG_CAP_ARMED;
+    return 0;
+}
+
+// Stops recording, the samples recorded so far stay available for download
+void StopTraceCapture(void)
+{
+    if (dbgcap.state == DBG_CAP_ARMED || dbgcap.state == DBG_CAP_TRIGGERED)
+    {
+        dbgcap.trigger_index = dbgcap.samples;
+        dbgcap.state = DBG_CAP_DONE;
+    }
+}
+
+// Checks the trigger condition, updates the last trigger value
+static bool TraceCaptureTriggered(void)
+{
+    if (dbgcap.trigger_mode == DBG_TRIG_IMMEDIATE)
+        return true;
+
+    dbgvardsc_t var = {dbgvar_ptr[dbgcap.trigger_idx], dbgvardsc[dbgcap.trigger_idx].type};
+    const dbgvartype_t *type = GetVarType(var.type);
+    void *value;
+    bool triggered;
+
+    UnpackVar(&var, &value, NULL, NULL);
+    if (dbgcap.trigger_mode == DBG_TRIG_RISING)
+        triggered = CompareValue(type, dbgcap.trigger_last, dbgcap.trigger_level) < 0 &&
+                    CompareValue(type, value, dbgcap.trigger_level) >= 0;
+    else if (dbgcap.trigger_mode == DBG_TRIG_FALLING)
+        triggered = CompareValue(type, dbgcap.trigger_last, dbgcap.trigger_level) > 0 &&
+                    CompareValue(type, value, dbgcap.trigger_level) <= 0;
+    else
+        triggered = CompareValue(type, value, dbgcap.trigger_last) != 0;
+    memcpy(dbgcap.trigger_last, value, type->size);
+    return triggered;
+}
+
+// Records a sample while armed, called from __run after each cycle
+void debug_capture_cycle(unsigned long tick)
+{
+    if (dbgcap.state != DBG_CAP_ARMED && dbgcap.state != DBG_CAP_TRIGGERED)
+        return;
+
+    uint8_t *sample = &dbgcap_buf[dbgcap.head];
+    uint32_t tick32 = tick;
+    memcpy(sample, &tick32, sizeof(tick32));
+    sample += sizeof(tick32);
+    for (size_t i = 0; i < dbgcap.count; i++)
+    {
+        void *value;
+        dbgvardsc_t var = {dbgvar_ptr[dbgcap.idx[i]], dbgvardsc[dbgcap.idx[i]].type};
+        UnpackVar(&var, &value, NULL, NULL);
+        memcpy(sample, value, dbgcap.size[i]);
+        sample += dbgcap.size[i];
+    }
+    dbgcap.head += dbgcap.sample_size;
+    if (dbgcap.head >= dbgcap.end)
+        dbgcap.head = 0;
+    if (dbgcap.samples < dbgcap.capacity)
+        dbgcap.samples++;
+
+    if (dbgcap.state == DBG_CAP_ARMED && TraceCaptureTriggered())
+    {
+        dbgcap.post_remaining = dbgcap.post_trigger;
+        dbgcap.state = DBG_CAP_TRIGGERED;
+    }
+    if (dbgcap.state == DBG_CAP_TRIGGERED && --dbgcap.post_remaining == 0)
+    {
+        dbgcap.trigger_index = dbgcap.samples - dbgcap.post_trigger;
+        dbgcap.state = DBG_CAP_DONE;
+    }
+}
+
+// Gets the trace capture status (dbgcap_status_t), returns its size or -1
+int GetTraceCaptureStatus(void *status, size_t status_size)
+{
+    dbgcap_status_t st = {dbgcap.state, dbgcap.count, dbgcap.sample_size, dbgcap.samples, dbgcap.trigger_index};
+    if (status_size < sizeof(st))
+        return -1;
+    memcpy(status, &st, sizeof(st));
+    return sizeof(st);
+}
+
+// Reads the captured samples, oldest first, offset in bytes. Returns the number of bytes read or -1.
+int ReadTraceCapture(size_t offset, void *buffer, size_t size)
+{
+    if (dbgcap.state != DBG_CAP_DONE)
+        return -1;
+    size_t total = dbgcap.samples * dbgcap.sample_size;
+    if (offset >= total)
+        return 0;
+    if (size > total - offset)
+        size = total - offset;
+
+    // the oldest sample is at the write position once the buffer is full
+    size_t pos = (dbgcap.samples < dbgcap.capacity ? 0 : dbgcap.head) + offset;
+    if (pos >= dbgcap.end)
+        pos -= dbgcap.end;
+    size_t first = size < dbgcap.end - pos ? size : dbgcap.end - pos;
+    memcpy(buffer, &dbgcap_buf[pos], first);
+    memcpy((uint8_t *)buffer + first, dbgcap_buf, size - first);
+    return size;
+}
+
+/*
+Cycle monitor. __run calls debug_cycle_begin() first and debug_cycle_end() last, both read
+the cycle counter only. The monitor counts the cycles, the overruns (execution longer than
+common_ticktime__), keeps the last and worst execution time and the start-time jitter
+(deviation of the time between two starts from common_ticktime__), all in CPU cycles. A cycle
+over DBG_MON_CYCLE_WARN percent of common_ticktime__ or a start deviating by more than
+DBG_MON_JITTER_WARN percent is logged with rte_log_inf() once, until a cycle is within the
+limits again (0 = not logged). The limits in cycles are computed in debug_cycle_init() with
+shifts and adds, there is no division on the target. Targets without a cycle counter get
+empty functions and no monitor.
+*/
+#define DBG_MON_ENABLED %(cycle_monitor)s
+#if DBG_MON_ENABLED
+#define DBG_MON_CYCCNT (%(cycle_counter)s)
+
+#define DBG_MON_MAGIC 0xC7C2
+#define DBG_MON_VERSION 1
+#define DBG_MON_CPU_HZ %(cpu_hz)sULL
+#define DBG_MON_CYCLE_WARN %(cycle_warn_percent)s
+#define DBG_MON_JITTER_WARN %(jitter_warn_percent)s
+// Q16 factors, folded by the compiler
+#define DBG_MON_CYCLES_PER_NS ((DBG_MON_CPU_HZ << 16) / 1000000000ULL)
+#define DBG_MON_US_PER_CYCLE ((1000000ULL << 16) / DBG_MON_CPU_HZ)
+#define DBG_MON_PERCENT(p) ((((unsigned long long)(p)) << 16) / 100)
+
+#define DBG_MON_STARTED 0x01 // the start of the last cycle is known
+#define DBG_MON_CYCLE_LOGGED 0x02 // cycle over the limit logged
+#define DBG_MON_JITTER_LOGGED 0x04 // jitter over the limit logged
+
+// Cycle monitor, returned by GetCycleMonitor()
+typedef struct __attribute__((packed)) {
+    uint16_t magic; // DBG_MON_MAGIC
+    uint8_t version; // DBG_MON_VERSION
+    uint8_t flags;
+    uint32_t cpu_hz; // Frequency of the cycle counter
+    uint64_t tick_ns; // common_ticktime__
+    uint32_t budget; // common_ticktime__ in cycles
+    uint32_t cycles; // Number of cycles
+    uint32_t overruns; // Cycles with an execution time over the budget
+    uint32_t cycle_warnings; // Cycles over DBG_MON_CYCLE_WARN
+    uint32_t jitter_warnings; // Starts deviating by more than DBG_MON_JITTER_WARN
+    uint32_t last_exec; // Execution time of the last cycle
+    uint32_t max_exec; // Worst execution time
+    uint32_t last_jitter; // Start-time jitter of the last cycle
+    uint32_t max_jitter; // Worst start-time jitter
+} dbgmon_t;
+
+static dbgmon_t dbgmon;
+static uint32_t dbgmon_start; // Cycle counter at the start of the cycle
+static uint32_t dbgmon_cycle_limit; // Execution time logged, 0 = off
+static uint32_t dbgmon_jitter_limit; // Start-time jitter logged, 0 = off
+
+// Multiplies a value with a Q16 factor, with shifts and adds only
+static uint32_t debug_cycle_scale(uint64_t value, uint32_t q16)
+{
+    uint64_t result = 0;
+    for (; q16; q16 >>= 1, value <<= 1)
+    {
+        if (q16 & 1)
+            result += value;
+    }
+    return result >> 16;
+}
+
+// Starts the cycle counter and computes the limits, called from __init
+void debug_cycle_init(void)
+{
+    %(cycle_counter_init)s
+    memset(&dbgmon, 0, sizeof(dbgmon));
+    dbgmon.magic = DBG_MON_MAGIC;
+    dbgmon.version = DBG_MON_VERSION;
+    dbgmon.cpu_hz = DBG_MON_CPU_HZ;
+    dbgmon.tick_ns = common_ticktime__;
+    dbgmon.budget = debug_cycle_scale(common_ticktime__, DBG_MON_CYCLES_PER_NS);
+    dbgmon_cycle_limit = debug_cycle_scale(dbgmon.budget, DBG_MON_PERCENT(DBG_MON_CYCLE_WARN));
+    dbgmon_jitter_limit = debug_cycle_scale(dbgmon.budget, DBG_MON_PERCENT(DBG_MON_JITTER_WARN));
+}
+
+// Records the start of a cycle and the jitter to the previous start
+void debug_cycle_begin(void)
+{
+    uint32_t start = DBG_MON_CYCCNT;
+
+    if (dbgmon.flags & DBG_MON_STARTED)
+    {
+        uint32_t period = start - dbgmon_start;
+        uint32_t jitter = period > dbgmon.budget ? period - dbgmon.budget : dbgmon.budget - period;
+        dbgmon.last_jitter = jitter;
+        if (jitter > dbgmon.max_jitter)
+            dbgmon.max_jitter = jitter;
+        if (dbgmon_jitter_limit && jitter > dbgmon_jitter_limit)
+        {
+            dbgmon.jitter_warnings++;
+            if (!(dbgmon.flags & DBG_MON_JITTER_LOGGED))
+                rte_log_inf("PLC cycle start %%lu us off the cycle time (%%lu times)",
+                            (unsigned long)debug_cycle_scale(jitter, DBG_MON_US_PER_CYCLE),
+                            (unsigned long)dbgmon.jitter_warnings);
+            dbgmon.flags |= DBG_MON_JITTER_LOGGED;
+        }
+        else
+            dbgmon.flags &= ~DBG_MON_JITTER_LOGGED;
+    }
+    dbgmon_start = start;
+    dbgmon.flags |= DBG_MON_STARTED;
+}
+
+// Records the execution time of the cycle
+void debug_cycle_end(void)
+{
+    uint32_t exec = DBG_MON_CYCCNT - dbgmon_start;
+
+    dbgmon.cycles++;
+    dbgmon.last_exec = exec;
+    if (exec > dbgmon.max_exec)
+        dbgmon.max_exec = exec;
+    if (exec > dbgmon.budget)
+        dbgmon.overruns++;
+    if (dbgmon_cycle_limit && exec > dbgmon_cycle_limit)
+    {
+        dbgmon.cycle_warnings++;
+        if (!(dbgmon.flags & DBG_MON_CYCLE_LOGGED))
+            rte_log_inf("PLC cycle took %%lu us of %%lu us (%%lu overruns)",
+                        (unsigned long)debug_cycle_scale(exec, DBG_MON_US_PER_CYCLE),
+                        (unsigned long)debug_cycle_scale(dbgmon.budget, DBG_MON_US_PER_CYCLE),
+                        (unsigned long)dbgmon.overruns);
+        dbgmon.flags |= DBG_MON_CYCLE_LOGGED;
+    }
+    else
+        dbgmon.flags &= ~DBG_MON_CYCLE_LOGGED;
+}
+
+// Copies the cycle monitor (dbgmon_t), returns its size or -1
+int GetCycleMonitor(void *buffer, size_t buffer_size)
+{
+    if (buffer_size < sizeof(dbgmon))
+        return -1;
+    memcpy(buffer, &dbgmon, sizeof(dbgmon));
+    return sizeof(dbgmon);
+}
+
+// Clears the statistics, the next cycle starts without jitter
+void ResetCycleMonitor(void)
+{
+    dbgmon.cycles = 0;
+    dbgmon.overruns = 0;
+    dbgmon.cycle_warnings = 0;
+    dbgmon.jitter_warnings = 0;
+    dbgmon.last_exec = 0;
+    dbgmon.max_exec = 0;
+    dbgmon.last_jitter = 0;
+    dbgmon.max_jitter = 0;
+    dbgmon.flags = 0;
+}
+#else
+void debug_cycle_init(void) {}
+void debug_cycle_begin(void) {}
+void debug_cycle_end(void) {}
+int GetCycleMonitor(void *buffer, size_t buffer_size) { return -1; }
+void ResetCycleMonitor(void) {}
+#endif
 
 // Resets all debug variables
 void trace_reset(void)
@@ -10,10 +10,21 @@
 void config_run__(unsigned long tick);
 void config_init__(void);
 
+/*
+ * Prototypes of functions provided by plc_debugger
+ **/
+void debug_vars_init(void);
+void debug_subscriptions_update(void);
+void debug_capture_cycle(unsigned long tick);
+void debug_cycle_init(void);
+void debug_cycle_begin(void);
+void debug_cycle_end(void);
+
 
 /*
  * Prototypes of functions provided by RTE
  * */
+void rte_log_inf(const char* fmt, ...);
 // void __init_debug(void);
 // void __cleanup_debug(void);
 // void __publish_debug(void);
@@ -38,9 +49,12 @@ static int init_level = 0;
  **/
 %(calls_prototypes)s
 
+%(profile_prototypes)s
 
 void __run(void)
 {
+    debug_cycle_begin();
+    %(profile_start)s
     __tick++;
 
   // Altered to bypass __aeabi_uidivmod by directly resetting __tick, avoiding division/modulo operations.
@@ -52,10 +66,15 @@ void __run(void)
 
     config_run__(__tick);
 
+    debug_subscriptions_update();
+    debug_capture_cycle(__tick);
+
     // __publish_debug();
 
     %(publish_calls)s
 
+    %(profile_end)s
+    debug_cycle_end();
 }
 
 /*
@@ -68,10 +87,15 @@ int __init(int argc,char **argv)
     init_level = 0;
     
     /* Effective tick time with 1ms default value */
-    if(!common_ticktime__)
+    if(!common_ticktime__) {
         common_ticktime__ = 1000000;
+        rte_log_inf("PLC has no cycle time, 1 ms used");
+    }
 
     config_init__();
+    debug_vars_init();
+    debug_cycle_init();
+    %(profile_init)s
     // __init_debug();
     %(init_calls)s
     return res;
@@ -0,0 +1,107 @@
+/**
+ * Cycle profile of the PLC code, only part of the module with the CycleProfile option
+ **/
+
+#include <string.h>
+#include <stdint.h>
+#include <stddef.h>
+
+/*
+The scan cycle is measured in sections with the cycle counter of the target: the
+whole __run, the retrieve and the publish phase of the extensions, and every program call
+of the resources. Each section keeps the number of calls, the CPU cycles of the last call,
+minimum, maximum and sum (the IDE computes the average, there is no division on the target)
+and a histogram: bin n counts the calls of less than 2^(PLC_PROFILE_BIN0 + 1 + n) cycles,
+the last bin all longer calls. Counts saturate at 0xFFFF.
+*/
+#define PLC_PROFILE_CYCCNT (%(cycle_counter)s)
+
+#define PLC_PROFILE_MAGIC 0xC7C1
+#define PLC_PROFILE_VERSION 1
+#define PLC_PROFILE_SECTIONS %(section_count)s
+#define PLC_PROFILE_BINS 16
+#define PLC_PROFILE_BIN0 6 // the first bin ends at 128 cycles
+#define PLC_PROFILE_CPU_HZ %(cpu_hz)s
+
+// Sections:
+%(section_names)s
+
+extern unsigned long long common_ticktime__;
+
+// Functions exported to plc_main and the resources
+void plc_profile_init(void);
+void plc_profile_record(unsigned int section, unsigned long start);
+
+// Functions exported to RTE
+int GetCycleProfile(void *buffer, size_t buffer_size);
+void ResetCycleProfile(void);
+
+// Header of the profile returned by GetCycleProfile(), followed by the sections
+typedef struct __attribute__((packed)) {
+    uint16_t magic; // PLC_PROFILE_MAGIC
+    uint8_t version; // PLC_PROFILE_VERSION
+    uint8_t bins; // Number of histogram bins
+    uint16_t count; // Number of sections
+    uint8_t bin0; // PLC_PROFILE_BIN0
+    uint8_t reserved;
+    uint32_t cpu_hz; // Frequency of the cycle counter
+    uint64_t tick_ns; // common_ticktime__, the cycle budget
+} plcprof_header_t;
+
+// Statistics of a section, naturally aligned, so the table is copied as is
+typedef struct {
+    uint32_t count; // Number of calls
+    uint32_t last; // Cycles of the last call
+    uint32_t min;
+    uint32_t max;
+    uint64_t sum;
+    uint16_t hist[PLC_PROFILE_BINS];
+} plcprof_section_t;
+
+static plcprof_section_t plcprof[PLC_PROFILE_SECTIONS];
+
+// Starts the cycle counter, called from __init
+void plc_profile_init(void)
+{
+    %(cycle_counter_init)s
+}
+
+// Records the cycles since start in a section
+void plc_profile_record(unsigned int section, unsigned long start)
+{
+    uint32_t cycles = PLC_PROFILE_CYCCNT - start;
+    plcprof_section_t *s = &plcprof[section];
+    unsigned int bin = 0;
+
+    if (s->count == 0 || cycles < s->min)
+        s->min = cycles;
+    if (cycles > s->max)
+        s->max = cycles;
+    s->last = cycles;
+    s->sum += cycles;
+    s->count++;
+    // no CLZ on all cores the module is built for, at most PLC_PROFILE_BINS shifts
+    while (bin < PLC_PROFILE_BINS - 1 && (cycles >> (PLC_PROFILE_BIN0 + 1 + bin)))
+        bin++;
+    if (s->hist[bin] != 0xFFFF)
+        s->hist[bin]++;
+}
+
+// Copies the header and all sections, returns the size or -1 if the buffer is too small
+int GetCycleProfile(void *buffer, size_t buffer_size)
+{
+    plcprof_header_t header = {PLC_PROFILE_MAGIC, PLC_PROFILE_VERSION, PLC_PROFILE_BINS,
+                               PLC_PROFILE_SECTIONS, PLC_PROFILE_BIN0, 0, PLC_PROFILE_CPU_HZ,
+                               common_ticktime__};
+    if (buffer_size < sizeof(header) + sizeof(plcprof))
+        return -1;
+    memcpy(buffer, &header, sizeof(header));
+    memcpy((uint8_t *)buffer + sizeof(header), plcprof, sizeof(plcprof));
+    return sizeof(header) + sizeof(plcprof);
+}
+
+// Clears the statistics of all sections
+void ResetCycleProfile(void)
+{
+    memset(plcprof, 0, sizeof(plcprof));
+}
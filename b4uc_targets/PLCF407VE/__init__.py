@@ -36,6 +36,21 @@ from ..toolchain_b4arm import toolchain_b4arm
 class PLCF407VE_target(toolchain_b4arm):
     extension = ".bin"
     target = "PLCF407VE"
+    cpu = "cortex-m4"
+    fpu = "fpv4-sp-d16"
+    fast_memory = 64 * 1024     # CCM, data only: not on the instruction bus
+    cycle_counter = "*(volatile unsigned long *)0xE0001004"    # DWT_CYCCNT
+    cycle_counter_init = ("*(volatile unsigned long *)0xE000EDFC |= 0x01000000; "   # DEMCR: TRCENA
+                          "*(volatile unsigned long *)0xE0001000 |= 1;")            # DWT_CTRL: CYCCNTENA
+    cpu_hz = 168000000
+    # main and debugger interface of the module (<target>_main.c and <target>_debug.c)
+    module_exports = ("__init", "__run", "__cleanup", "__tick", "PLC_ID",
+                      "var_count", "get_debug_var_ptr", "force_var", "GetDebugVariable", "trace_reset", "set_trace",
+                      "RegisterDebugVariables", "GetDebugVariables", "GetDebugData",
+                      "SubscribeDebugVariable", "UnsubscribeDebugVariables", "GetDebugDelta",
+                      "SetupTraceCapture", "ArmTraceCapture", "StopTraceCapture", "GetTraceCaptureStatus", "ReadTraceCapture",
+                      "GetCycleMonitor", "ResetCycleMonitor")
+    profile_exports = ("GetCycleProfile", "ResetCycleProfile")    # <target>_profile.c
 
     def Generate_plc_main(self):
         locstrs = ["_".join(map(str, x)) for x in [loc for loc, _Cfiles, DoCalls in
@@ -52,6 +67,32 @@ class PLCF407VE_target(toolchain_b4arm):
         with open(template_path, "r", encoding="utf-8") as template_file:
             template_content = template_file.read()
 
+        profile = {
+            "profile_prototypes": "",
+            "profile_start": "",
+            "profile_end": "",
+            "profile_init": ""
+        }
+        if self.cycle_profile:
+            profile = {
+                "profile_prototypes": "\n".join([
+                    f"#define PLC_PROFILE_CYCCNT ({self.cycle_counter})",
+                    "#define PLC_PROFILE_CYCLE 0",
+                    "#define PLC_PROFILE_RETRIEVE 1",
+                    "#define PLC_PROFILE_PUBLISH 2",
+                    "void plc_profile_init(void);",
+                    "void plc_profile_record(unsigned int section, unsigned long start);"]),
+                "profile_start": "unsigned long __profile_cycle = PLC_PROFILE_CYCCNT;",
+                "profile_end": "plc_profile_record(PLC_PROFILE_CYCLE, __profile_cycle);",
+                "profile_init": "plc_profile_init();"
+            }
+
+        def profiled(calls, section):
+            if not self.cycle_profile:
+                return calls
+            return ("{ unsigned long __profile_start = PLC_PROFILE_CYCCNT;\n    " + calls +
+                    f"\n    plc_profile_record({section}, __profile_start); }}")
+
         if not disable_extensions:
             plc_main_code = template_content % {
                 "calls_prototypes": "\n".join([
@@ -59,24 +100,26 @@ class PLCF407VE_target(toolchain_b4arm):
                     f"void __cleanup_{locstr}(void);\n" +
                     f"void __retrieve_{locstr}(void);\n" +
                     f"void __publish_{locstr}(void);" for locstr in locstrs]),
-                		"retrieve_calls": "\n    ".join([
-                    	"__retrieve_%s();" % locstr for locstr in locstrs]),
-                		"publish_calls": "\n    ".join([
-                    	"__publish_%s();" % locstrs[i - 1] for i in range(len(locstrs), 0, -1)]),
+                		"retrieve_calls": profiled("\n    ".join([
+                    	"__retrieve_%s();" % locstr for locstr in locstrs]), "PLC_PROFILE_RETRIEVE"),
+                		"publish_calls": profiled("\n    ".join([
+                    	"__publish_%s();" % locstrs[i - 1] for i in range(len(locstrs), 0, -1)]), "PLC_PROFILE_PUBLISH"),
                 		"init_calls": "\n    ".join([
                     	"init_level=%d; if((res = __init_%s(argc,argv))) { return res; }" % (i + 1, locstr)
                     for i, locstr in enumerate(locstrs)]),
                 		"cleanup_calls": "\n    ".join([
                     	"if(init_level >= %d) __cleanup_%s();" % (i, locstrs[i - 1])
-                    for i in range(len(locstrs), 0, -1)])
+                    for i in range(len(locstrs), 0, -1)]),
+                **profile
             }
         else:
             plc_main_code = template_content % {
                 "calls_prototypes": "\n",
-                "retrieve_calls": "\n",
-                "publish_calls": "\n",
+                "retrieve_calls": profiled("\n", "PLC_PROFILE_RETRIEVE"),
+                "publish_calls": profiled("\n", "PLC_PROFILE_PUBLISH"),
                 "init_calls": "\n",
-                "cleanup_calls": "\n"
+                "cleanup_calls": "\n",
+                **profile
             }
 
         target_file_path = os.path.join(self.buildpath, "plc_main.c")
@@ -84,6 +127,35 @@ class PLCF407VE_target(toolchain_b4arm):
             target_file.write(plc_main_code)
         self.plc_main_code = plc_main_code
 
+    def Generate_plc_profile(self, names):
+        """
+        Generates plc_profile.c with a profile section for each name, returns its path.
+        """
+        profile_template_path = os.path.join("b4uc_targets", self.target, f"{self.target}_profile.c")
+        try:
+            with open(profile_template_path, "r", encoding="utf-8") as template_file:
+                profile_template_content = template_file.read()
+        except IOError:
+            self.log_err(f"Cannot read profile template file {profile_template_path}.")
+            return None
+
+        profile_code = profile_template_content % {
+            "cycle_counter": self.cycle_counter,
+            "cycle_counter_init": self.cycle_counter_init or "",
+            "section_count": len(names),
+            "cpu_hz": self.cpu_hz,
+            "section_names": "\n".join([f"// {i}: {name}" for i, name in enumerate(names)])
+        }
+
+        target_file_path = os.path.join(self.buildpath, "plc_profile.c")
+        try:
+            with open(target_file_path, "w", encoding="utf-8") as target_file:
+                target_file.write(profile_code)
+        except IOError:
+            self.log_err(f"Cannot write target file {target_file_path}.")
+            return None
+        return target_file_path
+
     def Generate_plc_debugger(self):
         """
         Generates plc_debug.c using templates from the specified target directory.
@@ -120,7 +192,19 @@ class PLCF407VE_target(toolchain_b4arm):
             if v["retain"] == "1":
                 retain_indexes.append(f"/* {v['C_path']} */ {i}")
 
-        ptr_assignment_lines = [f"\tptr[{i}] = dbgvardsc[{i}].ptr;" for i in range(len(variable_decl_array))]
+        # type descriptors, only for the types used by the debug variables
+        type_kinds = {"EXT": "P", "IN": "P", "MEM": "O", "OUT": "O", "VAR": "T"}
+        type_nums = dict([(t, "DBG_NUM_INT") for t in ("SINT", "INT", "DINT", "LINT")] +
+                         [(t, "DBG_NUM_UINT") for t in ("USINT", "UINT", "UDINT", "ULINT", "BYTE", "WORD", "DWORD", "LWORD")] +
+                         [(t, "DBG_NUM_REAL") for t in ("REAL", "LREAL")])
+        type_desc_array = []
+        for vartype, kind in sorted(set((v["type"], type_kinds[v["vartype"]]) for v in DbgVariablesList)):
+            enum_name = f"{vartype}_ENUM" if kind == "T" else f"{vartype}_{kind}_ENUM"
+            struct_name = f"__IEC_{vartype}_t" if kind == "T" else f"__IEC_{vartype}_p"
+            type_desc_array.append(
+                f"[{enum_name}] = {{sizeof({vartype}), offsetof({struct_name}, flags), DBG_VAR_{kind}, {type_nums.get(vartype, 0)}}}")
+
+        ptr_assignment_lines = [f"\tdbgvar_ptr[{i}] = (void *)&({v['C_path']});" for i, v in enumerate(DbgVariablesList)]
 
         # Read the debug template
         try:
@@ -151,9 +235,16 @@ class PLCF407VE_target(toolchain_b4arm):
                 }[v["vartype"]] % v
                 for v in VariablesList if '.' not in v["C_path"]]),
             "variable_decl_array": ",\n".join(variable_decl_array),
+            "type_desc_array": ",\n\t".join(type_desc_array),
             "retain_vardsc_index_array": ",\n".join(retain_indexes),
             "var_access_code": var_access_code,
-            "dbg_ptr_cnt": "\n".join(ptr_assignment_lines)
+            "dbg_ptr_init": "\n".join(ptr_assignment_lines),
+            "cycle_monitor": int(self.cycle_counter is not None),
+            "cycle_counter": self.cycle_counter or "0",
+            "cycle_counter_init": self.cycle_counter_init or "",
+            "cpu_hz": self.cpu_hz or 0,
+            "cycle_warn_percent": self._GetToolchainOption("CycleWarnPercent", 100),
+            "jitter_warn_percent": self._GetToolchainOption("JitterWarnPercent", 0)
         }
 
         # Write to the target file: plc_debug.c in the build directory
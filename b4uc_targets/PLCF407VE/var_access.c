@@ -1,80 +1,118 @@
 /******************************************************************************************************************
-* Modified the switch/case statements to if/else constructs to avoid reliance on compiler-specific 
-* functions like __gnu_thumb1_case_uhi. This change was necessary because acquiring and exporting 
-* the address of such functions to a dynamically linked PLC module using udynlink proved to be problematic.
+* Variable access through the type descriptor table dbgvartypes[], indexed by __IEC_types_enum. Each access is
+* a single table lookup instead of a chain of type comparisons. The former switch/case statements relied on
+* compiler-specific functions like __gnu_thumb1_case_uhi, which are problematic to export to a dynamically
+* linked PLC module using udynlink, and the table holds no pointers, so it needs no relocation either.
 ******************************************************************************************************************/
 
-#define __ReForceOutput_case_p(TYPENAME)                                         \
-	if (dsc->type == TYPENAME##_ENUM) {                                          \
-		((__IEC_##TYPENAME##_t *) value_p)->value   = *((TYPENAME *) val);       \
-		((__IEC_##TYPENAME##_t *) value_p)->flags  |= __IEC_FORCE_FLAG;          \
-	} else                                                                       \
-	if (dsc->type == TYPENAME##_P_ENUM) {                                        \
-		  ((__IEC_##TYPENAME##_p *)value_p)->value  = (TYPENAME *) val;          \
-		  ((__IEC_##TYPENAME##_p *)value_p)->flags |= __IEC_FORCE_FLAG;          \
-	} else                                                                       \
-	if (dsc->type == TYPENAME##_O_ENUM) {                                        \
-		*(((__IEC_##TYPENAME##_p *) value_p)->value) = *((TYPENAME *) val);      \
-		  ((__IEC_##TYPENAME##_p *) value_p)->flags |= __IEC_FORCE_FLAG;         \
-	} else
-
-// force var (type)
-#define __ForceVariable_case_t(TYPENAME)                                         \
-	if (vartype == TYPENAME##_ENUM) {                                            \
-		if(force) {                                                              \
-			((__IEC_##TYPENAME##_t *)varp)->flags |= __IEC_FORCE_FLAG;           \
-			((__IEC_##TYPENAME##_t *)varp)->value = *((TYPENAME *)val);          \
-		}                                                                        \
-		else                                                                     \
-			((__IEC_##TYPENAME##_t *)varp)->flags &= ~__IEC_FORCE_FLAG;          \
-	} else
-
-// force var (pointer)
-#define __ForceVariable_case_p(TYPENAME)                                         \
-	if (vartype == TYPENAME##_P_ENUM || vartype == TYPENAME##_O_ENUM) {          \
-		if(force) {                                                              \
-			((__IEC_##TYPENAME##_p *)varp)->flags |= __IEC_FORCE_FLAG;           \
-			if (vartype == TYPENAME##_P_ENUM)                                    \
-				((__IEC_##TYPENAME##_p *)varp)->value = (TYPENAME *)val;         \
-			if (vartype == TYPENAME##_O_ENUM)                                    \
-				*(((__IEC_##TYPENAME##_p *)varp)->value) = *((TYPENAME *)val);   \
-		}                                                                        \
-		else                                                                     \
-			((__IEC_##TYPENAME##_p *)varp)->flags &= ~__IEC_FORCE_FLAG;          \
-		                                                                         \
-	} else
+// get type descriptor, NULL for types not used in this project
+static inline const dbgvartype_t *GetVarType(__IEC_types_enum vartype)
+{
+	if ((size_t) vartype < sizeof(dbgvartypes) / sizeof(*dbgvartypes) && dbgvartypes[vartype].kind)
+		return &dbgvartypes[vartype];
+	return NULL;
+}
 
-// get var
-#define __Unpack_case_t(TYPENAME)                                                \
-	if (vartype == TYPENAME##_ENUM) {                                            \
-		if(flags) *flags = ((__IEC_##TYPENAME##_t *)varp)->flags;                \
-		if(value_p) *value_p = &((__IEC_##TYPENAME##_t *)varp)->value;           \
-		if(size) *size = sizeof(TYPENAME);                                       \
-	} else
+// force var
+static void ForceVar(void *varp, __IEC_types_enum vartype, bool force, void *val)
+{
+	const dbgvartype_t *type = GetVarType(vartype);
+	if (!type)
+		return;
 
-#define __Unpack_case_p(TYPENAME)                                                \
-	if (vartype == TYPENAME##_O_ENUM || vartype == TYPENAME##_P_ENUM) {          \
-		if(flags) *flags = ((__IEC_##TYPENAME##_p *)varp)->flags;                \
-		if(value_p) *value_p = ((__IEC_##TYPENAME##_p *)varp)->value;            \
-		if(size) *size = sizeof(TYPENAME);                                       \
-	} else
+	IEC_BYTE *flags = (IEC_BYTE *)varp + type->flags_offset;
+	if (force) {
+		*flags |= __IEC_FORCE_FLAG;
+		if (type->kind == DBG_VAR_T)
+			memcpy(varp, val, type->size);
+		else if (type->kind == DBG_VAR_P)
+			*(void **)varp = val;
+		else
+			memcpy(*(void **)varp, val, type->size);
+	}
+	else
+		*flags &= ~__IEC_FORCE_FLAG;
+}
 
 // string
 #define __Is_a_string(dsc) (dsc->type == STRING_ENUM)   ||                       \
 						   (dsc->type == STRING_P_ENUM) ||                       \
 						   (dsc->type == STRING_O_ENUM)
 
-#pragma GCC push_options
-#pragma GCC optimize("O0")
+// get var, the value is the first member of __IEC_<type>_t, __IEC_<type>_p holds a pointer to it
 static int UnpackVar(__Unpack_desc_type *dsc, void **value_p, char *flags, size_t *size)
 {
 	void *varp = dsc->ptr;
-	__IEC_types_enum vartype = dsc->type;
-	__ANY(__Unpack_case_t)
-	__ANY(__Unpack_case_p)
-	{
+	const dbgvartype_t *type = GetVarType(dsc->type);
+	if (!type)
 		return 1; // type not found
-	}
+
+	if(flags) *flags = *((IEC_BYTE *)varp + type->flags_offset);
+	if(value_p) *value_p = type->kind == DBG_VAR_T ? varp : *(void **)varp;
+	if(size) *size = type->size;
 	return 0;
 }
-#pragma GCC pop_options
\ No newline at end of file
+
+// deadband, compares as unsigned U to avoid overflows of signed T
+#define __Deadband_case(T, U)                                                         \
+	{                                                                                \
+		T a, b, d;                                                                   \
+		memcpy(&a, value, sizeof(T));                                                \
+		memcpy(&b, last, sizeof(T));                                                 \
+		memcpy(&d, deadband, sizeof(T));                                             \
+		return (a > b ? (U)a - (U)b : (U)b - (U)a) > (U)d;                           \
+	}
+
+// deadband of LREAL in single precision: one float subtraction, no software double arithmetic
+// on the FPU of the M4F. The values are rounded to 24 bits, so changes below about 1e-7 of the
+// value are not seen. Values out of the float range give inf or NaN and count as a change.
+#define __Deadband_float_case(T)                                                      \
+	{                                                                                \
+		T a, b, d;                                                                   \
+		memcpy(&a, value, sizeof(T));                                                \
+		memcpy(&b, last, sizeof(T));                                                 \
+		memcpy(&d, deadband, sizeof(T));                                             \
+		float diff = (float)a - (float)b;                                            \
+		return !(diff <= (float)d && -diff <= (float)d);                             \
+	}
+
+// check if value differs from last by more than deadband, numeric types only
+static bool ExceedsDeadband(const dbgvartype_t *type, const void *value, const void *last, const void *deadband)
+{
+	if (type->num == DBG_NUM_REAL && type->size == sizeof(float)) __Deadband_case(float, float)
+	if (type->num == DBG_NUM_REAL && type->size == sizeof(double)) __Deadband_float_case(double)
+	if (type->num == DBG_NUM_INT && type->size == 1) __Deadband_case(int8_t, uint8_t)
+	if (type->num == DBG_NUM_INT && type->size == 2) __Deadband_case(int16_t, uint16_t)
+	if (type->num == DBG_NUM_INT && type->size == 4) __Deadband_case(int32_t, uint32_t)
+	if (type->num == DBG_NUM_INT && type->size == 8) __Deadband_case(int64_t, uint64_t)
+	if (type->num == DBG_NUM_UINT && type->size == 1) __Deadband_case(uint8_t, uint8_t)
+	if (type->num == DBG_NUM_UINT && type->size == 2) __Deadband_case(uint16_t, uint16_t)
+	if (type->num == DBG_NUM_UINT && type->size == 4) __Deadband_case(uint32_t, uint32_t)
+	if (type->num == DBG_NUM_UINT && type->size == 8) __Deadband_case(uint64_t, uint64_t)
+	return true;
+}
+
+// compare
+#define __Compare_case(T)                                                             \
+	{                                                                                \
+		T x, y;                                                                      \
+		memcpy(&x, a, sizeof(T));                                                    \
+		memcpy(&y, b, sizeof(T));                                                    \
+		return (x > y) - (x < y);                                                    \
+	}
+
+// compare two values of a type, non numeric types compare bytewise
+static int CompareValue(const dbgvartype_t *type, const void *a, const void *b)
+{
+	if (type->num == DBG_NUM_REAL && type->size == sizeof(float)) __Compare_case(float)
+	if (type->num == DBG_NUM_REAL && type->size == sizeof(double)) __Compare_case(double)
+	if (type->num == DBG_NUM_INT && type->size == 1) __Compare_case(int8_t)
+	if (type->num == DBG_NUM_INT && type->size == 2) __Compare_case(int16_t)
+	if (type->num == DBG_NUM_INT && type->size == 4) __Compare_case(int32_t)
+	if (type->num == DBG_NUM_INT && type->size == 8) __Compare_case(int64_t)
+	if (type->num == DBG_NUM_UINT && type->size == 1) __Compare_case(uint8_t)
+	if (type->num == DBG_NUM_UINT && type->size == 2) __Compare_case(uint16_t)
+	if (type->num == DBG_NUM_UINT && type->size == 4) __Compare_case(uint32_t)
+	if (type->num == DBG_NUM_UINT && type->size == 8) __Compare_case(uint64_t)
+	return memcmp(a, b, type->size);
+}
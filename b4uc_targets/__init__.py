@@ -44,7 +44,13 @@ import util.paths as paths
 │	├── __script												# script directory
 │	│   ├── code_before_data.ld									# module linker file
 │	│   ├── mkmodule											# module generation script
+│	│   ├── bench_mkmodule										# mkmodule benchmark, debug output off/on
+│	│   ├── unpack_module										# reference module image reader (CRC check, decompression)
 │	│	├── rename_obj											# script to rename symbols in object files
+│	│	├── objcache.py											# object cache shared by all projects (and its CLI)
+│	│	├── pousplit.py											# split of POUS.c into one unit per POU
+│	│	├── sizereport.py										# size report of a module by POU, debugger and object
+│	│	├── cycleprofile.py										# program calls of a resource instrumented for the cycle profile
 │	│	└── matiec/												# matiec include files
 │	│		├── accessor.h
 │	│		├── iec_std_FB_no_ENENO.h
@@ -59,7 +65,9 @@ import util.paths as paths
 │	│   ├── PLCF407VE_main.c									# main c template file for target PLCF407VE
 │	│	├── var_access.c										# Variable access C file (switch to if changed)
 │	│	├── PLCF407VE__debug.c									# debugger code template
+│	│	├── PLCF407VE_profile.c									# cycle profile code template (CycleProfile option)
 │	│	├── beremiz.h											# Header file for extensions
+│	│	├── FPU_BENCH.st										# benchmark POU for the FloatABI option (paste into a project)
 │	│   └── (other .c files starting with "PLCF407VE_main")		# other C files for target PLCF407VE
 │	│
 │	├── target2/												# specific target2 directory
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Instrument the program calls of a resource generated by matiec for the cycle profile.
+#
+# <RES>_run__ calls the body of every program instance of the resource when its task is
+# due, e.g. PROGRAM0_body__(&INSTANCE0). The instrumented copy of the resource
+# (<resource>_prof.c, next to it as it includes POUS.c) reads the cycle counter before
+# every call and records the cycles of the call in the profile section of the instance:
+#   PLC_PROFILE_CALL(3, PROGRAM0_body__(&INSTANCE0));
+# PLC_PROFILE_CALL and plc_profile_record() come from the profile code of the target
+# (<target>_profile.c), the definitions are inserted before <RES>_run__, after all
+# includes, so the copy still starts with the precompiled header. The sections are
+# numbered from first_section on, the section names are <RES>.<INSTANCE>.
+#
+# Usage: cycleprofile RES0.c
+
+import os
+import re
+import sys
+
+_run_re = re.compile(r'^[ \t]*void[ \t]+(\w+)_run__[ \t]*\([^)]*\)\s*\{', re.MULTILINE)
+_call_re = re.compile(r'\b(\w+_body__)\(&(\w+)\);')
+
+_profile_prelude = """\
+/* Cycle profile of the program calls, see plc_profile.c */
+void plc_profile_record(unsigned int section, unsigned long start);
+#define PLC_PROFILE_CALL(section, call) do { \\
+    unsigned long __profile_start = PLC_PROFILE_CYCCNT; \\
+    call; \\
+    plc_profile_record(section, __profile_start); \\
+} while (0)
+
+"""
+
+def instrument_resource(resource_code, cyccnt, first_section=0):
+    """Instrument the program calls of <RES>_run__, cyccnt is the C expression of the cycle
+    counter. Returns (instrumented code, [section names]) or None if the code has no
+    program calls to instrument."""
+    run = _run_re.search(resource_code)
+    if run is None:
+        return None
+    depth, end = 1, None
+    for pos in range(run.end(), len(resource_code)):
+        if resource_code[pos] == "{":
+            depth += 1
+        elif resource_code[pos] == "}":
+            depth -= 1
+            if depth == 0:
+                end = pos
+                break
+    if end is None:
+        return None
+
+    resource = run.group(1)
+    names = []
+    def call(m):
+        names.append(f"{resource}.{m.group(2)}")
+        return f"PLC_PROFILE_CALL({first_section + len(names) - 1}, {m.group(0)[:-1]});"
+    body = _call_re.sub(call, resource_code[run.end():end])
+    if not names:
+        return None
+    prelude = f"#define PLC_PROFILE_CYCCNT ({cyccnt})\n" + _profile_prelude
+    return resource_code[:run.start()] + prelude + resource_code[run.start():run.end()] + body + resource_code[end:], names
+
+def write_instrumented_resource(resource_file, cyccnt, first_section=0):
+    """Write the instrumented copy of a resource file next to it. Returns (C file,
+    [section names]) or None if the file has no program calls. An unchanged copy is not
+    written again."""
+    try:
+        with open(resource_file, "r", encoding="utf-8") as f:
+            resource_code = f.read()
+    except IOError:
+        return None
+    result = instrument_resource(resource_code, cyccnt, first_section)
+    if result is None:
+        return None
+    code, names = result
+    c_file = f"{os.path.splitext(resource_file)[0]}_prof.c"
+    try:
+        with open(c_file, "r", encoding="utf-8") as f:
+            if f.read() == code:
+                return c_file, names
+    except IOError:
+        pass
+    with open(c_file, "w", encoding="utf-8") as f:
+        f.write(code)
+    return c_file, names
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit("Usage: cycleprofile RES0.c")
+    result = write_instrumented_resource(sys.argv[1], "*(volatile unsigned long *)0xE0001004")
+    if result is None:
+        sys.exit(f"{sys.argv[1]}: no program calls")
+    print(result[0])
+    print("\n".join(result[1]))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Content-addressed cache for compiled and symbol-renamed PLC objects.
+#
+# The cache is shared by all projects and build directories of a user. An object is
+# stored under a key built from everything that influences its content (preprocessed
+# source, compiler flags, compiler version, symbol rename tool version), so the same
+# translation unit is compiled only once, whichever project or branch it comes from.
+#
+# Usage: objcache [--cache-dir DIR] stats | prune [--max-size MB] | clear
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+def _user_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cache", "b4uc")
+
+def default_cache_dir():
+    return os.environ.get("B4UC_OBJCACHE_DIR") or os.path.join(_user_cache_dir(), "objcache")
+
+def default_pch_dir():
+    """Directory of the precompiled headers: inside $B4UC_OBJCACHE_DIR if the cache is
+    relocated (entries() only counts the objects), else next to the object cache."""
+    cache_dir = os.environ.get("B4UC_OBJCACHE_DIR")
+    return os.path.join(cache_dir, "pch") if cache_dir else os.path.join(_user_cache_dir(), "pch")
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "%d %s" % (size, unit)
+        size /= 1024
+    return "%.1f GB" % size
+
+class ObjectCache(object):
+    """Local object cache with size bounded LRU eviction.
+    Entries are stored as <dir>/<key[:2]>/<key>.o, the modification time of an entry
+    is its last use."""
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        """Build a cache key from strings, bytes or files (given as ('file', path))."""
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, tuple):
+                with open(part[1], "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+            else:
+                h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".o")
+
+    def get(self, key, dest):
+        """Copy the cached object to dest, returns False if the key is not cached."""
+        entry = self._entry(key)
+        try:
+            self._copy(entry, dest)
+            os.utime(entry)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, src):
+        """Store an object in the cache. Errors are ignored, the cache is only an optimization."""
+        try:
+            self._copy(src, self._entry(key))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _copy(src, dest):
+        # copy to a temporary file first, concurrent builds must never see half written objects
+        dest_dir = os.path.dirname(dest)
+        os.makedirs(dest_dir, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=dest_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, open(src, "rb") as s:
+                shutil.copyfileobj(s, f)
+            os.replace(temp, dest)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+    def entries(self):
+        """List all cache entries as (path, size, last use) tuples, least recently used first."""
+        result = []
+        if not os.path.isdir(self.cache_dir):
+            return result
+        for sub in os.listdir(self.cache_dir):
+            sub_dir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(sub_dir):
+                continue
+            for name in os.listdir(sub_dir):
+                if not name.endswith(".o"):
+                    continue
+                path = os.path.join(sub_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result.append((path, st.st_size, st.st_mtime))
+        result.sort(key=lambda e: e[2])
+        return result
+
+    def prune(self, max_size=None):
+        """Remove least recently used entries until the cache fits into max_size bytes.
+        Returns the number of removed entries and the size of the cache afterwards."""
+        max_size = self.max_size if max_size is None else max_size
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed, total
+
+    def clear(self):
+        """Remove all entries."""
+        return self.prune(0)
+
+    def stats(self):
+        """Get a short description of the cache content."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        text = "%s: %d objects, %s of %s" % (self.cache_dir, len(entries), format_size(total), format_size(self.max_size))
+        if entries:
+            text += ", oldest entry used %s" % time.strftime("%Y-%m-%d %H:%M", time.localtime(entries[0][2]))
+        return text
+
+################################################################################
+# Entry point
+################################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect and prune the b4uc object cache")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=None, help="Cache directory (default: $B4UC_OBJCACHE_DIR or ~/.cache/b4uc/objcache)")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("stats", help="Show number and size of cached objects")
+    prune_parser = commands.add_parser("prune", help="Remove least recently used objects")
+    prune_parser.add_argument("--max-size", dest="max_size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), help="Maximum cache size in MB")
+    commands.add_parser("clear", help="Remove all cached objects")
+    args = parser.parse_args()
+
+    cache = ObjectCache(args.cache_dir)
+    if args.command == "prune":
+        removed, total = cache.prune(args.max_size * 1024 * 1024)
+        print("Removed %d objects, %s left" % (removed, format_size(total)))
+    elif args.command == "clear":
+        removed, _ = cache.clear()
+        print("Removed %d objects" % removed)
+    else:
+        print(cache.stats())
+    sys.exit(0)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Split the POU code generated by matiec into one translation unit per POU.
+#
+# matiec writes all functions, function blocks and programs into POUS.c, which is not
+# compiled on its own but included by the resource file (#include "POUS.c" in RES0.c).
+# Compiling the resource is then the longest job of every build. The split writes:
+#   POUS_<pou>.c       what the resource has before #include "POUS.c" (std lib, accessor,
+#                      POUS.h, config header, common_ticktime__), then the code of one POU:
+#                      its static helper functions and its definitions (<pou>_init__ and
+#                      <pou>_body__ of function blocks and programs, <pou> of functions)
+#   <resource>_split.c the resource without the POU code
+# The units start like the resource, so they use the precompiled matiec header as well
+# (GCC only uses it for the first #include of the compiled file, not from a header).
+# All POU functions are extern and declared in POUS.h, the static helpers stay with the
+# POU using them, so the units link to the same module as the single resource. Code
+# which does not have this structure (e.g. preprocessor directives between POUs) is
+# not split.
+#
+# Usage: pousplit RES0.c
+
+import os
+import re
+import sys
+
+_include_pous_re = re.compile(r'^[ \t]*#[ \t]*include[ \t]*"POUS\.c"[ \t]*\n?', re.MULTILINE)
+_token_re = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/|^[ \t]*#(?:\\\n|[^\n])*|[{};]',
+                       re.DOTALL | re.MULTILINE)
+_comment_re = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_function_re = re.compile(r'(\w+)\s*\([^{};]*\)\s*$')
+
+def _top_level_items(code):
+    """Split C code into top-level items (kind, name, text): 'pp' for preprocessor lines,
+    'function' for function definitions, 'decl' for declarations ending with ';'. Comments
+    and blank lines go with the next item, trailing ones are returned as kind 'rest'."""
+    items = []
+    depth, start, header = 0, 0, ""
+    for m in _token_re.finditer(code):
+        token = m.group()
+        if token[0] in "\"'/":
+            continue
+        if token.lstrip().startswith("#"):
+            if depth == 0:
+                if _comment_re.sub("", code[start:m.start()]).strip():
+                    return None  # directive in the middle of a declaration
+                items.append(("pp", None, code[start:m.end() + 1]))
+                start = m.end() + 1
+            continue
+        if token == "{":
+            if depth == 0:
+                header = _comment_re.sub("", code[start:m.start()])
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth < 0:
+                return None
+            function = _function_re.search(header) if depth == 0 else None
+            if function:
+                items.append(("function", function.group(1), code[start:m.end()]))
+                start = m.end()
+        elif token == ";" and depth == 0:
+            items.append(("decl", None, code[start:m.end()]))
+            start = m.end()
+    if depth:
+        return None
+    items.append(("rest", None, code[start:]))
+    return items
+
+def _is_static(text):
+    return re.search(r'\bstatic\b', _comment_re.sub("", text)) is not None
+
+def _is_shareable(kind, text):
+    """Items which can be repeated in every unit: preprocessor lines, extern declarations
+    and prototypes."""
+    text = _comment_re.sub("", text).strip()
+    if kind == "pp" or not text:
+        return True
+    if kind != "decl":
+        return False
+    return text.startswith("extern ") or ("(" in text and "=" not in text)
+
+def split_pous(resource_code, pous_code):
+    """Split the POU code included by a resource. Returns (resource without the POU code,
+    [(POU name, unit code)]) or None if the code can't be split."""
+    include = _include_pous_re.search(resource_code)
+    if include is None:
+        return None
+    prelude = resource_code[:include.start()]
+    prelude_items = _top_level_items(prelude)
+    if prelude_items is None or not all(_is_shareable(kind, text) for kind, _name, text in prelude_items):
+        return None
+    items = _top_level_items(pous_code)
+    if items is None:
+        return None
+
+    unit_prelude = [prelude]
+    units, current = [], []
+    for kind, name, text in items:
+        if kind == "function":
+            current.append(text)
+            if not _is_static(text) and not name.endswith("_init__"):
+                units.append((name[:-len("_body__")] if name.endswith("_body__") else name, current))
+                current = []
+        elif not units and not current and _is_shareable(kind, text):
+            # directives and declarations before the first POU are seen by all POUs
+            unit_prelude.append(text)
+        elif kind == "rest" and not _comment_re.sub("", text).strip():
+            continue
+        else:
+            return None
+    if current or not units:
+        return None
+
+    names = [name for name, _code in units]
+    if len(set(name.upper() for name in names)) != len(names):
+        return None
+    prelude = "".join(unit_prelude).rstrip("\n") + "\n\n"
+    resource = resource_code[:include.start()] + resource_code[include.end():]
+    return resource, [(name, prelude + "".join(code).strip("\n") + "\n") for name, code in units]
+
+def _write_if_changed(file_path, content):
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except IOError:
+        pass
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def write_pou_units(resource_file):
+    """Split the POU code of a resource file into units next to it. Returns the C files
+    to compile instead of the resource, or None if it is not split. Unchanged files are
+    not written again."""
+    path = os.path.dirname(resource_file)
+    try:
+        with open(resource_file, "r", encoding="utf-8") as f:
+            resource_code = f.read()
+        if _include_pous_re.search(resource_code) is None:
+            return None
+        with open(os.path.join(path, "POUS.c"), "r", encoding="utf-8") as f:
+            pous_code = f.read()
+    except IOError:
+        return None
+    split = split_pous(resource_code, pous_code)
+    if split is None:
+        return None
+    resource, units = split
+    resource_split = f"{os.path.splitext(resource_file)[0]}_split.c"
+    _write_if_changed(resource_split, resource)
+    c_files = [resource_split]
+    for name, code in units:
+        c_file = os.path.join(path, f"POUS_{name}.c")
+        _write_if_changed(c_file, code)
+        c_files.append(c_file)
+    return c_files
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit("Usage: pousplit RES0.c")
+    c_files = write_pou_units(sys.argv[1])
+    if c_files is None:
+        sys.exit(f"{sys.argv[1]}: POU code not split")
+    print("\n".join(c_files))
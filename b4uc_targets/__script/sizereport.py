@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Size report of a PLC module: the bytes of .text, .data and .bss by owner.
+#
+# A symbol of the linked ELF belongs to the object defining it:
+#   POUS_<pou>.o    the POU (see pousplit)
+#   plc_debugger.o  "debugger": variable descriptors, subscription and trace buffers
+#   plc_main.o      "main"
+#   plc_profile.o   "profile": the cycle profile (CycleProfile option)
+#   <name>.o        <name>: configuration, resource, plugins
+# The program instances declared by a resource (<PROGRAM> <RES>__<INSTANCE>;) belong to
+# their program. Symbols of other objects (e.g. the single object of a unity build) are
+# given to a POU by the names matiec uses for function blocks and programs (<pou>_init__,
+# <pou>_body__). Bytes which are not part of a symbol (alignment, string literals) are
+# reported as "other". .data includes the constants, see code_before_data.ld, and the hot
+# data in fast memory is counted with .data and .bss.
+#
+# Usage: sizereport module.elf [object.o ...] [resource.c ...]
+
+import os
+import re
+import sys
+from udynlink_utils import ElfImage, get_symbols_in_elf
+
+SECTIONS = (".text", ".data", ".bss")
+_columns = {".text": 0, ".data": 1, ".bss": 2, ".fastdata": 1, ".fastbss": 2}
+OTHER = "other"
+
+_instance_re = re.compile(r'^[ \t]*(\w+)[ \t]+(\w+__\w+)[ \t]*;', re.MULTILINE)
+_pou_symbol_re = re.compile(r'^(\w+?)_(?:init|body)__$')
+_owners = {"plc_debugger": "debugger", "plc_main": "main", "plc_profile": "profile"}
+
+def get_object_owner(obj_file):
+    """Owner of the symbols defined by an object file."""
+    name = os.path.splitext(os.path.basename(obj_file))[0]
+    if name.startswith("POUS_"):
+        return name[len("POUS_"):]
+    return _owners.get(name, name)
+
+def get_symbol_owners(obj_files):
+    """Map the symbols defined by the objects to their owner."""
+    owners = {}
+    for obj_file in obj_files:
+        owner = get_object_owner(obj_file)
+        for name, sym in get_symbols_in_elf(obj_file).items():
+            if name and sym["type"] in ("STT_FUNC", "STT_OBJECT") and isinstance(sym["section"], int):
+                owners[name] = owner
+    return owners
+
+def get_program_instances(resource_code):
+    """Map the program instances declared by a resource to their program type."""
+    return {name: type_name for type_name, name in _instance_re.findall(resource_code)}
+
+def get_module_sizes(elf_file, owners=None, instances=None):
+    """Bytes of .text, .data and .bss by owner: {owner: [text, data, bss]}. Owners of
+    symbols without an entry in owners are found by name, then "other"."""
+    owners = owners or {}
+    instances = instances or {}
+    sizes = {}
+    with ElfImage(elf_file) as elf:
+        sections = {s.index: _columns[s.name] for s in elf.sections if s.name in _columns}
+        remaining = [0] * len(SECTIONS)
+        for s in elf.sections:
+            if s.name in _columns:
+                remaining[_columns[s.name]] += s.size
+        pous = set(_pou_symbol_re.sub(r'\1', name) for name in elf.symbols if _pou_symbol_re.match(name))
+        pous.update(owner for owner in owners.values() if owner not in _owners.values())
+        for name, sym in elf.symbols.items():
+            if sym["type"] not in ("STT_FUNC", "STT_OBJECT") or sym["section"] not in sections or not sym["size"]:
+                continue
+            owner = owners.get(name)
+            if instances.get(name) in pous:
+                owner = instances[name]
+            elif owner is None:
+                pou = _pou_symbol_re.match(name)
+                owner = pou.group(1) if pou else OTHER
+            index = sections[sym["section"]]
+            sizes.setdefault(owner, [0] * len(SECTIONS))[index] += sym["size"]
+            remaining[index] -= sym["size"]
+    if any(remaining):
+        other = sizes.setdefault(OTHER, [0] * len(SECTIONS))
+        for index, size in enumerate(remaining):
+            other[index] += max(0, size)
+    return sizes
+
+def format_size_report(sizes):
+    """Lines of the size report, the largest owners first, then the total."""
+    width = max([len(owner) for owner in sizes] + [len("total")])
+    lines = [f"{'':{width}}  {'.text':>8}  {'.data':>8}  {'.bss':>8}"]
+    for owner, size in sorted(sizes.items(), key=lambda item: (item[0] == OTHER, -sum(item[1]), item[0])):
+        lines.append(f"{owner:{width}}  {size[0]:8d}  {size[1]:8d}  {size[2]:8d}")
+    total = [sum(size[i] for size in sizes.values()) for i in range(len(SECTIONS))]
+    lines.append(f"{'total':{width}}  {total[0]:8d}  {total[1]:8d}  {total[2]:8d}")
+    return lines
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("Usage: sizereport module.elf [object.o ...] [resource.c ...]")
+    instances = {}
+    for c_file in [f for f in sys.argv[2:] if f.endswith(".c")]:
+        with open(c_file, "r", encoding="utf-8") as f:
+            instances.update(get_program_instances(f.read()))
+    owners = get_symbol_owners([f for f in sys.argv[2:] if f.endswith(".o")])
+    print("\n".join(format_size_report(get_module_sizes(sys.argv[1], owners, instances))))
@@ -1,12 +1,13 @@
 import os, sys
 import argparse
 import hashlib
-from elftools.elf.elffile import ELFFile
-from elftools.elf.relocation import RelocationSection
-from elftools.elf.sections import SymbolTableSection
-from elftools.elf.relocation import RelocationSection
-from elftools.elf.descriptions import describe_reloc_type
+import subprocess
+import mmap
+import struct
+from array import array
+from elftools.elf import enums
 import json
+import logging
 
 def to_json(obj):
     #print(json.dumps(data, indent=4))
@@ -74,20 +75,40 @@ def get_wrapped_name(n):
     s = hashlib.md5(n.encode('utf-8')).hexdigest()
     return "__%s__%s" % (s[:9], n)
 
+# Debug output goes through the 'udynlink' logger. Messages are formatted lazily,
+# only when debug output is enabled (see setup_logging), so debug calls in the
+# per-symbol and per-relocation loops cost nothing with --no-debug.
+log = logging.getLogger("udynlink")
+log.setLevel(logging.WARNING)
+log.propagate = False
+
+class _DebugFormatter(logging.Formatter):
+    def format(self, record):
+        return "%s %s" % (red("[debug]"), bold(record.getMessage(), getattr(record, "col", debug_col)))
+
+def setup_logging(args, stream = None):
+    if not log.handlers:
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(_DebugFormatter())
+        log.addHandler(handler)
+    log.setLevel(logging.WARNING if args.no_debug else logging.DEBUG)
+
+def debug_enabled():
+    return log.isEnabledFor(logging.DEBUG)
+
 debug_col = 'blue'
-def debug(msg, args, col = None):
-    if not args.no_debug:
-        col = col or debug_col
-        print("%s %s" % (red("[debug]"), bold(msg, col)))
+def debug(msg, *params, col = None):
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(msg, *params, extra = {"col": col or debug_col})
 
 def set_debug_col(col = None):
     global debug_col
     debug_col = col or 'blue'
 
-def print_list(l, header, args, col = None):
-    if l:
+def print_list(l, header, col = None):
+    if l and log.isEnabledFor(logging.DEBUG):
         col = col or debug_col
-        debug("%s %s" % (bold(header, col), bold(to_json(l), col)), args, col)
+        debug("%s %s", bold(header, col), bold(to_json(l), col), col = col)
 
 def round_to(n, sz):
     return (n + sz - 1) & ~(sz - 1);
@@ -110,28 +131,274 @@ def get_arg_parser(desc):
 # ELF manipulation
 ################################################################################
 
+def _reverse_enum(d):
+    return dict((v, k) for k, v in d.items() if k != "_default_")
+
+_st_type = _reverse_enum(enums.ENUM_ST_INFO_TYPE)
+_st_bind = _reverse_enum(enums.ENUM_ST_INFO_BIND)
+_st_visibility = _reverse_enum(enums.ENUM_ST_VISIBILITY)
+_st_shndx = _reverse_enum(enums.ENUM_ST_SHNDX)
+_reloc_types = {
+    3: _reverse_enum(enums.ENUM_RELOC_TYPE_i386),
+    40: _reverse_enum(enums.ENUM_RELOC_TYPE_ARM),
+    62: _reverse_enum(enums.ENUM_RELOC_TYPE_x64),
+    183: _reverse_enum(enums.ENUM_RELOC_TYPE_AARCH64),
+}
+
+SHT_SYMTAB, SHT_RELA, SHT_NOBITS, SHT_REL, SHT_DYNSYM = 2, 4, 8, 9, 11
+SHN_UNDEF = 0
+STB_LOCAL, STB_GLOBAL = 0, 1
+STT_OBJECT, STT_FUNC, STT_FILE = 1, 2, 4
+R_ARM_ABS32, R_ARM_THM_CALL, R_ARM_GOT_BREL, R_ARM_THM_JUMP24, R_ARM_TARGET1 = 2, 10, 26, 30, 38
+EF_ARM_ABI_FLOAT_SOFT, EF_ARM_ABI_FLOAT_HARD = 0x200, 0x400
+
+class ElfSection(object):
+    __slots__ = ("index", "name", "type", "flags", "addr", "offset", "size", "link", "info", "entsize")
+
+    def __init__(self, index, name, type, flags, addr, offset, size, link, info, entsize):
+        self.index, self.name, self.type, self.flags, self.addr = index, name, type, flags, addr
+        self.offset, self.size, self.link, self.info, self.entsize = offset, size, link, info, entsize
+
+# Relocations of an ELF file, stored in arrays: r_offset, type and symbol index,
+# plus the index of the symbol table section each relocation refers to and the index
+# of the section the relocation applies to
+class ElfRelocations(object):
+    def __init__(self):
+        self.offset = array("Q")
+        self.type = array("I")
+        self.sym = array("I")
+        self.symtab = array("H")
+        self.target = array("H")
+
+    def __len__(self):
+        return len(self.offset)
+
+# Symbols of all symbol tables of an ELF file, stored in arrays: value, size, st_info,
+# st_other and section index, in the order of the tables. 'index' maps a name to its row,
+# a name defined more than once refers to its last row (like the dict of get_symbols_in_elf).
+class ElfSymbols(object):
+    def __init__(self):
+        self.names = []
+        self.value = array("Q")
+        self.size = array("Q")
+        self.info = array("B")
+        self.other = array("B")
+        self.shndx = array("H")
+        self.index = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def type_name(self, i):
+        return _st_type.get(self.info[i] & 0xf, self.info[i] & 0xf)
+
+    # Row of a symbol as a dict in the format of get_symbols_in_elf
+    def describe(self, i):
+        info, other, shndx = self.info[i], self.other[i], self.shndx[i]
+        return {
+            "type": _st_type.get(info & 0xf, info & 0xf),
+            "bind": _st_bind.get(info >> 4, info >> 4),
+            "size": self.size[i],
+            "visibility": _st_visibility.get(other & 7, other & 7),
+            "section": _st_shndx.get(shndx, shndx),
+            "value": self.value[i],
+        }
+
+# ELF file reader. The file is mapped once, sections, symbols and relocations are
+# indexed on first use. Section data is returned as zero-copy memoryview slices
+# of the mapping, so the image must stay open as long as they are used.
+class ElfImage(object):
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        ident = self._map[:16]
+        check(ident[:4] == b"\x7fELF", "'%s' is not an ELF file" % path)
+        self.elfclass = 64 if ident[4] == 2 else 32
+        e = ">" if ident[5] == 2 else "<"
+        if self.elfclass == 32:
+            self._ehdr, self._shdr, self._sym = e + "HHIIIIIHHHHHH", e + "IIIIIIIIII", e + "IIIBBH"
+            self._rel, self._rela, self._sym_shift = e + "II", e + "IIi", 8
+        else:
+            self._ehdr, self._shdr, self._sym = e + "HHIQQQIHHHHHH", e + "IIQQQQIIQQ", e + "IBBHQQ"
+            self._rel, self._rela, self._sym_shift = e + "QQ", e + "QQq", 32
+        (_, self.machine, _, _, _, self._shoff, self.flags, _, _, _,
+         self._shentsize, self._shnum, self._shstrndx) = struct.unpack_from(self._ehdr, self._map, 16)
+        self._sections = None
+        self._section_names = None
+        self._symbols = None
+        self._symtab_rows = None
+        self._symtabs = {}
+        self._relocations = None
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass # section data still in use, the mapping is released with it
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _cstr(self, offset):
+        end = self._map.find(b"\0", offset)
+        return self._map[offset:end].decode("utf-8", "replace")
+
+    @property
+    def sections(self):
+        if self._sections is None:
+            shnum, shstrndx = self._shnum, self._shstrndx
+            raw = [struct.unpack_from(self._shdr, self._map, self._shoff)] if self._shoff else []
+            if raw and shnum == 0:
+                shnum = raw[0][5]
+            if raw and shstrndx == 0xffff:
+                shstrndx = raw[0][6]
+            raw += [struct.unpack_from(self._shdr, self._map, self._shoff + i * self._shentsize) for i in range(1, shnum)]
+            strtab = raw[shstrndx][4] if raw else 0
+            self._sections = [
+                ElfSection(i, self._cstr(strtab + h[0]), h[1], h[2], h[3], h[4], h[5], h[6], h[7], h[9])
+                for i, h in enumerate(raw)]
+            self._section_names = {}
+            for section in reversed(self._sections):
+                self._section_names[section.name] = section
+        return self._sections
+
+    def get_section(self, name):
+        self.sections
+        return self._section_names.get(name)
+
+    def section_data(self, section):
+        if section.type == SHT_NOBITS:
+            return memoryview(bytes(section.size))
+        return memoryview(self._map)[section.offset:section.offset + section.size]
+
+    def _symtab(self, index):
+        # (name, value, size, info, other, shndx) arrays of a symbol table section
+        if index not in self._symtabs:
+            section = self.sections[index]
+            strtab = self.sections[section.link].offset
+            count = section.size // section.entsize if section.entsize else 0
+            names, values, sizes = [], array("Q"), array("Q")
+            infos, others, shndxs = array("B"), array("B"), array("H")
+            for i in range(count):
+                if self.elfclass == 32:
+                    name, value, size, info, other, shndx = struct.unpack_from(self._sym, self._map, section.offset + i * section.entsize)
+                else:
+                    name, info, other, shndx, value, size = struct.unpack_from(self._sym, self._map, section.offset + i * section.entsize)
+                names.append(self._cstr(strtab + name) if name else "")
+                values.append(value)
+                sizes.append(size)
+                infos.append(info)
+                others.append(other)
+                shndxs.append(shndx)
+            self._symtabs[index] = (names, values, sizes, infos, others, shndxs)
+        return self._symtabs[index]
+
+    # All symbols found in the symbol tables as an ElfSymbols
+    @property
+    def symtab(self):
+        if self._symtab_rows is None:
+            rows = ElfSymbols()
+            for section in self.sections:
+                if section.type != SHT_SYMTAB and section.type != SHT_DYNSYM:
+                    continue
+                names, values, sizes, infos, others, shndxs = self._symtab(section.index)
+                first = len(rows.names)
+                rows.names += names
+                rows.value += values
+                rows.size += sizes
+                rows.info += infos
+                rows.other += others
+                rows.shndx += shndxs
+                rows.index.update(zip(names, range(first, first + len(names))))
+            self._symtab_rows = rows
+        return self._symtab_rows
+
+    # All symbols found in the symbol tables, by name (in the format of get_symbols_in_elf)
+    @property
+    def symbols(self):
+        if self._symbols is None:
+            rows = self.symtab
+            self._symbols = {name: rows.describe(i) for name, i in rows.index.items()}
+        return self._symbols
+
+    @property
+    def relocations(self):
+        if self._relocations is None:
+            rels = ElfRelocations()
+            for section in self.sections:
+                if section.type == SHT_REL:
+                    fmt = self._rel
+                elif section.type == SHT_RELA:
+                    fmt = self._rela
+                else:
+                    continue
+                size = struct.calcsize(fmt)
+                data = memoryview(self._map)[section.offset:section.offset + section.size - section.size % size]
+                for entry in struct.iter_unpack(fmt, data):
+                    sym = entry[1] >> self._sym_shift
+                    if sym == 0:
+                        continue
+                    rels.offset.append(entry[0])
+                    rels.type.append(entry[1] & ((1 << self._sym_shift) - 1))
+                    rels.sym.append(sym)
+                    rels.symtab.append(section.link)
+                    rels.target.append(section.info)
+                data.release()
+            self._relocations = rels
+        return self._relocations
+
+    def reloc_type_name(self, t):
+        names = _reloc_types.get(self.machine)
+        if names is None:
+            return "unrecognized: %-7x" % (t & 0xFFFFFFFF)
+        return names.get(t, "<unknown>")
+
+    # Relocations as (offset, type, name, value, section, defined) tuples: the type is the
+    # number of the relocation type (see reloc_type_name), section the name of the section
+    # the relocation applies to
+    def iter_relocation_entries(self):
+        rels, sections = self.relocations, self.sections
+        for i in range(len(rels)):
+            names, values, _, _, _, shndxs = self._symtab(rels.symtab[i])
+            sym = rels.sym[i]
+            yield (rels.offset[i], rels.type[i], names[sym] or sections[shndxs[sym]].name,
+                   values[sym], sections[rels.target[i]].name, shndxs[sym] != SHN_UNDEF)
+
+    # Relocations in the format of get_relocations_in_elf
+    def iter_relocations(self):
+        rels = self.relocations
+        for i in range(len(rels)):
+            names, values, _, _, _, shndxs = self._symtab(rels.symtab[i])
+            sym = rels.sym[i]
+            name = names[sym] if names[sym] else self.sections[shndxs[sym]].name
+            t = rels.type[i]
+            yield {
+                "offset": rels.offset[i],
+                "info": (sym << self._sym_shift) | t,
+                "type": self.reloc_type_name(t),
+                "name": name,
+                "value": values[sym],
+                "section": self.sections[rels.target[i]].name,
+                "defined": shndxs[sym] != 0,
+            }
+
+def _elf_image(obj):
+    return obj if isinstance(obj, ElfImage) else ElfImage(obj)
+
 # Iterate through the input ELF, returning all the symbols found
-# and the associated data
+# and the associated data. 'obj' is a file name or an ElfImage.
 def get_symbols_in_elf(obj):
-    syms = {}
-    with open(obj, "rb") as f:
-        elf = ELFFile(f)
-        for section in elf.iter_sections():
-            if not isinstance(section, SymbolTableSection):
-                continue
-            for symbol in section.iter_symbols():
-                sdata = {}
-                sdata["type"] = symbol['st_info']['type']
-                sdata["bind"] = symbol['st_info']['bind']
-                sdata["size"] = symbol['st_size']
-                sdata["visibility"] = symbol['st_other']['visibility']
-                sdata["section"] = symbol['st_shndx']
-                try:
-                    sdata["section"] = int(sdata["section"])
-                except:
-                    pass
-                sdata["value"] = int(symbol['st_value'])
-                syms[str(symbol.name)] = sdata
+    elf = _elf_image(obj)
+    syms = elf.symbols
+    if elf is not obj:
+        elf.close()
     return syms
 
 # TODO: also consider weak functions here?
@@ -141,45 +408,218 @@ def get_public_functions_in_object(obj):
 def get_local_symbols_in_object(obj):
     return [s for s, d in get_symbols_in_elf(obj).items() if d["bind"] == "STB_LOCAL" and s.startswith(".")]
 
-def get_relocations_in_elf(obj):
-    rels = []
-    with open(obj, "rb") as f:
-        elf = ELFFile(f)
-        for section in elf.iter_sections():
-            if not isinstance(section, RelocationSection):
+# Names of the symbols exported by a module linked from 'obj': its defined global
+# symbols, as mkmodule puts them in the symbol table. 'obj' is a file name or an ElfImage.
+def get_exported_symbols(obj):
+    elf = _elf_image(obj)
+    symtab = elf.symtab
+    exported = [s for s, i in symtab.index.items() if s and s != "$t" and s != "$d"
+                and symtab.info[i] >> 4 == STB_GLOBAL and symtab.shndx[i] != SHN_UNDEF]
+    if elf is not obj:
+        elf.close()
+    return exported
+
+def get_local_name(n, f):
+    return "__%s__%s" % (f, n)
+
+# Name of an object in the renamed local symbols: its file name and a hash of its path
+# relative to 'base', so objects with the same file name from different directories
+# (e.g. a POU unit and an extension file) get different symbols. Independent of 'base'
+# itself, the names don't change when the build directory moves.
+def get_object_name(obj, base = None):
+    path = os.path.relpath(obj, base) if base else obj
+    s = hashlib.md5(path.replace(os.sep, "/").encode('utf-8')).hexdigest()
+    return "%s_%s" % (os.path.basename(obj), s[:8])
+
+# Rename the local symbols of an object file in place, so they can't clash with the
+# local symbols of other objects in the module. All symbols are renamed by a single
+# objcopy run with a --redefine-syms file, objcopy is not run at all if there is nothing
+# to rename. 'name' is the object name used in the new symbol names (default: obj).
+# Returns the {old name: new name} mapping, raises RuntimeError if objcopy fails.
+def rename_local_symbols(obj, name = None, objcopy = "arm-none-eabi-objcopy", public_symbols = None):
+    local_syms = [s for s in get_local_symbols_in_object(obj) if not public_symbols or s in public_symbols or s == "__init_array"]
+    sym_renames = {n: get_local_name(n, name or obj) for n in local_syms}
+    if not sym_renames:
+        return sym_renames
+    syms_file = obj + ".syms"
+    with open(syms_file, "w") as f:
+        for n in sym_renames:
+            f.write("%s %s\n" % (n, sym_renames[n]))
+    try:
+        res = subprocess.run([objcopy, "--redefine-syms=" + syms_file, obj], stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+    finally:
+        os.remove(syms_file)
+    if res.returncode != 0:
+        raise RuntimeError(res.stdout.decode(errors = "replace").strip() or "%s failed on '%s'" % (objcopy, obj))
+    return sym_renames
+
+# Copy an object file to 'out' with the sections of the given variables moved to the fast
+# data sections: .data.<sym> to .fastdata.<sym>, .bss.<sym> to .fastbss.<sym> (the object
+# is compiled with -fdata-sections, one section per variable). Constants stay in .rodata.
+# Returns the {symbol: new section name} mapping, nothing is written if it is empty.
+# Raises RuntimeError if objcopy fails.
+def place_fast_data(obj, out, symbols, objcopy = "arm-none-eabi-objcopy"):
+    moves = {}
+    with ElfImage(obj) as elf:
+        for s, d in elf.symbols.items():
+            if s not in symbols or d["type"] != "STT_OBJECT" or not isinstance(d["section"], int):
                 continue
-            symtable = elf.get_section(section['sh_link'])
-            for rel in section.iter_relocations():
-                if rel['r_info_sym'] == 0:
-                    continue
-                rdata = {}
-                rdata["offset"] = int(rel['r_offset'])
-                rdata["info"] = rel['r_info']
-                rdata["type"] = describe_reloc_type(rel['r_info_type'], elf)
-                symbol = symtable.get_symbol(rel['r_info_sym'])
-                if symbol['st_name'] == 0:
-                    symsec = elf.get_section(symbol['st_shndx'])
-                    rdata["name"] = str(symsec.name)
-                else:
-                    rdata["name"] = str(symbol.name)
-                rdata["value"] = symbol["st_value"]
-                rels.append(rdata)
+            name = elf.sections[d["section"]].name
+            for prefix in (".data.", ".bss."):
+                if name == prefix + s:
+                    moves[s] = (name, ".fast" + name[1:])
+    if not moves:
+        return {}
+    cmd = [objcopy] + ["--rename-section=%s=%s" % move for move in moves.values()] + [obj, out]
+    res = subprocess.run(cmd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
+    if res.returncode != 0:
+        raise RuntimeError(res.stdout.decode(errors = "replace").strip() or "%s failed on '%s'" % (objcopy, obj))
+    return {s: move[1] for s, move in moves.items()}
+
+def get_relocations_in_elf(obj):
+    elf = _elf_image(obj)
+    rels = list(elf.iter_relocations())
+    if elf is not obj:
+        elf.close()
     return rels
 
 def get_section_in_elf(obj, section_name):
+    elf = _elf_image(obj)
+    section = elf.get_section(section_name)
+    if section is None:
+        error("Section '%s' not found" % section_name)
     sect = {}
-    with open(obj, "rb") as f:
-        elf = ELFFile(f)
-        for i, section in enumerate(elf.iter_sections()):
-            if section.name == section_name:
-                sect["name"] = section_name
-                sect["addr"] = int(section['sh_addr'])
-                sect["offset"] = int(section['sh_offset'])
-                sect["size"] = int(section['sh_size'])
-                sect["data"] = section.data()
-                sect["index"] = i
-                check(len(sect["data"]) == sect["size"], "Section '%s' real and declared data are different" % section_name)
-                break
-        else:
-            error("Section '%s' not found" % section_name)
+    sect["name"] = section_name
+    sect["addr"] = section.addr
+    sect["offset"] = section.offset
+    sect["size"] = section.size
+    sect["data"] = elf.section_data(section)
+    sect["index"] = section.index
+    check(len(sect["data"]) == sect["size"], "Section '%s' real and declared data are different" % section_name)
+    if elf is not obj:
+        # the image is closed, return a copy of the data
+        data, sect["data"] = sect["data"], sect["data"].tobytes()
+        data.release()
+        elf.close()
     return sect
+
+################################################################################
+# Module image compression (LZ4 block format)
+################################################################################
+
+# A compressed image holds code and data as a single LZ4 block. Matches reach at most
+# 'window' bytes back, so a streaming decoder on the target needs a ring buffer of that
+# size only (or none when it decompresses straight into the RAM of the module).
+
+UDLM_SIGN = b"UDLM"
+UDLX_SIGN = b"UDLX"         # extended header, a flags word follows the CRC
+UDLX_COMPRESSED = 0x1       # code and data are one LZ4 block
+UDLX_FIXED_LOAD = 0x2       # no LOT, relocated once at load time (see mkmodule)
+UDLX_FLOAT_ABI = 0xC        # float ABI of the code, the loader refuses ABIs its CPU can't run
+UDLX_FLOAT_SOFTFP = 0x4     # FPU instructions, float arguments in core registers
+UDLX_FLOAT_HARD = 0x8       # FPU instructions, float arguments in FPU registers
+UDLX_FAST_DATA = 0x10       # hot data for fast memory (CCM), its sizes follow the flags word
+
+# Header of a module image: dict with the flags, the sizes of the fast data and the header
+# fields (see mkmodule)
+_module_header = struct.Struct("<HHIIII")
+_fast_data_header = struct.Struct("<II")
+def read_module_header(bin_name):
+    with open(bin_name, "rb") as f:
+        sign = f.read(4)
+        if sign not in (UDLM_SIGN, UDLX_SIGN):
+            raise ValueError("'%s' is not a module image" % bin_name)
+        f.read(4)  # crc32
+        flags = int.from_bytes(f.read(4), byteorder='little') if sign == UDLX_SIGN else 0
+        fast = _fast_data_header.unpack(f.read(_fast_data_header.size)) if flags & UDLX_FAST_DATA else (0, 0)
+        fields = _module_header.unpack(f.read(_module_header.size))
+    return dict(zip(("flags", "fastdatasize", "fastbsssize", "totlot", "totrels", "symtsize", "codesize", "datasize", "bsssize"),
+                    (flags,) + fast + fields))
+
+LZ4_MIN_MATCH = 4
+LZ4_LAST_LITERALS = 5   # the last 5 bytes are always literals
+LZ4_MF_LIMIT = 12       # the last match starts at least 12 bytes before the end
+LZ4_MAX_WINDOW = 0xFFFF
+
+def _lz4_length(out, n):
+    while n >= 255:
+        out.append(255)
+        n -= 255
+    out.append(n)
+
+def _lz4_sequence(out, literals, offset = 0, match_len = 0):
+    lit_len = len(literals)
+    match_code = match_len - LZ4_MIN_MATCH if offset else 0
+    out.append((min(lit_len, 15) << 4) | min(match_code, 15))
+    if lit_len >= 15:
+        _lz4_length(out, lit_len - 15)
+    out += literals
+    if offset:
+        out += offset.to_bytes(2, byteorder='little')
+        if match_code >= 15:
+            _lz4_length(out, match_code - 15)
+
+def lz4_compress(data, window = LZ4_MAX_WINDOW):
+    data = bytes(data)
+    n = len(data)
+    window = min(window, LZ4_MAX_WINDOW)
+    out = bytearray()
+    last_pos = {}
+    anchor = pos = 0
+    while pos <= n - LZ4_MF_LIMIT:
+        key = data[pos:pos + LZ4_MIN_MATCH]
+        cand = last_pos.get(key)
+        last_pos[key] = pos
+        if cand is None or pos - cand > window:
+            pos += 1
+            continue
+        match_len = LZ4_MIN_MATCH
+        end = n - LZ4_LAST_LITERALS
+        while pos + match_len < end and data[cand + match_len] == data[pos + match_len]:
+            match_len += 1
+        _lz4_sequence(out, data[anchor:pos], pos - cand, match_len)
+        pos += match_len
+        anchor = pos
+    _lz4_sequence(out, data[anchor:])
+    return bytes(out)
+
+def _lz4_read_length(data, pos, n):
+    if n == 15:
+        while True:
+            b = data[pos]
+            pos += 1
+            n += b
+            if b != 255:
+                break
+    return n, pos
+
+def lz4_decompress(data, size):
+    # reference decoder for tests, raises ValueError on corrupted input
+    out = bytearray()
+    pos = 0
+    try:
+        while True:
+            token = data[pos]
+            pos += 1
+            lit_len, pos = _lz4_read_length(data, pos, token >> 4)
+            out += data[pos:pos + lit_len]
+            pos += lit_len
+            if pos >= len(data):
+                break
+            offset = data[pos] | (data[pos + 1] << 8)
+            pos += 2
+            match_len, pos = _lz4_read_length(data, pos, token & 15)
+            match_len += LZ4_MIN_MATCH
+            if offset == 0 or offset > len(out):
+                raise ValueError("LZ4 match offset out of range")
+            start = len(out) - offset
+            if offset >= match_len:
+                out += out[start:start + match_len]
+            else:
+                for i in range(match_len):
+                    out.append(out[start + i])
+    except IndexError:
+        raise ValueError("LZ4 block truncated")
+    if len(out) != size:
+        raise ValueError("LZ4 block size mismatch (0x%X instead of 0x%X)" % (len(out), size))
+    return bytes(out)
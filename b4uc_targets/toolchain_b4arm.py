@@ -31,17 +31,47 @@
 #***********************************************************************************/
 
 import os
+import sys
+import re
+import json
 import hashlib
 import glob
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Event
 from typing import Callable, Optional
 from util.ProcessLogger import ProcessLogger
+from b4uc_connector.BlockManifest import WriteBlockManifest
+from b4uc_connector.CycleProfile import WriteCycleProfileNames, SECTION_NAMES, PROFILE_SUFFIX
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "__script"))
+from objcache import ObjectCache, default_pch_dir
+from pousplit import write_pou_units
+from cycleprofile import write_instrumented_resource
+from sizereport import get_symbol_owners, get_program_instances, get_module_sizes, format_size_report
+from udynlink_utils import rename_local_symbols, get_object_name, read_module_header, get_symbols_in_elf, get_exported_symbols, place_fast_data, UDLX_FAST_DATA
+
+_include_re = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+_first_include_re = re.compile(r'^(?:\s|//[^\n]*|/\*.*?\*/)*#\s*include\s*"([^"]+)"', re.DOTALL)
+_pch_header = "iec_std_lib.h"  # includes all other matiec runtime headers
+_pch_keep = 8  # precompiled headers kept for other compiler/flag combinations
+_rte_objects = ("plc_main.o", "plc_debugger.o", "plc_profile.o")  # define the symbols used by the RTE
 
 class toolchain_b4arm(object):
     extension: Optional[str] = None
     target: Optional[str] = None
+    cpu: Optional[str] = None   # -mcpu of the target, needed for FPU code
+    fpu: Optional[str] = None   # -mfpu of the target, None if it has no FPU
+    fast_memory: Optional[int] = None  # bytes of fast data memory (CCM) for HotData, None if it has none
+    cycle_counter: Optional[str] = None  # C expression of the CPU cycle counter (cycle monitor, CycleProfile)
+    cycle_counter_init: Optional[str] = None  # C statements starting the cycle counter, None if it runs anyway
+    cpu_hz: Optional[int] = None  # frequency of the cycle counter
+    module_exports: tuple = ()  # symbols the RTE resolves in the module
+    profile_exports: tuple = ()  # symbols the RTE resolves in addition with the CycleProfile option
     Generate_plc_main: Callable
     Generate_plc_debugger: Callable
+    Generate_plc_profile: Callable
 
     def __init__(self, CTRInstance):
         self.CTRInstance = CTRInstance
@@ -49,10 +79,11 @@ class toolchain_b4arm(object):
         # Define compiler and linker paths
         self.compiler = 'arm-none-eabi-gcc'
         self.linker = 'arm-none-eabi-gcc'
+        self.objcopy = 'arm-none-eabi-objcopy'
         # Define script paths
         self.ld_script = os.path.join(base_folder,"__script/code_before_data.ld")
         self.mkmodule = os.path.join(base_folder,"__script/mkmodule")
-        self.rensym = os.path.join(base_folder,"__script/rename_obj")
+        self.udynlink_utils = os.path.join(base_folder,"__script/udynlink_utils.py")
         self.matiec_inc_path = os.path.join(base_folder,"__script/matiec")
 
         self.buildpath = None
@@ -66,6 +97,10 @@ class toolchain_b4arm(object):
         self.plc_main_code = ""
         self.plc_debug_code = ""
         self.md5key = None
+        self.objcache = None
+        self.compiler_version = None
+        self.unity_failed = False
+        self.cycle_profile = False
 
     def log(self, message):
         """Write a log message."""
@@ -101,6 +136,412 @@ class toolchain_b4arm(object):
             except Exception:
                 return None
 
+    def _GetSrcMD5FileName(self):
+        """Get the filename for the source hashes of the last build."""
+        return os.path.join(self.buildpath, "lastbuildPLC.srcmd5")
+
+    def _LoadSrcMD5(self):
+        """Load the source hashes of the last build."""
+        try:
+            with open(self._GetSrcMD5FileName(), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except Exception:
+            return {}
+
+    def _SaveSrcMD5(self):
+        """Save the source hashes of the current build."""
+        try:
+            with open(self._GetSrcMD5FileName(), "w", encoding="utf-8") as file:
+                json.dump(self.srcmd5, file, indent=1, sort_keys=True)
+        except IOError as e:
+            self.log_err(f"Cannot write source hashes: {e}")
+
+    def _GetObjectKey(self, obj_file):
+        """Get the key of an object in the source hashes: its path relative to the build
+        path, objects with the same file name from different directories get different keys."""
+        return os.path.relpath(obj_file, self.buildpath).replace(os.sep, "/")
+
+    def _GetSourceMD5(self, CFile, flags, file_cache):
+        """Get the hash of a C file, its compile flags and all headers it includes with #include "...".
+        Headers are searched next to the including file, then in the matiec include path.
+        file_cache maps already read files to (digest, included headers) for the current build."""
+        md5 = hashlib.md5(flags.encode())
+        pending, seen = [CFile], set()
+        while pending:
+            file_path = pending.pop()
+            if file_path in seen:
+                continue
+            seen.add(file_path)
+            if file_path not in file_cache:
+                try:
+                    with open(file_path, "rb") as file:
+                        content = file.read()
+                except IOError:
+                    # a missing header will be reported by the compiler
+                    file_cache[file_path] = ("", [])
+                else:
+                    includes = []
+                    for include in _include_re.findall(content.decode("utf-8", "replace")):
+                        for inc_path in (os.path.dirname(file_path), self.matiec_inc_path):
+                            candidate = os.path.join(inc_path, include)
+                            if os.path.exists(candidate):
+                                includes.append(candidate)
+                                break
+                    file_cache[file_path] = (hashlib.md5(content).hexdigest(), includes)
+            digest, includes = file_cache[file_path]
+            md5.update(f"{os.path.basename(file_path)}:{digest}\n".encode())
+            pending.extend(sorted(includes, reverse=True))
+        return md5.hexdigest()
+
+    def _GetToolchainOption(self, name, default):
+        """Get an option of the b4arm toolchain configuration."""
+        try:
+            value = getattr(self.CTRInstance.GetTarget().getcontent(), f"get{name}")()
+        except Exception:
+            return default
+        return default if value is None else value
+
+    def _GetFloatFlags(self):
+        """Get the compiler flags of the FloatABI option, empty for soft float."""
+        abi = self._GetToolchainOption("FloatABI", "soft")
+        if abi == "soft":
+            return ""
+        if self.fpu is None:
+            self.log_err(f"Target {self.target} has no FPU, FloatABI {abi} ignored")
+            return ""
+        return f"-mcpu={self.cpu} -mfpu={self.fpu} -mfloat-abi={abi}"
+
+    def _GetTranslationUnits(self, CFile):
+        """Get the C files to compile for CFile: the resource without the POU code and one
+        unit per POU if CFile includes POUS.c and SplitPOUs is set, else CFile itself."""
+        if not self._GetToolchainOption("SplitPOUs", True):
+            return [CFile]
+        c_files = write_pou_units(CFile)
+        if c_files is None:
+            return [CFile]
+        self.log(f"   [SPLIT]  {os.path.basename(CFile)} -> {len(c_files) - 1} POU units")
+        return c_files
+
+    def _WriteUnitySource(self, sources):
+        """Write the unity source including all sources, returns its file name. The POU and
+        configuration code comes first, so the calls of the main and debugger code go to
+        functions defined before and are compiled as short calls despite -mlong-calls."""
+        generated = ("plc_main.c", "plc_debugger.c")
+        ordered = [src for src in sources if os.path.basename(src) not in generated] + \
+                  [src for src in sources if os.path.basename(src) in generated]
+        unity_file = os.path.join(self.buildpath, "plc_unity.c")
+        content = "/* Unity build of the PLC code, generated by the b4arm toolchain */\n"
+        # the precompiled header is only used for the first include of the unit
+        try:
+            with open(ordered[0], "r", encoding="utf-8") as file:
+                first_include = _first_include_re.match(file.read())
+        except (IOError, IndexError):
+            first_include = None
+        if first_include and first_include.group(1) == _pch_header:
+            content += f'#include "{_pch_header}"\n'
+        content += "".join(f'#include "{os.path.relpath(src, self.buildpath)}"\n' for src in ordered)
+        try:
+            with open(unity_file, "r", encoding="utf-8") as file:
+                if file.read() == content:
+                    return unity_file
+        except IOError:
+            pass
+        with open(unity_file, "w", encoding="utf-8") as file:
+            file.write(content)
+        return unity_file
+
+    def _GetSizesFileName(self):
+        """Get the filename for the module sizes of the last separate and unity builds."""
+        return os.path.join(self.buildpath, "lastbuildPLC.sizes")
+
+    def _LogModuleSize(self, mode):
+        """Log the size of the module built in mode ("separate" or "unity") and compare it
+        with the last build in the other mode."""
+        try:
+            header = read_module_header(self.plc_path)
+        except Exception:
+            return
+        sizes = {}
+        try:
+            with open(self._GetSizesFileName(), "r", encoding="utf-8") as file:
+                sizes = json.load(file)
+        except Exception:
+            pass
+        sizes[mode] = header
+        try:
+            with open(self._GetSizesFileName(), "w", encoding="utf-8") as file:
+                json.dump(sizes, file, indent=1, sort_keys=True)
+        except IOError:
+            pass
+
+        fast = ""
+        if header["flags"] & UDLX_FAST_DATA:
+            fast = f", fast data {header['fastdatasize']}, fast bss {header['fastbsssize']}"
+        self.log(f"   [SIZE]  {mode} build: code {header['codesize']}, data {header['datasize']}, "
+                 f"bss {header['bsssize']}{fast} bytes, {header['totlot']} LOT entries")
+        other_mode = "separate" if mode == "unity" else "unity"
+        other = sizes.get(other_mode)
+        if other:
+            def change(name):
+                delta = header[name] - other[name]
+                percent = f" ({100.0 * delta / other[name]:+.1f}%)" if other[name] else ""
+                return f"{delta:+d}{percent}"
+            # every LOT entry is an indirect access through r9 in the scan cycle
+            self.log(f"   [SIZE]  compared to the last {other_mode} build: code {change('codesize')} bytes, "
+                     f"data {change('datasize')} bytes, LOT entries {change('totlot')}")
+
+    def _GetModuleExports(self):
+        """Get the symbols the RTE resolves in the module, they must be exported by it."""
+        return self.module_exports + (self.profile_exports if self.cycle_profile else ())
+
+    def _GetLinkRoots(self, obj_files):
+        """Get the symbols kept by the garbage collection of the linker: the module exports of
+        the target and the global symbols of the main and debugger code. Without these
+        objects (unity build) all global symbols."""
+        rte_files = [obj_file for obj_file in obj_files if os.path.basename(obj_file) in _rte_objects]
+        roots = set(self._GetModuleExports())
+        for obj_file in rte_files or obj_files:
+            roots.update(name for name, sym in get_symbols_in_elf(obj_file).items()
+                         if sym["bind"] == "STB_GLOBAL" and sym["type"] in ("STT_FUNC", "STT_OBJECT")
+                         and isinstance(sym["section"], int))
+        return sorted(roots)
+
+    def _GetProgramInstances(self, sources):
+        """Get the program instances declared by the resources: {instance: program}."""
+        instances = {}
+        for CFile in sources:
+            try:
+                with open(CFile, "r", encoding="utf-8") as file:
+                    instances.update(get_program_instances(file.read()))
+            except IOError:
+                pass
+        return instances
+
+    def _GetHotData(self, sources):
+        """Get the variables of the HotData option, {name: symbols}: a program stands for its
+        instances, other names for global variables (also in matiec upper case). Empty if
+        the option is not set or the module can't have fast data."""
+        names = [name for name in re.split(r'[\s,;]+', self._GetToolchainOption("HotData", "")) if name]
+        if not names:
+            return {}
+        if self.fast_memory is None:
+            self.log_err(f"Target {self.target} has no fast data memory, HotData ignored")
+            return {}
+        if not self._GetToolchainOption("FixedLoad", False):
+            self.log_err("HotData needs FixedLoad, ignored")
+            return {}
+        instances = self._GetProgramInstances(sources)
+        hot = {}
+        for name in names:
+            hot[name] = {name, name.upper()} | {instance for instance, program in instances.items()
+                                               if program == name.upper()}
+        return hot
+
+    def _PlaceHotData(self, obj_files, hot):
+        """Get the objects to link, with the HotData variables moved to the fast data sections
+        in copies (<object>.hot.o), the compiled objects stay unchanged. None on error."""
+        symbols = set().union(*hot.values())
+        link_files, placed = [], set()
+        for obj_file in obj_files:
+            hot_file = f"{os.path.splitext(obj_file)[0]}.hot.o"
+            try:
+                moved = place_fast_data(obj_file, hot_file, symbols, self.objcopy)
+            except Exception as e:
+                self.log_err(f"Placement of the hot data of {os.path.basename(obj_file)} failed: {e}")
+                return None
+            for symbol, section in sorted(moved.items()):
+                self.log(f"   [HOT]  {symbol} -> {section}")
+            placed.update(moved)
+            link_files.append(hot_file if moved else obj_file)
+        for name, names in hot.items():
+            if not names & placed:
+                self.CTRInstance.logger.write_warning(f"HotData: no variable found for '{name}'\n")
+        return link_files
+
+    def _GetCycleProfile(self):
+        """Get the CycleProfile option, False if the target has no cycle counter."""
+        if not self._GetToolchainOption("CycleProfile", False):
+            return False
+        if self.cycle_counter is None or not hasattr(self, "Generate_plc_profile"):
+            self.log_err(f"Target {self.target} has no cycle counter, CycleProfile ignored")
+            return False
+        return True
+
+    def _AddCycleProfile(self, sources):
+        """Get the sources with the program calls of the resources instrumented and the profile
+        code, the section names are written next to the binary for the IDE. None on error."""
+        names = list(SECTION_NAMES)
+        profiled = []
+        for CFile in sources:
+            result = write_instrumented_resource(CFile, self.cycle_counter, len(names))
+            if result is None:
+                profiled.append(CFile)
+                continue
+            c_file, calls = result
+            self.log(f"   [PROF]  {os.path.basename(CFile)} -> {os.path.basename(c_file)}, {len(calls)} program calls")
+            profiled.append(c_file)
+            names.extend(calls)
+        profile_file = self.Generate_plc_profile(names)
+        if profile_file is None:
+            return None
+        try:
+            WriteCycleProfileNames(self.plc_path, names)
+        except IOError as e:
+            self.log_err(f"Cannot write the cycle profile sections: {e}")
+            return None
+        return profiled + [profile_file]
+
+    def _LogSizeReport(self, obj_files, sources):
+        """Log the bytes of .text, .data and .bss of the module by POU, debugger and object."""
+        instances = self._GetProgramInstances(sources)
+        try:
+            sizes = get_module_sizes(self.elf_path, get_symbol_owners(obj_files), instances)
+        except Exception as e:
+            self.log(f"   [SIZE]  no size report ({e})")
+            return
+        for line in format_size_report(sizes):
+            self.log(f"   [SIZE]  {line}")
+
+    def _CheckSizeBudget(self):
+        """Check the module against the CodeBudget, DataBudget and BssBudget options (bytes,
+        0 = no limit) and its fast data against the fast memory of the target. Returns False
+        and logs the exceeded budgets if it does not fit."""
+        try:
+            header = read_module_header(self.plc_path)
+        except Exception:
+            return True
+        fits = True
+        for option, field, name in (("CodeBudget", "codesize", "Code"),
+                                    ("DataBudget", "datasize", "Data"),
+                                    ("BssBudget", "bsssize", "BSS")):
+            budget = self._GetToolchainOption(option, 0)
+            if budget > 0 and header[field] > budget:
+                self.log_err(f"{name} size of {self.plc_file} is {header[field]} bytes, "
+                             f"{header[field] - budget} bytes over the {option} of {budget} bytes.")
+                fits = False
+        fast_size = header["fastdatasize"] + header["fastbsssize"]
+        if fast_size and self.fast_memory is not None and fast_size > self.fast_memory:
+            self.log_err(f"Hot data of {self.plc_file} is {fast_size} bytes, "
+                         f"the fast memory of {self.target} has {self.fast_memory} bytes.")
+            fits = False
+        return fits
+
+    def _GetJobCount(self):
+        """Get the number of parallel compile jobs."""
+        jobs = self._GetToolchainOption("Jobs", 0)
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+        return jobs
+
+    def _GetCompilerVersion(self):
+        """Get the version string of the compiler, it is part of the object cache key."""
+        if self.compiler_version is None:
+            status, outdata, _ = ProcessLogger(
+                self.CTRInstance.logger,
+                f"{self.compiler} --version",
+                no_stdout=True, no_stderr=True
+            ).spin()
+            self.compiler_version = outdata if not status else ""
+        return self.compiler_version
+
+    def _GetObjectCache(self):
+        """Get the object cache shared by all projects, or None if it is disabled."""
+        if not self._GetToolchainOption("ObjectCache", False):
+            return None
+        return ObjectCache(max_size=self._GetToolchainOption("ObjectCacheSize", 1024) * 1024 * 1024)
+
+    def _GetObjectCacheKey(self, CFile, obj_file, IncFlags, CFLAGS):
+        """Get the object cache key of a C file from its preprocessed source, or None on error."""
+        pre_file = f"{obj_file}.i"
+        status, _, _ = ProcessLogger(
+            self.CTRInstance.logger,
+            f"{self.compiler} -E -P {IncFlags} {CFile} -o {pre_file} {CFLAGS}",
+            no_stdout=True, no_stderr=True
+        ).spin()
+        try:
+            if status:
+                return None
+            # local symbols are renamed after the object name, see _CompileObject
+            return ObjectCache.key(("file", pre_file), CFLAGS, self._GetCompilerVersion(),
+                                   ("file", self.udynlink_utils),
+                                   get_object_name(obj_file, self.buildpath))
+        finally:
+            try:
+                os.remove(pre_file)
+            except OSError:
+                pass
+
+    def _TimeCommand(self, command):
+        """Run a command without output, returns its duration in seconds or None on error."""
+        start = time.monotonic()
+        status, _, _ = ProcessLogger(
+            self.CTRInstance.logger, command,
+            no_stdout=True, no_stderr=True
+        ).spin()
+        return None if status else time.monotonic() - start
+
+    def _GetPrecompiledHeader(self, IncFlags, CFLAGS):
+        """Get the directory of the precompiled matiec runtime header and the compile time it
+        saves per unit, (None, 0) if it is disabled or can't be built. It is built once per
+        compiler, flags and content of the matiec headers and kept next to the object cache;
+        GCC needs the header next to its .gch, so both are in the directory."""
+        if not self._GetToolchainOption("PrecompiledHeader", True):
+            return None, 0
+        headers = sorted(glob.glob(os.path.join(self.matiec_inc_path, "*.h")))
+        key = ObjectCache.key(self._GetCompilerVersion(), IncFlags, CFLAGS, *[("file", h) for h in headers])
+        pch_root = default_pch_dir()
+        pch_path = os.path.join(pch_root, key[:32])
+        saved_file = os.path.join(pch_path, "saved")
+        try:
+            with open(saved_file, "r", encoding="utf-8") as file:
+                saved = float(file.read())
+            os.utime(pch_path)
+            return pch_path, saved
+        except (IOError, ValueError):
+            pass
+
+        header = os.path.join(pch_path, _pch_header)
+        probe = os.path.join(self.buildpath, "pch_probe.c")
+        try:
+            os.makedirs(pch_path, exist_ok=True)
+            shutil.copyfile(os.path.join(self.matiec_inc_path, _pch_header), header)
+            duration = self._TimeCommand(
+                f"{self.compiler} -x c-header {IncFlags} {header} -o {header}.gch.tmp {CFLAGS}")
+            if duration is None:
+                raise IOError(f"compilation of {_pch_header} failed")
+            os.replace(f"{header}.gch.tmp", f"{header}.gch")
+            # the saving per unit: a unit with only the header, compiled without and with it
+            with open(probe, "w", encoding="utf-8") as file:
+                file.write(f'#include "{_pch_header}"\n')
+            without = self._TimeCommand(f"{self.compiler} {IncFlags} {probe} -o {probe}.o {CFLAGS}")
+            with_pch = self._TimeCommand(f"{self.compiler} -I {pch_path} {IncFlags} {probe} -o {probe}.o {CFLAGS}")
+            saved = max(0.0, without - with_pch) if without is not None and with_pch is not None else 0.0
+            with open(saved_file, "w", encoding="utf-8") as file:
+                file.write(f"{saved:.3f}")
+        except (IOError, OSError) as e:
+            self.log(f"   [PCH]  {_pch_header} not precompiled ({e}), compiling without")
+            shutil.rmtree(pch_path, ignore_errors=True)
+            return None, 0
+        finally:
+            for file_path in (probe, f"{probe}.o"):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+        self.log(f"   [PCH]  {_pch_header} -> {header}.gch ({duration:.2f}s)")
+
+        # drop the least recently used precompiled headers
+        others = sorted((entry for entry in glob.glob(os.path.join(pch_root, "*")) if os.path.isdir(entry)),
+                        key=os.path.getmtime, reverse=True)
+        for entry in others[_pch_keep:]:
+            shutil.rmtree(entry, ignore_errors=True)
+        return pch_path, saved
+
+    def _UsesPrecompiledHeader(self, CFile, file_cache):
+        """Tell if the first include of CFile is the precompiled header (GCC only uses it there)."""
+        includes = file_cache.get(CFile, ("", []))[1]
+        return bool(includes) and os.path.basename(includes[0]) == _pch_header
+
     def SetBuildPath(self, buildpath):
         """Set the build path."""
         if self.buildpath != buildpath:
@@ -110,14 +551,148 @@ class toolchain_b4arm(object):
             self.md5key = None
             self.srcmd5 = {}
 
+    def _CompileObject(self, CFile, obj_file, IncFlags, CFLAGS):
+        """Compile a C file and rename the local symbols of the resulting object.
+        Returns a tuple (error message or None, list of (write function, text) log entries)."""
+        logger = self.CTRInstance.logger
+        c_file = os.path.basename(CFile)
+        obj_name = os.path.basename(obj_file)
+
+        cache_key = None
+        if self.objcache is not None:
+            cache_key = self._GetObjectCacheKey(CFile, obj_file, IncFlags, CFLAGS)
+            if cache_key is not None and self.objcache.get(cache_key, obj_file):
+                return None, [(logger.write, f"   [CACHE]  {c_file} -> {obj_name}\n")]
+
+        output = [(logger.write, f"   [CC]  {c_file} -> {obj_name}\n")]
+
+        status, outdata, errdata = ProcessLogger(
+            logger,
+            f"{self.compiler} {IncFlags} {CFile} -o {obj_file} {CFLAGS}",
+            no_stdout=True, no_stderr=True
+        ).spin()
+        if outdata:
+            output.append((logger.write, outdata))
+        if errdata:
+            output.append((logger.write_warning, errdata))
+        if status:
+            return f"C compilation of {c_file} failed.", output
+
+        # renamed symbols only contain the object name and its path in the build directory,
+        # they don't depend on the build path
+        try:
+            rename_local_symbols(obj_file, get_object_name(obj_file, self.buildpath), self.objcopy)
+        except Exception as e:
+            output.append((logger.write_warning, f"{e}\n"))
+            return f"Symbol rename of {c_file} failed.", output
+
+        if cache_key is not None:
+            self.objcache.put(cache_key, obj_file)
+        return None, output
+
+    def _CompileObjects(self, compile_jobs, IncFlags, CFLAGS):
+        """Compile all (CFile, obj_file, srcmd5) jobs in parallel, up to the configured job count.
+        The log output of every job is written at once when it has finished, pending jobs
+        are cancelled as soon as one job failed. The source hash of every successfully
+        compiled object is recorded in self.srcmd5."""
+        if not compile_jobs:
+            return True
+
+        jobs = min(self._GetJobCount(), len(compile_jobs))
+        self.log(f"   [JOBS] {len(compile_jobs)} files, {jobs} parallel jobs")
+        abort = Event()
+
+        def job(CFile, obj_file, _srcmd5):
+            if abort.is_set():
+                return None, []
+            result = self._CompileObject(CFile, obj_file, IncFlags, CFLAGS)
+            if result[0]:
+                abort.set()
+            return result
+
+        failed = False
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(job, *compile_job): compile_job for compile_job in compile_jobs}
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                error_msg, output = future.result()
+                for write, text in output:
+                    write(text)
+                _CFile, obj_file, srcmd5 = futures[future]
+                if output and not error_msg:
+                    self.srcmd5[self._GetObjectKey(obj_file)] = srcmd5
+                if error_msg:
+                    self.log_err(error_msg)
+                    if not failed:
+                        failed = True
+                        for pending in futures:
+                            pending.cancel()
+        return not failed
+
+    def _GetCompileJobs(self, CFiles, IncFlags, CFLAGS, previous_srcmd5, file_cache):
+        """Get the object names and files of the C files, and the compile jobs of the ones
+        changed since the last build."""
+        obj_names, obj_files, compile_jobs = [], [], []
+        for CFile in CFiles:
+            c_file = os.path.basename(CFile)
+            obj_name = f"{os.path.splitext(c_file)[0]}.o"
+            obj_file = f"{os.path.splitext(CFile)[0]}.o"
+            obj_key = self._GetObjectKey(obj_file)
+            srcmd5 = self._GetSourceMD5(CFile, f"{IncFlags} {CFLAGS}", file_cache)
+            if os.path.exists(obj_file) and previous_srcmd5.get(obj_key) == srcmd5:
+                self.log(f"   [pass]  {c_file} -> {obj_name}")
+                self.srcmd5[obj_key] = srcmd5
+            else:
+                compile_jobs.append((CFile, obj_file, srcmd5))
+            obj_names.append(obj_name)
+            obj_files.append(obj_file)
+        return obj_names, obj_files, compile_jobs
+
+    def _CompileUnits(self, compile_jobs, IncFlags, CFLAGS, file_cache):
+        """Compile the jobs with the precompiled header and the object cache when available.
+        Returns False if a file failed."""
+        CompileIncFlags = IncFlags
+        if compile_jobs:
+            pch_path, pch_saved = self._GetPrecompiledHeader(IncFlags, CFLAGS)
+            if pch_path is not None:
+                # searched before the matiec headers, the source hashes don't depend on it
+                CompileIncFlags = f"-I {pch_path} {IncFlags}"
+                units = sum(1 for CFile, _obj_file, _srcmd5 in compile_jobs
+                            if self._UsesPrecompiledHeader(CFile, file_cache))
+                self.log(f"   [PCH]  used by {units} of {len(compile_jobs)} files, "
+                         f"about {units * pch_saved:.1f}s saved")
+        compiled = self._CompileObjects(compile_jobs, CompileIncFlags, CFLAGS)
+        if self.objcache is not None and compile_jobs:
+            _, cache_size = self.objcache.prune()
+            self.log(f"   [CACHE] hits: {self.objcache.hits}, misses: {self.objcache.misses}, "
+                     f"cache size: {cache_size // 1024} KB")
+        return compiled
+
     def build(self):
         """Compile and link the project to generate the binary file."""
         # Compiler and linker flags defined for building
         Builder_CFLAGS = '-c -g0 -O3 -fPIE -msingle-pic-base -mpic-register=r9 -fomit-frame-pointer -mno-pic-data-is-text-relative -mlong-calls -mthumb -mpoke-function-name'
         ALLldflags = f'-gdwarf-4 -nostartfiles -nodefaultlibs -nostdlib -Wl,--unresolved-symbols=ignore-in-object-files -Wl,--emit-relocs -Wl,-e,0 -T{self.ld_script}'
         IncFlags = f'-I {self.matiec_inc_path} -Wno-unused-function'
+        MkmoduleFlags = '--no-debug --compress' if self._GetToolchainOption("Compression", False) else '--no-debug'
+        if self._GetToolchainOption("FixedLoad", False):
+            # no PIC: globals are addressed directly and calls are short BL, mkmodule turns the
+            # absolute relocations (literal words only, no MOVW/MOVT) into load-time fixups
+            Builder_CFLAGS = '-c -g0 -O3 -mword-relocations -fomit-frame-pointer -mthumb -mpoke-function-name'
+            MkmoduleFlags += ' --fixed-load'
+        GCSections = self._GetToolchainOption("GCSections", False)
+        if GCSections:
+            # one section per function and variable, the linker drops the unused ones
+            Builder_CFLAGS += ' -ffunction-sections -fdata-sections'
+        FloatFlags = self._GetFloatFlags()
+        if FloatFlags:
+            Builder_CFLAGS += f' {FloatFlags}'
+            ALLldflags += f' {FloatFlags}'
+            MkmoduleFlags += f' --float-abi {self._GetToolchainOption("FloatABI", "soft")}'
 
         # generate PLC C Code
+        self.cycle_profile = self._GetCycleProfile()
         self.Generate_plc_main()
         self.Generate_plc_debugger()
 
@@ -129,10 +704,14 @@ class toolchain_b4arm(object):
             self.log_err(f"Error copying 'beremiz.h': {e}")
             return False
 
-        obj_names = []
-        obj_files = []
+        incremental = self._GetToolchainOption("Incremental", True)
+        previous_srcmd5 = self._LoadSrcMD5() if incremental else {}
+        self.srcmd5 = {}
+        file_cache = {}
+
         relink = not os.path.exists(self.plc_path)
 
+        sources = []
         for Location, CFilesAndCFLAGS, _DoCalls in self.CTRInstance.LocationCFilesAndCFLAGS:
             # dont compile code for Locations
             if not Location and CFilesAndCFLAGS:
@@ -142,36 +721,68 @@ class toolchain_b4arm(object):
                     location_name = "plc code"
 
                 self.log(f"\nCompiling PLCcode for: {Location}")
+                sources.extend(CFile for CFile, CFlags in CFilesAndCFLAGS if CFile.endswith(".c"))
+
+        if self.cycle_profile:
+            sources = self._AddCycleProfile(sources)
+            if sources is None:
+                return False
+        elif os.path.exists(self.plc_path + PROFILE_SUFFIX):
+            os.remove(self.plc_path + PROFILE_SUFFIX)
+
+        # unity build: all sources in one translation unit, separate files if it failed before
+        unity = self._GetToolchainOption("UnityBuild", False) and not self.unity_failed
+        if unity:
+            CFiles = [self._WriteUnitySource(sources)]
+            self.log(f"   [UNITY]  {len(sources)} files -> {os.path.basename(CFiles[0])}")
+        else:
+            CFiles = [CFile for SourceFile in sources for CFile in self._GetTranslationUnits(SourceFile)]
+
+        hot_data = self._GetHotData(sources)
+        if hot_data and '-fdata-sections' not in Builder_CFLAGS:
+            # one section per variable, the hot ones are moved to the fast data when linking
+            Builder_CFLAGS += ' -fdata-sections'
 
-                for CFile, CFlags in CFilesAndCFLAGS:
-                    if CFile.endswith(".c"):
-                        c_file = os.path.basename(CFile)
-                        obj_name = f"{os.path.splitext(c_file)[0]}.o"
-                        obj_file = f"{os.path.splitext(CFile)[0]}.o"
-                        relink = True
-                        self.log(f"   [CC]  {c_file} -> {obj_name}")
-
-                        status, _, _ = ProcessLogger(
-                            self.CTRInstance.logger,
-                            f"{self.compiler} {IncFlags} {CFile} -o {obj_file} {Builder_CFLAGS}"
-                        ).spin()
-                        if status:
-                            self.log_err(f"C compilation of {c_file} failed.")
-                            return False
-
-                        status, _, _ = ProcessLogger(
-                            None,
-                            f"{self.rensym} {obj_file}"
-                        ).spin()
-                        if status:
-                            self.log_err(f"Symbol rename of {c_file} failed.")
-                            return False
-
-                        obj_names.append(obj_name)
-                        obj_files.append(obj_file)
+        self.objcache = self._GetObjectCache()
+        obj_names, obj_files, compile_jobs = self._GetCompileJobs(CFiles, IncFlags, Builder_CFLAGS,
+                                                                  previous_srcmd5, file_cache)
+        compiled = self._CompileUnits(compile_jobs, IncFlags, Builder_CFLAGS, file_cache)
+        if not compiled and unity:
+            # e.g. static symbols or macros of two files clash in one unit
+            self.log("Unity build failed, compiling the files separately")
+            self.unity_failed = True
+            unity = False
+            CFiles = [CFile for SourceFile in sources for CFile in self._GetTranslationUnits(SourceFile)]
+            obj_names, obj_files, compile_jobs = self._GetCompileJobs(CFiles, IncFlags, Builder_CFLAGS,
+                                                                      previous_srcmd5, file_cache)
+            compiled = self._CompileUnits(compile_jobs, IncFlags, Builder_CFLAGS, file_cache)
+        if not compiled:
+            if incremental:
+                self._SaveSrcMD5()
+            return False
+
+        if GCSections:
+            ALLldflags += ' -Wl,--gc-sections' + ''.join(f' -Wl,-u,{root}' for root in self._GetLinkRoots(obj_files))
+
+        # link again when objects were compiled, or the list of objects, link or module options changed
+        link_options = f"{ALLldflags} {MkmoduleFlags}"
+        if hot_data:
+            link_options += f" HotData={','.join(sorted(set().union(*hot_data.values())))}"
+        linkmd5 = hashlib.md5(link_options.encode())
+        for obj_key in map(self._GetObjectKey, obj_files):
+            linkmd5.update(f"{obj_key}:{self.srcmd5[obj_key]}\n".encode())
+        linkmd5 = linkmd5.hexdigest()
+        relink = relink or bool(compile_jobs) or previous_srcmd5.get(self.elf_file) != linkmd5
+        if not relink:
+            self.srcmd5[self.elf_file] = linkmd5
+        if incremental:
+            self._SaveSrcMD5()
 
         if relink:
-            listobjstring = ' '.join(obj_files)
+            link_files = self._PlaceHotData(obj_files, hot_data) if hot_data else obj_files
+            if link_files is None:
+                return False
+            listobjstring = ' '.join(link_files)
             self.log(f"\nLinking:   [LD]  {' '.join(obj_names)} -> {self.elf_file}")
             status, _, _ = ProcessLogger(
                 self.CTRInstance.logger,
@@ -180,27 +791,45 @@ class toolchain_b4arm(object):
             if status:
                 self.log_err(f"Linking of {self.elf_file} failed.")
                 return False
+            exported = set(get_exported_symbols(self.elf_path))
+            missing = [name for name in self._GetModuleExports() if name not in exported]
+            if missing:
+                self.log_err(f"{self.elf_file} doesn't export {', '.join(missing)}, needed by the RTE.")
+                return False
 
             self.log("\nGenerating PLC File:")
             self.log(f"   [UD]  {self.elf_file} -> {self.plc_file}")
             status, _, _ = ProcessLogger(
                 self.CTRInstance.logger,
-                f"{self.mkmodule} --no-debug --bin-name {self.plc_path} {self.elf_path}"
+                f"{self.mkmodule} {MkmoduleFlags} --bin-name {self.plc_path} {self.elf_path}"
             ).spin()
             if status:
                 return False
             else:
                 self.log(f"Output file: {self.plc_file}")
+                self._LogModuleSize("unity" if unity else "separate")
+                self._LogSizeReport(obj_files, sources)
+
+            if incremental:
+                self.srcmd5[self.elf_file] = linkmd5
+                self._SaveSrcMD5()
 
         else:
             self.log(f"   [pass]  {' '.join(obj_names)} -> {self.bin}")
 
-        for file_type in ('*.o', '*.elf'):
-            for file_path in glob.glob(os.path.join(self.buildpath, file_type)):
-                try:
-                    os.remove(file_path)
-                except Exception as _e:
-                    pass
+        if not self._CheckSizeBudget():
+            self.md5key = None
+            self.ResetBinaryMD5()
+            return False
+
+        # objects are kept for the next incremental build
+        if not incremental:
+            for file_type in ('*.o', '*.elf'):
+                for file_path in glob.glob(os.path.join(self.buildpath, file_type)):
+                    try:
+                        os.remove(file_path)
+                    except Exception as _e:
+                        pass
 
         self.md5key = hashlib.md5(open(self.plc_path, "rb").read()).hexdigest()
         self.log(f"\nCalculated MD5 for {self.plc_file} is {self.md5key}")
@@ -209,4 +838,8 @@ class toolchain_b4arm(object):
             f.write(self.md5key)
         self.log(f"MD5 written to {md5_filename}")
 
+        # block hashes for the delta upload of the connector
+        manifest_filename = WriteBlockManifest(self.plc_path)
+        self.log(f"Block manifest written to {manifest_filename}")
+
         return True
\ No newline at end of file
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Reference implementations for the tests: the ELF helpers of udynlink_utils as they
+# were with pyelftools, the image fixtures are written by mkmodule before ElfImage.
+
+import os
+import sys
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
+from elftools.elf.relocation import RelocationSection
+from elftools.elf.descriptions import describe_reloc_type
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, "fixtures")
+SCRIPT_DIR = os.path.join(HERE, "..", "b4uc_targets", "__script")
+sys.path.insert(0, SCRIPT_DIR)
+
+
+# get_symbols_in_elf, get_relocations_in_elf and get_section_in_elf as they were
+# with pyelftools
+
+def baseline_symbols(obj):
+    syms = {}
+    with open(obj, "rb") as f:
+        elf = ELFFile(f)
+        for section in elf.iter_sections():
+            if not isinstance(section, SymbolTableSection):
+                continue
+            for symbol in section.iter_symbols():
+                sdata = {}
+                sdata["type"] = symbol['st_info']['type']
+                sdata["bind"] = symbol['st_info']['bind']
+                sdata["size"] = symbol['st_size']
+                sdata["visibility"] = symbol['st_other']['visibility']
+                sdata["section"] = symbol['st_shndx']
+                try:
+                    sdata["section"] = int(sdata["section"])
+                except:
+                    pass
+                sdata["value"] = int(symbol['st_value'])
+                syms[str(symbol.name)] = sdata
+    return syms
+
+def baseline_relocations(obj):
+    rels = []
+    with open(obj, "rb") as f:
+        elf = ELFFile(f)
+        for section in elf.iter_sections():
+            if not isinstance(section, RelocationSection):
+                continue
+            symtable = elf.get_section(section['sh_link'])
+            for rel in section.iter_relocations():
+                if rel['r_info_sym'] == 0:
+                    continue
+                rdata = {}
+                rdata["offset"] = int(rel['r_offset'])
+                rdata["info"] = rel['r_info']
+                rdata["type"] = describe_reloc_type(rel['r_info_type'], elf)
+                symbol = symtable.get_symbol(rel['r_info_sym'])
+                if symbol['st_name'] == 0:
+                    symsec = elf.get_section(symbol['st_shndx'])
+                    rdata["name"] = str(symsec.name)
+                else:
+                    rdata["name"] = str(symbol.name)
+                rdata["value"] = symbol["st_value"]
+                rdata["section"] = elf.get_section(section['sh_info']).name
+                rdata["defined"] = symbol['st_shndx'] != 'SHN_UNDEF'
+                rels.append(rdata)
+    return rels
+
+def baseline_sections(obj):
+    sects = []
+    with open(obj, "rb") as f:
+        elf = ELFFile(f)
+        for i, section in enumerate(elf.iter_sections()):
+            sects.append({"name": section.name, "index": i, "addr": int(section['sh_addr']),
+                          "offset": int(section['sh_offset']), "size": int(section['sh_size']),
+                          "data": section.data() if section['sh_type'] != 'SHT_NOBITS' else None})
+    return sects
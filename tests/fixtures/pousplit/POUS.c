@@ -0,0 +1,115 @@
+// FUNCTION
+REAL SCALE(
+  BOOL EN,
+  BOOL *__ENO,
+  REAL X,
+  REAL K)
+{
+  BOOL ENO = __BOOL_LITERAL(TRUE);
+  REAL SCALE = 0;
+
+  // Control execution
+  if (!EN) {
+    if (__ENO != NULL) {
+      *__ENO = __BOOL_LITERAL(FALSE);
+    }
+    return SCALE;
+  }
+  SCALE = (X * K);
+
+  goto __end;
+
+__end:
+  if (__ENO != NULL) {
+    *__ENO = ENO;
+  }
+  return SCALE;
+}
+
+
+static inline REAL __PIDX_SCALE1(BOOL EN,
+  REAL X,
+  PIDX *data__)
+{
+  REAL __res;
+  BOOL __TMP_ENO = __GET_VAR(data__->ENO,);
+  __res = SCALE(EN,
+    &__TMP_ENO,
+    X,
+    2.7);
+  __SET_VAR(,data__->ENO,,__TMP_ENO);
+  return __res;
+}
+
+void PIDX_init__(PIDX *data__, BOOL retain) {
+  __INIT_VAR(data__->EN,__BOOL_LITERAL(TRUE),retain)
+  __INIT_VAR(data__->ENO,__BOOL_LITERAL(TRUE),retain)
+  __INIT_VAR(data__->SP,0,retain)
+  __INIT_VAR(data__->PV,0,retain)
+  __INIT_VAR(data__->CV,0,retain)
+  __INIT_VAR(data__->ERR,0,retain)
+  __INIT_VAR(data__->MSG,__STRING_LITERAL(3,"{ }"),retain)
+}
+
+// Code part
+void PIDX_body__(PIDX *data__) {
+  // Control execution
+  if (!__GET_VAR(data__->EN)) {
+    __SET_VAR(data__->,ENO,,__BOOL_LITERAL(FALSE));
+    return;
+  }
+  else {
+    __SET_VAR(data__->,ENO,,__BOOL_LITERAL(TRUE));
+  }
+  // Initialise TEMP variables
+
+  __SET_VAR(data__->,ERR,,(__GET_VAR(data__->SP,) - __GET_VAR(data__->PV,)));
+  __SET_VAR(data__->,CV,,__PIDX_SCALE1((BOOL)__BOOL_LITERAL(TRUE),(REAL)__GET_VAR(data__->ERR,),data__));
+
+  goto __end;
+
+__end:
+  return;
+} // PIDX_body__() 
+
+
+
+
+
+static inline REAL __PROGRAM0_SCALE1(BOOL EN,
+  REAL X,
+  PROGRAM0 *data__)
+{
+  REAL __res;
+  BOOL __TMP_ENO = __BOOL_LITERAL(TRUE);
+  __res = SCALE(EN,
+    &__TMP_ENO,
+    X,
+    3.0);
+  return __res;
+}
+
+void PROGRAM0_init__(PROGRAM0 *data__, BOOL retain) {
+  __INIT_VAR(data__->A,0,retain)
+  __INIT_VAR(data__->B,0,retain)
+  PIDX_init__(&data__->PID0,retain);
+}
+
+// Code part
+void PROGRAM0_body__(PROGRAM0 *data__) {
+  // Initialise TEMP variables
+
+  __SET_VAR(data__->PID0.,SP,,__GET_VAR(data__->A,));
+  PIDX_body__(&data__->PID0);
+  __SET_VAR(data__->,B,,__PROGRAM0_SCALE1((BOOL)__BOOL_LITERAL(TRUE),(REAL)__GET_VAR(data__->PID0.CV,),data__));
+
+  goto __end;
+
+__end:
+  return;
+} // PROGRAM0_body__() 
+
+
+
+
+
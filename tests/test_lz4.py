@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# LZ4 block codec of udynlink_utils (compressed module images): round trips through its own
+# decoder and the reference LZ4 decoder, matches never reach further back than the window.
+
+import os
+import random
+
+import pytest
+
+from baseline import FIXTURES
+
+import udynlink_utils
+from udynlink_utils import lz4_compress, lz4_decompress, LZ4_MAX_WINDOW
+
+
+def match_offsets(block):
+    """Offsets of the matches of an LZ4 block."""
+    offsets, pos = [], 0
+    while True:
+        token = block[pos]
+        pos += 1
+        lit_len, pos = udynlink_utils._lz4_read_length(block, pos, token >> 4)
+        pos += lit_len
+        if pos >= len(block):
+            return offsets
+        offsets.append(block[pos] | (block[pos + 1] << 8))
+        _match_len, pos = udynlink_utils._lz4_read_length(block, pos + 2, token & 15)
+
+
+def sample_data():
+    rnd = random.Random(1)
+    noise = bytes(rnd.getrandbits(8) for _ in range(4096))
+    with open(os.path.join(FIXTURES, "s50.elf"), "rb") as f:
+        elf = f.read()
+    return {
+        "empty": b"",
+        "short": b"abc",
+        "below_mf_limit": b"abcdabcdabc",
+        "incompressible": noise,
+        "run": b"\0" * 5000,  # one match overlapping its own output
+        "long_literals": noise[:300] + b"x" * 300,
+        "text": b"PROGRAM0_body__ PIDX_body__ SCALE " * 200,
+        "elf": elf,
+    }
+
+SAMPLES = sample_data()
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_round_trip(name):
+    data = SAMPLES[name]
+    block = lz4_compress(data)
+    assert lz4_decompress(block, len(data)) == data
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_reference_decoder(name):
+    lz4_block = pytest.importorskip("lz4.block")
+    data = SAMPLES[name]
+    block = lz4_compress(data)
+    assert lz4_block.decompress(block, uncompressed_size = len(data)) == data
+
+
+def test_empty():
+    assert lz4_compress(b"") == b"\0"
+    assert lz4_decompress(b"\0", 0) == b""
+
+
+def test_incompressible():
+    data = SAMPLES["incompressible"]
+    block = lz4_compress(data)
+    # one literal run: token, length bytes and the data
+    assert match_offsets(block) == []
+    assert len(block) == 1 + (len(data) - 15) // 255 + 1 + len(data)
+
+
+@pytest.mark.parametrize("window", [16, 64, 255, 4096])
+@pytest.mark.parametrize("period", [-1, 0, 1])
+def test_window_limit(window, period):
+    # a random block repeated at distance window - 1, window and window + 1
+    rnd = random.Random(window)
+    distance = window + period
+    block = bytes(rnd.getrandbits(8) for _ in range(distance))
+    data = block * 8 + bytes(rnd.getrandbits(8) for _ in range(32))
+    compressed = lz4_compress(data, window)
+    offsets = match_offsets(compressed)
+    assert all(offset <= window for offset in offsets)
+    # the repetition is used when it is within the window
+    assert (distance in offsets) == (distance <= window)
+    assert lz4_decompress(compressed, len(data)) == data
+
+
+def test_max_window():
+    data = SAMPLES["elf"] * 40
+    assert len(data) > LZ4_MAX_WINDOW
+    block = lz4_compress(data, LZ4_MAX_WINDOW + 1000)
+    assert max(match_offsets(block)) <= LZ4_MAX_WINDOW
+    assert lz4_decompress(block, len(data)) == data
+
+
+@pytest.mark.parametrize("block, size", [(b"\x40ab", 4), (b"\x10a\x05\x00", 5), (b"\0", 1)])
+def test_corrupted(block, size):
+    with pytest.raises(ValueError):
+        lz4_decompress(block, size)
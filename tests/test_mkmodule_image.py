@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# UDLM images of mkmodule (no compression, PIC, soft float): the image writer must give
+# the bytes of the former packer, which built the image with img += struct.pack(...),
+# and of the images written by mkmodule before (fixtures/<module>.udlm).
+
+import argparse
+import importlib.machinery
+import importlib.util
+import os
+import struct
+from zlib import crc32
+
+import pytest
+
+from baseline import FIXTURES, SCRIPT_DIR, baseline_symbols
+
+import udynlink_utils
+
+MODULES = ["small", "s50"]
+
+
+def load_mkmodule():
+    loader = importlib.machinery.SourceFileLoader("mkmodule", os.path.join(SCRIPT_DIR, "mkmodule"))
+    spec = importlib.util.spec_from_loader("mkmodule", loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+mkmodule = load_mkmodule()
+
+
+def build_args(name, bin_name):
+    return argparse.Namespace(name = name, bin_name = bin_name, compress = False, compress_window = 4096,
+                              fixed_load = False, float_abi = "soft", no_debug = True, no_verbose = True)
+
+
+# Image and CRC as the former packer wrote them, from the inputs of build_image
+def baseline_image(symbols_list, img_relocs, lot_entries, code_sect, data_sect, bss_sect,
+                   syms, sym_map, sect_idx_mapping):
+    img = struct.pack("<H", lot_entries)
+    img += struct.pack("<H", len(img_relocs))
+    symt_len = len(symbols_list) * 8 + 4
+    for i, s in enumerate(symbols_list):
+        if i == 0 or sym_map[s] != "local":
+            symt_len += len(s) + 1
+    symt_len = udynlink_utils.round_to(symt_len, 4)
+    img += struct.pack("<I", symt_len)
+    img += struct.pack("<I", len(code_sect))
+    img += struct.pack("<I", len(data_sect))
+    img += struct.pack("<I", len(bss_sect))
+    for offset, value in img_relocs:
+        img += struct.pack("<II", offset, value)
+    off = len(symbols_list) * 8 + 4
+    img += struct.pack("<I", len(symbols_list))
+    for i, s in enumerate(symbols_list):
+        if i > 0:
+            defined_in_code = sect_idx_mapping[syms[s]["section"]] == mkmodule.sectname_code
+            type_data = {"local": 0, "exported": 1}.get(sym_map[s], 2)
+            type_data |= 4 if defined_in_code else 0
+            val_offset = 0 if (sym_map[s] == "external" or defined_in_code) else len(code_sect)
+            val = syms[s]["value"] - val_offset
+            s_off = (off if sym_map[s] != "local" else 0) | (type_data << 28)
+        else:
+            val, s_off = 0, (3 << 28) | off
+        img += struct.pack("<II", s_off, val)
+        if i == 0 or sym_map[s] != "local":
+            off = off + len(s) + 1
+    for i, s in enumerate(symbols_list):
+        if i == 0 or sym_map[s] != "local":
+            img += (s + '\0').encode('utf-8')
+    if len(img) % 4 > 0:
+        img += ('\0' * (4 - len(img) % 4)).encode('utf-8')
+    img = img + code_sect + data_sect
+    crc = crc32(img)
+    return b"UDLM" + crc.to_bytes(4, byteorder='little') + img, crc
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_image_matches_baseline_packer(name, tmp_path, monkeypatch):
+    elf = os.path.join(FIXTURES, name + ".elf")
+    calls = []
+
+    def build_image(*args, **kwargs):
+        calls.append(args)
+        return build_image.original(*args, **kwargs)
+    build_image.original = mkmodule.build_image
+    monkeypatch.setattr(mkmodule, "build_image", build_image)
+
+    bin_name = str(tmp_path / (name + ".bin"))
+    mkmodule.process(elf, build_args(name, bin_name))
+    with open(bin_name, "rb") as f:
+        image = f.read()
+
+    assert len(calls) == 1
+    (symbols_list, img_relocs, lot_entries, code_sect, data_sect, bss_sect,
+     _symtab, sym_map, sect_idx_mapping, data_base) = calls[0]
+    assert data_base == len(code_sect)
+    # the former packer looked sections up with the section names of pyelftools
+    sections = dict((k, v) for k, v in sect_idx_mapping.items() if k != udynlink_utils.SHN_UNDEF)
+    sections["SHN_UNDEF"] = None
+    expected, crc = baseline_image(symbols_list, img_relocs, lot_entries, code_sect, data_sect, bss_sect,
+                                   baseline_symbols(elf), sym_map, sections)
+
+    assert image[:4] == udynlink_utils.UDLM_SIGN
+    assert int.from_bytes(image[4:8], "little") == crc == crc32(image[8:])
+    assert image == expected
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_image_matches_fixture(name, tmp_path):
+    bin_name = str(tmp_path / (name + ".bin"))
+    mkmodule.process(os.path.join(FIXTURES, name + ".elf"), build_args(name, bin_name))
+    with open(bin_name, "rb") as f:
+        image = f.read()
+    with open(os.path.join(FIXTURES, name + ".udlm"), "rb") as f:
+        expected = f.read()
+    assert image[4:8] == expected[4:8]
+    assert image == expected
+
+
+@pytest.mark.parametrize("name", MODULES)
+def test_exported_symbols(name, tmp_path, monkeypatch):
+    # the toolchain checks the module exports of the target with get_exported_symbols
+    elf = os.path.join(FIXTURES, name + ".elf")
+    calls = []
+
+    def build_image(*args, **kwargs):
+        calls.append(args)
+        return build_image.original(*args, **kwargs)
+    build_image.original = mkmodule.build_image
+    monkeypatch.setattr(mkmodule, "build_image", build_image)
+
+    mkmodule.process(elf, build_args(name, str(tmp_path / (name + ".bin"))))
+    symbols_list, sym_map = calls[0][0], calls[0][7]
+    exported = [s for s in symbols_list[1:] if sym_map[s] == "exported"]
+    assert exported
+    assert exported == udynlink_utils.get_exported_symbols(elf)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# POU split of pousplit on a resource written by matiec (fixtures/pousplit): every
+# function of POUS.c is defined in exactly one unit, the unit of its POU, and the
+# resource and the units compiled instead of it keep all the code.
+
+import os
+import re
+import shutil
+
+import pytest
+
+from baseline import FIXTURES
+
+from pousplit import write_pou_units
+
+SPLIT_FIXTURES = os.path.join(FIXTURES, "pousplit")
+POUS = {"SCALE": ["SCALE"], "PIDX": ["PIDX_init__", "PIDX_body__", "__PIDX_SCALE1"],
+        "PROGRAM0": ["PROGRAM0_init__", "PROGRAM0_body__", "__PROGRAM0_SCALE1"]}
+
+_definition_re = re.compile(r'^(?:static\s+)?(?:inline\s+)?\w+\s+\*?(\w+)\s*\(', re.MULTILINE)
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def resource(tmp_path):
+    for name in os.listdir(SPLIT_FIXTURES):
+        shutil.copy(os.path.join(SPLIT_FIXTURES, name), tmp_path)
+    return str(tmp_path / "Res0.c")
+
+
+def test_units(resource):
+    path = os.path.dirname(resource)
+    c_files = write_pou_units(resource)
+    assert c_files == [os.path.join(path, "Res0_split.c")] + \
+        [os.path.join(path, f"POUS_{pou}.c") for pou in POUS]
+
+    pous_code = read(os.path.join(path, "POUS.c"))
+    assert sorted(_definition_re.findall(pous_code)) == sorted(sum(POUS.values(), []))
+    definitions = {}
+    for pou in POUS:
+        unit = read(os.path.join(path, f"POUS_{pou}.c"))
+        # the units start like the resource, for the precompiled header
+        assert unit.startswith(read(resource)[:read(resource).index('#include "POUS.c"')])
+        for name in _definition_re.findall(unit):
+            definitions.setdefault(name, []).append(pou)
+    # each function once, in the unit of its POU
+    assert definitions == {name: [pou] for pou, names in POUS.items() for name in names}
+
+
+def test_resource(resource):
+    resource_code = read(resource)
+    c_files = write_pou_units(resource)
+    split_code = read(c_files[0])
+    assert '#include "POUS.c"' not in split_code
+    assert split_code == resource_code.replace('#include "POUS.c"\n', "")
+    # the POU code is compiled through the units only
+    for c_file in c_files[1:]:
+        assert os.path.basename(c_file) not in split_code
+
+
+def test_unchanged_not_written(resource):
+    c_files = write_pou_units(resource)
+    mtimes = [os.stat(c_file).st_mtime_ns for c_file in c_files]
+    for c_file in c_files:
+        os.utime(c_file, ns=(0, 0))
+    assert write_pou_units(resource) == c_files
+    assert all(os.stat(c_file).st_mtime_ns == 0 for c_file in c_files)
+    assert all(mtimes)
+
+
+def rewrite(path, old, new):
+    code = read(path)
+    assert old in code
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(code.replace(old, new, 1))
+
+
+def test_no_pous_include(resource):
+    rewrite(resource, '#include "POUS.c"\n', "")
+    assert write_pou_units(resource) is None
+
+
+def test_directive_between_pous(resource):
+    rewrite(os.path.join(os.path.dirname(resource), "POUS.c"),
+            "static inline REAL __PIDX_SCALE1", "#define LATE 1\nstatic inline REAL __PIDX_SCALE1")
+    assert write_pou_units(resource) is None
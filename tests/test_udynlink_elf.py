@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# ElfImage of udynlink_utils against the pyelftools helpers it replaces: symbols,
+# relocations and sections of the fixture modules must be the same.
+
+import os
+
+import pytest
+
+from baseline import FIXTURES, baseline_symbols, baseline_relocations, baseline_sections
+
+import udynlink_utils
+from udynlink_utils import ElfImage
+
+ELF_FIXTURES = [os.path.join(FIXTURES, name) for name in ("small.elf", "s50.elf", "fixed.elf", "fast.elf")]
+
+
+@pytest.mark.parametrize("path", ELF_FIXTURES, ids=os.path.basename)
+def test_symbols(path):
+    expected = baseline_symbols(path)
+    with ElfImage(path) as elf:
+        assert elf.symbols == expected
+        assert list(elf.symbols) == list(expected)
+        symtab = elf.symtab
+        assert list(symtab.index) == list(expected)
+        for name, i in symtab.index.items():
+            assert symtab.value[i] == expected[name]["value"]
+            assert symtab.type_name(i) == expected[name]["type"]
+            assert (symtab.shndx[i] == udynlink_utils.SHN_UNDEF) == (expected[name]["section"] == "SHN_UNDEF")
+            assert (symtab.info[i] >> 4 == udynlink_utils.STB_GLOBAL) == (expected[name]["bind"] == "STB_GLOBAL")
+    assert udynlink_utils.get_symbols_in_elf(path) == expected
+
+
+@pytest.mark.parametrize("path", ELF_FIXTURES, ids=os.path.basename)
+def test_relocations(path):
+    expected = baseline_relocations(path)
+    assert expected
+    with ElfImage(path) as elf:
+        assert list(elf.iter_relocations()) == expected
+        entries = [{"offset": offset, "type": elf.reloc_type_name(t), "name": name, "value": value,
+                    "section": section, "defined": defined}
+                   for offset, t, name, value, section, defined in elf.iter_relocation_entries()]
+    assert entries == [{k: v for k, v in r.items() if k != "info"} for r in expected]
+    assert udynlink_utils.get_relocations_in_elf(path) == expected
+
+
+@pytest.mark.parametrize("path", ELF_FIXTURES, ids=os.path.basename)
+def test_sections(path):
+    expected = baseline_sections(path)
+    with ElfImage(path) as elf:
+        assert [s.name for s in elf.sections] == [s["name"] for s in expected]
+        for section in expected:
+            if not section["name"]:
+                continue
+            sect = udynlink_utils.get_section_in_elf(elf, section["name"])
+            assert (sect["index"], sect["addr"], sect["offset"], sect["size"]) == \
+                (section["index"], section["addr"], section["offset"], section["size"])
+            if section["data"] is not None:
+                assert sect["data"].tobytes() == section["data"]
+            sect = None